@@ -33,11 +33,63 @@ app.secret_key = os.getenv('SECRET_KEY', 'crypto-trading-webapp-secret-key-2024'
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///crypto_trading.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# System log write-behind settings
+app.config['SYSTEM_LOG_QUEUE_SIZE'] = int(os.getenv('SYSTEM_LOG_QUEUE_SIZE', 10000))
+app.config['SYSTEM_LOG_BATCH_SIZE'] = int(os.getenv('SYSTEM_LOG_BATCH_SIZE', 500))
+app.config['SYSTEM_LOG_FLUSH_INTERVAL_MS'] = int(os.getenv('SYSTEM_LOG_FLUSH_INTERVAL_MS', 500))
+app.config['SYSTEM_LOG_OVERFLOW_POLICY'] = os.getenv('SYSTEM_LOG_OVERFLOW_POLICY', 'drop_oldest')
+
+# Requests running more SQL statements than this are logged
+app.config['SQL_QUERY_WARN_THRESHOLD'] = int(os.getenv('SQL_QUERY_WARN_THRESHOLD', 50))
+
+# Dashboard API response cache (entries also expire when data changes)
+app.config['RESPONSE_CACHE_MAX_ENTRIES'] = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 256))
+app.config['RESPONSE_CACHE_MAX_AGE'] = int(os.getenv('RESPONSE_CACHE_MAX_AGE', 300))
+
+# Live dashboard updates over Server-Sent Events
+app.config['EVENT_STREAM_BUFFER_SIZE'] = int(os.getenv('EVENT_STREAM_BUFFER_SIZE', 1000))
+app.config['EVENT_STREAM_HEARTBEAT_SECONDS'] = int(os.getenv('EVENT_STREAM_HEARTBEAT_SECONDS', 15))
+
+# History retention (days; 0 keeps everything)
+app.config['ANALYSIS_RAW_RETENTION_DAYS'] = int(os.getenv('ANALYSIS_RAW_RETENTION_DAYS', 7))
+app.config['ANALYSIS_HOURLY_RETENTION_DAYS'] = int(os.getenv('ANALYSIS_HOURLY_RETENTION_DAYS', 90))
+app.config['SYSTEM_LOG_RETENTION_DAYS'] = int(os.getenv('SYSTEM_LOG_RETENTION_DAYS', 30))
+app.config['RETENTION_BATCH_SIZE'] = int(os.getenv('RETENTION_BATCH_SIZE', 1000))
+app.config['RETENTION_BATCH_PAUSE_MS'] = int(os.getenv('RETENTION_BATCH_PAUSE_MS', 200))
+app.config['RETENTION_MAX_BATCHES'] = int(os.getenv('RETENTION_MAX_BATCHES', 100))
+app.config['RETENTION_INTERVAL_MINUTES'] = int(os.getenv('RETENTION_INTERVAL_MINUTES', 60))
+
+# Analytics engine (results also expire when data changes)
+app.config['ANALYTICS_STARTING_CAPITAL'] = float(os.getenv('ANALYTICS_STARTING_CAPITAL', 1000))
+app.config['ANALYTICS_CACHE_ENTRIES'] = int(os.getenv('ANALYTICS_CACHE_ENTRIES', 32))
+app.config['ANALYTICS_CACHE_MAX_AGE'] = int(os.getenv('ANALYTICS_CACHE_MAX_AGE', 300))
+app.config['ANALYTICS_SIGNAL_HORIZON_HOURS'] = float(os.getenv('ANALYTICS_SIGNAL_HORIZON_HOURS', 4))
+app.config['ANALYTICS_BENCHMARK_SYMBOL'] = os.getenv('ANALYTICS_BENCHMARK_SYMBOL', 'BTC_USDT')
+
 # Import models first
-from models import db, User, Coin, Trade, Order, Position, TechnicalAnalysis, TradingSettings, SystemLog
+from models import db, User, Coin, Trade, Order, Position, TechnicalAnalysis, LatestAnalysis, TradingSettings, SystemLog
+
+from services.db_profile import configure_engine_options, install_profile, check_settings
+from services.log_writer import system_log_writer
+from services.query_counter import request_query_counter
+from services.response_cache import response_cache
+from services.event_stream import event_broker
+from services.retention import retention_engine
+from services.analytics import analytics_engine
+from services.pnl_rollup import pnl_rollup
+from services.schema import ensure_indexes, ensure_not_null
 
 # Initialize extensions
+configure_engine_options(app)
 db.init_app(app)
+install_profile(app, db)
+request_query_counter.init_app(app, db)
+response_cache.init_app(app)
+event_broker.init_app(app)
+system_log_writer.init_app(app)
+retention_engine.init_app(app)
+analytics_engine.init_app(app)
+pnl_rollup.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'auth.login'
@@ -72,6 +124,12 @@ def initialize_database():
     """Initialize database with default data"""
     with app.app_context():
         db.create_all()
+        ensure_indexes()
+        ensure_not_null()
+        for problem in check_settings(db.engine, app.config['DB_PROFILE']):
+            logger.warning(f"Database setting mismatch: {problem}")
+        LatestAnalysis.backfill()
+        pnl_rollup.backfill()
         create_admin_user()
         logger.info("Database initialized successfully")
 
@@ -99,6 +157,13 @@ if __name__ == '__main__':
     initialize_database()
     register_blueprints()
     
+    # Write system logs in the background instead of committing on every call
+    system_log_writer.start()
+    
+    # Roll up and prune old history in the background
+    if os.getenv('RETENTION_ENABLED', 'true').lower() == 'true':
+        retention_engine.start()
+    
     # Start background monitoring threads
     from services.trading_monitor import TradingMonitor
     from services.tp_sl_monitor import TpSlMonitor
@@ -106,9 +171,27 @@ if __name__ == '__main__':
     trading_monitor = TradingMonitor()
     tp_sl_monitor = TpSlMonitor()
     
-    # Start monitoring in background threads
-    threading.Thread(target=trading_monitor.run, daemon=True).start()
-    threading.Thread(target=tp_sl_monitor.run, daemon=True).start()
+    # Run the monitors as coroutines on one shared event loop, or in their own threads
+    if os.getenv('MONITORS_ASYNC', 'false').lower() == 'true':
+        trading_monitor.start_async(app)
+        tp_sl_monitor.start_async(app)
+    else:
+        trading_monitor.start(app)
+        tp_sl_monitor.start(app)
+    
+    # Optional WebSocket market data; streamed ticks go into the shared price table
+    if os.getenv('MARKET_STREAM_ENABLED', 'false').lower() == 'true':
+        from services.market_stream import MarketStream
+        from models import get_active_coins
+        
+        with app.app_context():
+            symbols = [coin.symbol for coin in get_active_coins()]
+        market_stream = MarketStream(
+            instruments=symbols,
+            sandbox=tp_sl_monitor.exchange_api.sandbox,
+            price_table=tp_sl_monitor.exchange_api.price_table
+        )
+        market_stream.start()
     
     logger.info("Starting Crypto Trading Web Application")
     app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
@@ -0,0 +1,109 @@
+"""Benchmark concurrent SQLite writes with and without the tuned engine profile
+
+Usage:
+    python benchmarks/bench_db_writes.py [--writers 4] [--readers 4] [--duration 10]
+
+Mimics the monitors and request threads sharing one SQLite file: writer
+threads commit small transactions (a few system_logs rows each) while reader
+threads run the dashboard's recent-logs query. Each profile gets a fresh
+database file; the benchmark reports committed transactions per second,
+write latency percentiles, reads per second and "database is locked" errors.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import create_engine, insert, select, desc
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import db, SystemLog  # noqa: E402
+from services import db_profile  # noqa: E402
+
+
+def make_engine(path, profile):
+    uri = f"sqlite:///{path}"
+    engine = create_engine(uri, **db_profile.engine_options(uri, profile))
+    db_profile.install(engine, profile)
+    db.metadata.create_all(engine)
+    return engine
+
+
+def writer(engine, stop, rows_per_commit, latencies, errors):
+    table = SystemLog.__table__
+    while not stop.is_set():
+        rows = [{'timestamp': datetime.utcnow(), 'level': 'INFO', 'category': 'BENCH',
+                 'message': 'benchmark write'} for _ in range(rows_per_commit)]
+        started = time.perf_counter()
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(table), rows)
+            latencies.append((time.perf_counter() - started) * 1000)
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            errors.append(time.perf_counter() - started)
+
+
+def reader(engine, stop, counter):
+    table = SystemLog.__table__
+    query = select(table).order_by(desc(table.c.timestamp)).limit(20)
+    while not stop.is_set():
+        try:
+            with engine.connect() as connection:
+                connection.execute(query).fetchall()
+            counter.append(1)
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+
+
+def run(profile, args):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = make_engine(os.path.join(directory, 'bench.db'), profile)
+        settings = db_profile.effective_settings(engine)
+        
+        stop = threading.Event()
+        latencies, errors, reads = [], [], []
+        threads = [threading.Thread(target=writer, args=(engine, stop, args.rows, latencies, errors))
+                   for _ in range(args.writers)]
+        threads += [threading.Thread(target=reader, args=(engine, stop, reads)) for _ in range(args.readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+    
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    print(f"\n{profile} profile (journal_mode={settings['journal_mode']}, synchronous={settings['synchronous']})")
+    print(f"  commits/s:      {len(latencies) / args.duration:10.1f}")
+    print(f"  write p50/p99:  {np.percentile(latencies, 50):7.2f} / {np.percentile(latencies, 99):7.2f} ms")
+    print(f"  reads/s:        {len(reads) / args.duration:10.1f}")
+    print(f"  locked errors:  {len(errors):10d}")
+    return len(latencies) / args.duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=5, help='rows per committed transaction')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per profile')
+    args = parser.parse_args()
+    
+    print(f"{args.writers} writers, {args.readers} readers, {args.rows} rows per commit, {args.duration:.0f}s each")
+    before = run('default', args)
+    after = run('sqlite', args)
+    print(f"\nsqlite profile: {after / before:.1f}x the commit throughput of the defaults")
+
+
+if __name__ == '__main__':
+    main()
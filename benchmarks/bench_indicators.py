@@ -0,0 +1,148 @@
+"""Benchmark the vectorized indicator kernels against the previous per-element loops
+
+Usage:
+    python benchmarks/bench_indicators.py [--candles 200] [--repeat 200]
+
+The reference implementations below are the loops TechnicalAnalysisService used
+before services/indicators.py; the benchmark checks both produce the same output
+before timing them.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services import indicators  # noqa: E402
+
+
+def reference_rsi(prices, period=14):
+    if len(prices) < period + 1:
+        return np.full(len(prices), 50.0)
+    
+    deltas = np.diff(prices)
+    gains = np.where(deltas > 0, deltas, 0)
+    losses = np.where(deltas < 0, -deltas, 0)
+    
+    avg_gain = np.mean(gains[:period])
+    avg_loss = np.mean(losses[:period])
+    
+    rs_values = []
+    if avg_loss != 0:
+        rs = avg_gain / avg_loss
+        rsi = 100 - (100 / (1 + rs))
+    else:
+        rsi = 100
+    rs_values.append(rsi)
+    
+    for i in range(period, len(gains)):
+        avg_gain = (avg_gain * (period - 1) + gains[i]) / period
+        avg_loss = (avg_loss * (period - 1) + losses[i]) / period
+        
+        if avg_loss != 0:
+            rs = avg_gain / avg_loss
+            rsi = 100 - (100 / (1 + rs))
+        else:
+            rsi = 100
+        rs_values.append(rsi)
+    
+    result = np.full(len(prices), 50.0)
+    result[period:] = rs_values
+    return result
+
+
+def reference_sma(prices, period):
+    if len(prices) < period:
+        return np.full(len(prices), np.mean(prices))
+    
+    sma = np.full(len(prices), np.nan)
+    for i in range(period - 1, len(prices)):
+        sma[i] = np.mean(prices[i - period + 1:i + 1])
+    for i in range(period - 1):
+        sma[i] = np.mean(prices[:i + 1])
+    return sma
+
+
+def reference_ema(prices, period):
+    if len(prices) == 0:
+        return np.array([])
+    
+    ema = np.zeros(len(prices))
+    multiplier = 2 / (period + 1)
+    ema[0] = prices[0]
+    for i in range(1, len(prices)):
+        ema[i] = (prices[i] - ema[i - 1]) * multiplier + ema[i - 1]
+    return ema
+
+
+def reference_atr(highs, lows, closes, period=14):
+    if len(highs) < period or len(lows) < period or len(closes) < period:
+        return np.full(len(highs), 0.0)
+    
+    tr = np.zeros(len(highs))
+    tr[0] = highs[0] - lows[0]
+    for i in range(1, len(highs)):
+        tr1 = highs[i] - lows[i]
+        tr2 = abs(highs[i] - closes[i - 1])
+        tr3 = abs(lows[i] - closes[i - 1])
+        tr[i] = max(tr1, tr2, tr3)
+    return reference_sma(tr, period)
+
+
+def make_candles(count, seed=42):
+    """Random-walk candles around a BTC-like price level"""
+    rng = np.random.default_rng(seed)
+    closes = 30000 * np.exp(np.cumsum(rng.normal(0, 0.004, count)))
+    spread = np.abs(rng.normal(0, 0.003, count)) * closes
+    highs = closes + spread
+    lows = closes - spread
+    return highs, lows, closes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--candles', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    
+    highs, lows, closes = make_candles(args.candles)
+    
+    cases = [
+        ('RSI(14)', lambda: reference_rsi(closes, 14), lambda: indicators.rsi(closes, 14)),
+        ('SMA(50)', lambda: reference_sma(closes, 50), lambda: indicators.sma(closes, 50)),
+        ('SMA(200)', lambda: reference_sma(closes, 200), lambda: indicators.sma(closes, 200)),
+        ('EMA(10)', lambda: reference_ema(closes, 10), lambda: indicators.ema(closes, 10)),
+        ('ATR(14)', lambda: reference_atr(highs, lows, closes, 14),
+         lambda: indicators.atr(highs, lows, closes, 14)),
+    ]
+    
+    print(f"{args.candles} candles, best of 5 x {args.repeat} calls")
+    print(f"{'indicator':<10} {'loop (us)':>12} {'vectorized (us)':>16} {'speedup':>9} {'max rel diff':>14}")
+    
+    total_reference = 0.0
+    total_vectorized = 0.0
+    for name, reference, vectorized in cases:
+        expected = reference()
+        actual = vectorized()
+        scale = np.maximum(np.abs(expected), 1.0)
+        max_diff = float(np.max(np.abs(actual - expected) / scale))
+        if not np.allclose(actual, expected, rtol=1e-10, atol=1e-10):
+            raise SystemExit(f"{name}: vectorized output differs from reference (max rel diff {max_diff:.3e})")
+        
+        reference_time = min(timeit.repeat(reference, number=args.repeat, repeat=5)) / args.repeat
+        vectorized_time = min(timeit.repeat(vectorized, number=args.repeat, repeat=5)) / args.repeat
+        total_reference += reference_time
+        total_vectorized += vectorized_time
+        
+        print(f"{name:<10} {reference_time * 1e6:>12.1f} {vectorized_time * 1e6:>16.1f} "
+              f"{reference_time / vectorized_time:>8.1f}x {max_diff:>14.2e}")
+    
+    print(f"{'total':<10} {total_reference * 1e6:>12.1f} {total_vectorized * 1e6:>16.1f} "
+          f"{total_reference / total_vectorized:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark streamed market data against the local replay server
+
+Usage:
+    python benchmarks/bench_market_stream.py [--instruments 40] [--rate 5] [--duration 20]
+
+Plays a synthetic recording (ticker, book and candles for every instrument)
+through services.market_replay and consumes it with MarketStream:
+
+- throughput: the whole recording played flat out, messages applied per second
+- latency: real-time playback, server send to client state update for tickers
+
+For comparison it prints what REST polling the same data would cost
+(one ticker, book and candle request per instrument per poll interval).
+"""
+import argparse
+import os
+import sys
+import time
+import logging
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.market_data import PriceTable  # noqa: E402
+from services.market_replay import ReplayServer, synthesize_recording  # noqa: E402
+from services.market_stream import MarketStream  # noqa: E402
+
+STAMP = 'replay_sent_ms'
+
+
+class TimedMarketStream(MarketStream):
+    """MarketStream that records send-to-apply latency of ticker pushes"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies_ms = []
+    
+    def _apply(self, result):
+        gap = super()._apply(result)
+        if result.get('channel') == 'ticker':
+            sent = result['data'][-1].get(STAMP)
+            if sent is not None:
+                self.latencies_ms.append(time.time() * 1000 - sent)
+        return gap
+
+
+def run(records, instruments, speed, timeout):
+    # Playback starts once the client has subscribed
+    server = ReplayServer(records, speed=speed, stamp_field=STAMP, heartbeat_interval=5, autoplay=False)
+    url = server.start_in_thread()
+    
+    stream = TimedMarketStream(instruments, timeframe='1m', url=url, price_table=PriceTable(), subscribe_delay=0)
+    stream.start()
+    if not stream.wait_connected(10):
+        raise SystemExit("Could not connect to the replay server")
+    time.sleep(0.2)
+    
+    started = time.monotonic()
+    server.play_in_thread()
+    server.wait_finished(timeout)
+    
+    # Wait for the client to drain what was sent
+    expected = server.played
+    deadline = time.monotonic() + 10
+    while stream.messages < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    elapsed = time.monotonic() - started
+    
+    stream.stop()
+    server.stop_in_thread()
+    return stream, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--instruments', type=int, default=40)
+    parser.add_argument('--rate', type=float, default=5, help='updates per instrument per second')
+    parser.add_argument('--duration', type=float, default=20, help='recording length in seconds')
+    parser.add_argument('--poll-interval', type=float, default=10, help='REST poll interval to compare with')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    
+    instruments = [f"SYN{i}_USDT" for i in range(args.instruments)]
+    records = synthesize_recording(instruments, args.duration, args.rate, '1m')
+    print(f"{len(instruments)} instruments, {args.rate:g} updates/s each, {len(records)} messages "
+          f"over {args.duration:g}s of recording")
+    
+    stream, elapsed = run(records, instruments, speed=0, timeout=120)
+    print(f"\nthroughput (flat out): {stream.messages} messages in {elapsed:.2f}s "
+          f"= {stream.messages / elapsed:,.0f} msg/s, gaps {stream.gaps}")
+    
+    stream, elapsed = run(records, instruments, speed=1, timeout=args.duration + 30)
+    latencies = np.array(stream.latencies_ms)
+    print(f"\nreal-time playback: {stream.messages} messages in {elapsed:.2f}s over 1 connection, 0 REST requests")
+    if len(latencies):
+        print(f"ticker send -> state latency: p50 {np.percentile(latencies, 50):.2f}ms, "
+              f"p95 {np.percentile(latencies, 95):.2f}ms, p99 {np.percentile(latencies, 99):.2f}ms, "
+              f"max {latencies.max():.2f}ms")
+    
+    requests_per_minute = len(instruments) * 3 * 60 / args.poll_interval
+    print(f"\nREST polling every {args.poll_interval:g}s (model): {requests_per_minute:,.0f} requests/min, "
+          f"mean price staleness {args.poll_interval / 2 * 1000:,.0f}ms + request round-trip")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime, timedelta
-from sqlalchemy import func, text
+from sqlalchemy import func, text, case
+from sqlalchemy.orm import joinedload, contains_eager
 import json
 
 # This db instance will be initialized by app.py
@@ -44,6 +45,8 @@ class Coin(db.Model):
     trades = db.relationship('Trade', backref='coin_ref', lazy=True)
     orders = db.relationship('Order', backref='coin_ref', lazy=True)
     positions = db.relationship('Position', backref='coin_ref', lazy=True)
+    latest_snapshot = db.relationship('LatestAnalysis', uselist=False, lazy=True, cascade='all, delete-orphan')
+    analysis_rollups = db.relationship('AnalysisRollup', lazy=True, cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Coin {self.symbol}>'
@@ -51,7 +54,7 @@ class Coin(db.Model):
     @property
     def latest_analysis(self):
         """Get the latest technical analysis for this coin"""
-        return TechnicalAnalysis.query.filter_by(coin_id=self.id).order_by(TechnicalAnalysis.timestamp.desc()).first()
+        return self.latest_snapshot.analysis if self.latest_snapshot else None
     
     @property
     def open_positions(self):
@@ -61,6 +64,11 @@ class Coin(db.Model):
 class TechnicalAnalysis(db.Model):
     """Model for storing technical analysis data"""
     __tablename__ = 'technical_analyses'
+    __table_args__ = (
+        db.Index('ix_technical_analyses_coin_id_timestamp', 'coin_id', 'timestamp'),  # Latest analysis per coin
+        db.Index('ix_technical_analyses_action_timestamp', 'action', 'timestamp'),  # Recent signals
+        db.Index('ix_technical_analyses_timestamp', 'timestamp'),  # Retention (oldest rows first)
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     coin_id = db.Column(db.Integer, db.ForeignKey('coins.id'), nullable=False)
@@ -120,9 +128,175 @@ class TechnicalAnalysis(db.Model):
             strength += 1
         return min(strength, 5)  # Max strength is 5
 
+class LatestAnalysis(db.Model):
+    """Model for the latest technical analysis per coin (one row per coin)
+    
+    Upserted together with every new TechnicalAnalysis row so readers of the
+    current signals never have to search the analysis history.
+    """
+    __tablename__ = 'latest_analyses'
+    
+    coin_id = db.Column(db.Integer, db.ForeignKey('coins.id'), primary_key=True)
+    analysis_id = db.Column(db.Integer, db.ForeignKey('technical_analyses.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)  # Timestamp of the referenced analysis
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    analysis = db.relationship('TechnicalAnalysis', lazy='joined')
+    
+    def __repr__(self):
+        return f'<LatestAnalysis coin {self.coin_id} -> {self.analysis_id}>'
+    
+    @staticmethod
+    def upsert(analyses):
+        """Point the snapshot rows at the given analyses (not committed)
+        
+        The analyses must be flushed so they have ids. Older analyses never
+        replace a newer snapshot entry.
+        """
+        newest = {}
+        for analysis in analyses:
+            known = newest.get(analysis.coin_id)
+            if known is None or analysis.timestamp >= known.timestamp:
+                newest[analysis.coin_id] = analysis
+        if not newest:
+            return
+        
+        existing = {row.coin_id: row for row in LatestAnalysis.query.filter(
+            LatestAnalysis.coin_id.in_(list(newest))).all()}
+        for coin_id, analysis in newest.items():
+            row = existing.get(coin_id)
+            if row is None:
+                db.session.add(LatestAnalysis(coin_id=coin_id, analysis_id=analysis.id,
+                                              timestamp=analysis.timestamp))
+            elif analysis.timestamp >= row.timestamp:
+                row.analysis_id = analysis.id
+                row.timestamp = analysis.timestamp
+    
+    @staticmethod
+    def backfill():
+        """Build the snapshot from the analysis history if it is empty; returns rows created"""
+        if db.session.query(LatestAnalysis.coin_id).first() is not None:
+            return 0
+        
+        newest = db.session.query(
+            TechnicalAnalysis.coin_id,
+            func.max(TechnicalAnalysis.timestamp).label('max_timestamp')
+        ).group_by(TechnicalAnalysis.coin_id).subquery()
+        rows = db.session.query(TechnicalAnalysis.coin_id, func.max(TechnicalAnalysis.id), TechnicalAnalysis.timestamp)\
+            .join(newest, (TechnicalAnalysis.coin_id == newest.c.coin_id) &
+                  (TechnicalAnalysis.timestamp == newest.c.max_timestamp))\
+            .group_by(TechnicalAnalysis.coin_id, TechnicalAnalysis.timestamp).all()
+        
+        db.session.add_all(LatestAnalysis(coin_id=coin_id, analysis_id=analysis_id, timestamp=timestamp)
+                           for coin_id, analysis_id, timestamp in rows)
+        db.session.commit()
+        return len(rows)
+
+class AnalysisRollup(db.Model):
+    """Model for downsampled technical analysis history (hourly and daily buckets)"""
+    __tablename__ = 'analysis_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('coin_id', 'resolution', 'bucket_start', name='uq_analysis_rollups_bucket'),
+        db.Index('ix_analysis_rollups_resolution_bucket_start', 'resolution', 'bucket_start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    coin_id = db.Column(db.Integer, db.ForeignKey('coins.id'), nullable=False)
+    resolution = db.Column(db.String(10), nullable=False)  # hour, day
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    first_timestamp = db.Column(db.DateTime, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    
+    # OHLC of last_price
+    open_price = db.Column(db.Float)
+    high_price = db.Column(db.Float)
+    low_price = db.Column(db.Float)
+    close_price = db.Column(db.Float)
+    
+    # RSI; the mean is kept as sum/count so buckets can be merged
+    rsi_sum = db.Column(db.Float, default=0.0)
+    rsi_count = db.Column(db.Integer, default=0)
+    rsi_min = db.Column(db.Float)
+    rsi_max = db.Column(db.Float)
+    
+    # Signal counts
+    samples = db.Column(db.Integer, default=0)
+    buy_signals = db.Column(db.Integer, default=0)
+    sell_signals = db.Column(db.Integer, default=0)
+    
+    def __repr__(self):
+        return f'<AnalysisRollup coin {self.coin_id} {self.resolution} {self.bucket_start}>'
+    
+    @property
+    def rsi_mean(self):
+        return self.rsi_sum / self.rsi_count if self.rsi_count else None
+    
+    def absorb(self, values):
+        """Merge another bucket (a dict of rollup columns) into this one"""
+        if self.samples:
+            if values['first_timestamp'] < self.first_timestamp:
+                self.first_timestamp = values['first_timestamp']
+                self.open_price = values['open_price']
+            if values['last_timestamp'] >= self.last_timestamp:
+                self.last_timestamp = values['last_timestamp']
+                self.close_price = values['close_price']
+            self.high_price = _max(self.high_price, values['high_price'])
+            self.low_price = _min(self.low_price, values['low_price'])
+            self.rsi_min = _min(self.rsi_min, values['rsi_min'])
+            self.rsi_max = _max(self.rsi_max, values['rsi_max'])
+        else:
+            for column in ('first_timestamp', 'last_timestamp', 'open_price', 'high_price', 'low_price',
+                           'close_price', 'rsi_min', 'rsi_max'):
+                setattr(self, column, values[column])
+        
+        self.rsi_sum = (self.rsi_sum or 0.0) + values['rsi_sum']
+        self.rsi_count = (self.rsi_count or 0) + values['rsi_count']
+        self.samples = (self.samples or 0) + values['samples']
+        self.buy_signals = (self.buy_signals or 0) + values['buy_signals']
+        self.sell_signals = (self.sell_signals or 0) + values['sell_signals']
+    
+    def to_values(self):
+        """Rollup columns as a dict accepted by absorb()"""
+        return {
+            'first_timestamp': self.first_timestamp,
+            'last_timestamp': self.last_timestamp,
+            'open_price': self.open_price,
+            'high_price': self.high_price,
+            'low_price': self.low_price,
+            'close_price': self.close_price,
+            'rsi_sum': self.rsi_sum or 0.0,
+            'rsi_count': self.rsi_count or 0,
+            'rsi_min': self.rsi_min,
+            'rsi_max': self.rsi_max,
+            'samples': self.samples or 0,
+            'buy_signals': self.buy_signals or 0,
+            'sell_signals': self.sell_signals or 0
+        }
+    
+    def to_dict(self):
+        values = self.to_values()
+        values.update(
+            coin_id=self.coin_id,
+            resolution=self.resolution,
+            bucket_start=self.bucket_start.isoformat(),
+            first_timestamp=self.first_timestamp.isoformat(),
+            last_timestamp=self.last_timestamp.isoformat(),
+            rsi_mean=self.rsi_mean
+        )
+        return values
+
+def _min(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+def _max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
 class Trade(db.Model):
     """Model for executed trades"""
     __tablename__ = 'trades'
+    __table_args__ = (
+        db.Index('ix_trades_executed_at', 'executed_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     coin_id = db.Column(db.Integer, db.ForeignKey('coins.id'), nullable=False)
@@ -157,6 +331,10 @@ class Trade(db.Model):
 class Order(db.Model):
     """Model for orders (including pending orders)"""
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_status_coin_id', 'status', 'coin_id'),  # Pending orders, per coin
+        db.Index('ix_orders_created_at_id', 'created_at', 'id'),  # Keyset pages, newest first
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     coin_id = db.Column(db.Integer, db.ForeignKey('coins.id'), nullable=False)
@@ -176,7 +354,7 @@ class Order(db.Model):
     average_fill_price = db.Column(db.Float)
     
     # Timestamps
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     filled_at = db.Column(db.DateTime)
     cancelled_at = db.Column(db.DateTime)
@@ -207,6 +385,11 @@ class Order(db.Model):
 class Position(db.Model):
     """Model for trading positions"""
     __tablename__ = 'positions'
+    __table_args__ = (
+        db.Index('ix_positions_status_coin_id', 'status', 'coin_id'),  # Open positions, per coin
+        db.Index('ix_positions_status_exit_date', 'status', 'exit_date'),  # Closed positions in a window
+        db.Index('ix_positions_created_at_id', 'created_at', 'id'),  # Keyset pages, newest first
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     coin_id = db.Column(db.Integer, db.ForeignKey('coins.id'), nullable=False)
@@ -239,7 +422,7 @@ class Position(db.Model):
     fees_paid = db.Column(db.Float, default=0.0)
     
     # Timestamps
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
@@ -282,10 +465,35 @@ class Position(db.Model):
             return self.unrealized_pnl
     
     def update_unrealized_pnl(self):
-        """Update unrealized P&L based on current price"""
+        """Update unrealized P&L based on current price (not committed)"""
         if self.current_price and self.status == 'open':
             self.unrealized_pnl = (self.current_price - self.entry_price) * self.quantity
-            db.session.commit()
+
+class DailyPnl(db.Model):
+    """Model for realized P&L per day and coin, maintained as positions close
+    
+    Rows only hold that day's totals; equity is a running sum over days (see
+    PnlRollup.daily), so correcting one day never rewrites the later ones.
+    """
+    __tablename__ = 'daily_pnl'
+    __table_args__ = (
+        db.UniqueConstraint('day', 'coin_id', name='uq_daily_pnl_day_coin'),  # Also serves day range reads
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)  # UTC date of the exit
+    coin_id = db.Column(db.Integer, db.ForeignKey('coins.id'), nullable=False)
+    
+    realized_pnl = db.Column(db.Float, default=0.0)
+    fees = db.Column(db.Float, default=0.0)
+    trade_count = db.Column(db.Integer, default=0)
+    wins = db.Column(db.Integer, default=0)
+    losses = db.Column(db.Integer, default=0)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DailyPnl {self.day} coin {self.coin_id}: {self.realized_pnl}>'
 
 class TradingSettings(db.Model):
     """Model for storing trading settings and preferences"""
@@ -328,12 +536,38 @@ class TradingSettings(db.Model):
     def __repr__(self):
         return f'<TradingSettings for User {self.user_id}>'
 
+class SyncCursor(db.Model):
+    """Model for exchange sync cursors (last synced exchange time per stream)"""
+    __tablename__ = 'sync_cursors'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)  # e.g. 'orders'
+    cursor_ts = db.Column(db.BigInteger)  # Exchange time in milliseconds
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SyncCursor {self.name} at {self.cursor_ts}>'
+    
+    @staticmethod
+    def get(name):
+        """Get a cursor row, creating it in the session if it does not exist"""
+        cursor = SyncCursor.query.filter_by(name=name).first()
+        if cursor is None:
+            cursor = SyncCursor(name=name)
+            db.session.add(cursor)
+        return cursor
+
 class SystemLog(db.Model):
     """Model for system logs and events"""
     __tablename__ = 'system_logs'
+    __table_args__ = (
+        db.Index('ix_system_logs_timestamp', 'timestamp'),
+        db.Index('ix_system_logs_level_category_timestamp', 'level', 'category', 'timestamp'),
+        db.Index('ix_system_logs_category_timestamp', 'category', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     level = db.Column(db.String(10), nullable=False)  # INFO, WARNING, ERROR, CRITICAL
     category = db.Column(db.String(50), nullable=False)  # TRADING, ANALYSIS, SYSTEM, API
     message = db.Column(db.Text, nullable=False)
@@ -345,12 +579,41 @@ class SystemLog(db.Model):
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id'))
     position_id = db.Column(db.Integer, db.ForeignKey('positions.id'))
     
+    # Write-behind sink (services.log_writer.SystemLogWriter); None means commit inline
+    _sink = None
+    
     def __repr__(self):
         return f'<SystemLog {self.level} - {self.category}: {self.message[:50]}>'
     
+    @classmethod
+    def set_sink(cls, sink):
+        """Route log() through a write-behind sink, or None to commit inline again"""
+        cls._sink = sink
+    
+    @classmethod
+    def get_sink(cls):
+        return cls._sink
+    
     @staticmethod
     def log(level, category, message, details=None, **kwargs):
-        """Helper method to create log entries"""
+        """Helper method to create log entries
+        
+        With a sink installed the entry is queued and written in the background,
+        without touching (or committing) the caller's session; returns None then.
+        """
+        sink = SystemLog._sink
+        if sink is not None:
+            entry = dict(
+                timestamp=datetime.utcnow(),
+                level=level,
+                category=category,
+                message=message,
+                details=json.dumps(details) if details else None,
+                **kwargs
+            )
+            sink.submit(entry)
+            return None
+        
         log_entry = SystemLog(
             level=level,
             category=category,
@@ -368,40 +631,107 @@ def get_active_coins():
     return Coin.query.filter_by(is_active=True, is_trading_enabled=True).all()
 
 def get_open_positions():
-    """Get all open positions"""
-    return Position.query.filter_by(status='open').all()
+    """Get all open positions, with their coins loaded in the same query"""
+    return Position.query.options(joinedload(Position.coin_ref)).filter_by(status='open').all()
 
 def get_pending_orders():
-    """Get all pending orders"""
-    return Order.query.filter(Order.status.in_(['PENDING', 'PARTIALLY_FILLED'])).all()
+    """Get all pending orders, with their coins loaded in the same query"""
+    return Order.query.options(joinedload(Order.coin_ref))\
+        .filter(Order.status.in_(['PENDING', 'PARTIALLY_FILLED'])).all()
+
+def get_latest_signals(active_only=True):
+    """Get the latest analysis of every coin, newest first, with their coins loaded in the same query"""
+    query = db.session.query(TechnicalAnalysis)\
+        .join(LatestAnalysis, LatestAnalysis.analysis_id == TechnicalAnalysis.id)\
+        .join(Coin, LatestAnalysis.coin_id == Coin.id)\
+        .options(contains_eager(TechnicalAnalysis.coin_ref))
+    if active_only:
+        query = query.filter(Coin.is_active == True)
+    return query.order_by(LatestAnalysis.timestamp.desc()).all()
 
 def get_recent_trades(days=7):
     """Get recent trades within specified days"""
     cutoff_date = datetime.utcnow() - timedelta(days=days)
     return Trade.query.filter(Trade.executed_at >= cutoff_date).all()
 
-def get_trading_performance(days=30):
-    """Get trading performance metrics for the last N days"""
-    cutoff_date = datetime.utcnow() - timedelta(days=days)
-    
-    # Get closed positions
-    closed_positions = Position.query.filter(
-        Position.status == 'closed',
-        Position.exit_date >= cutoff_date
-    ).all()
-    
-    total_trades = len(closed_positions)
-    winning_trades = len([p for p in closed_positions if p.realized_pnl > 0])
-    losing_trades = total_trades - winning_trades
-    
-    total_pnl = sum(p.realized_pnl for p in closed_positions)
-    win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
-    
+def _performance(total_trades, winning_trades, total_pnl):
+    total_trades = total_trades or 0
+    winning_trades = winning_trades or 0
     return {
         'total_trades': total_trades,
         'winning_trades': winning_trades,
-        'losing_trades': losing_trades,
-        'win_rate': win_rate,
-        'total_pnl': total_pnl,
-        'closed_positions': closed_positions
-    } 
\ No newline at end of file
+        'losing_trades': total_trades - winning_trades,
+        'win_rate': (winning_trades / total_trades * 100) if total_trades > 0 else 0,
+        'total_pnl': float(total_pnl or 0)
+    }
+
+def get_performance_windows(windows=(7, 30, 90)):
+    """Get trading performance metrics for several trailing windows (days)
+    
+    All windows are computed by one aggregate statement over the closed
+    positions of the longest window, with conditional counts and sums per
+    window. Returns {days: metrics}.
+    """
+    now = datetime.utcnow()
+    cutoffs = {days: now - timedelta(days=days) for days in windows}
+    pnl = func.coalesce(Position.realized_pnl, 0)
+    
+    columns = []
+    for cutoff in cutoffs.values():
+        in_window = Position.exit_date >= cutoff
+        columns += [
+            func.count(case((in_window, 1))),
+            func.count(case((in_window & (pnl > 0), 1))),
+            func.sum(case((in_window, pnl), else_=0))
+        ]
+    
+    row = db.session.query(*columns).filter(
+        Position.status == 'closed',
+        Position.exit_date >= min(cutoffs.values())
+    ).one()
+    
+    return {days: _performance(*row[i * 3:i * 3 + 3]) for i, days in enumerate(cutoffs)}
+
+def get_closed_positions_page(days=30, page=1, per_page=50):
+    """Get one page of the closed positions in the last N days, newest first, as plain dicts"""
+    cutoff_date = datetime.utcnow() - timedelta(days=days)
+    rows = db.session.query(
+        Position.id, Coin.symbol, Position.quantity, Position.entry_price, Position.exit_price,
+        Position.entry_date, Position.exit_date, Position.realized_pnl, Position.fees_paid
+    ).join(Coin, Position.coin_id == Coin.id).filter(
+        Position.status == 'closed',
+        Position.exit_date >= cutoff_date
+    ).order_by(Position.exit_date.desc(), Position.id.desc())\
+        .limit(per_page).offset((page - 1) * per_page).all()
+    
+    return [{
+        'id': position_id,
+        'coin_symbol': symbol,
+        'quantity': quantity,
+        'entry_price': entry_price,
+        'exit_price': exit_price,
+        'entry_date': entry_date.isoformat() if entry_date else None,
+        'exit_date': exit_date.isoformat() if exit_date else None,
+        'realized_pnl': realized_pnl,
+        'fees_paid': fees_paid
+    } for position_id, symbol, quantity, entry_price, exit_price, entry_date, exit_date, realized_pnl, fees_paid in rows]
+
+def get_trading_performance(days=30, include_positions=False, page=1, per_page=50):
+    """Get trading performance metrics for the last N days
+    
+    The closed positions themselves are only returned with include_positions,
+    one page at a time.
+    """
+    performance = get_performance_windows((days,))[days]
+    
+    if include_positions:
+        per_page = max(1, min(per_page, 500))
+        performance['closed_positions'] = {
+            'items': get_closed_positions_page(days, page, per_page),
+            'page': page,
+            'per_page': per_page,
+            'total': performance['total_trades'],
+            'pages': (performance['total_trades'] + per_page - 1) // per_page
+        }
+    
+    return performance
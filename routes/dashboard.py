@@ -1,12 +1,17 @@
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, render_template, request, jsonify, Response
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from sqlalchemy import func, desc
 from models import (db, Coin, TechnicalAnalysis, Trade, Order, Position, 
                    SystemLog, get_active_coins, get_open_positions, 
-                   get_pending_orders, get_trading_performance)
+                   get_pending_orders, get_latest_signals, get_trading_performance,
+                   get_performance_windows)
 from services.technical_analysis import TechnicalAnalysisService
-from services.crypto_exchange import CryptoExchangeAPI
+from services.async_exchange import get_exchange_api
+from services.response_cache import response_cache
+from services.event_stream import event_broker
+from services import pagination
+from services.pnl_rollup import pnl_rollup
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/dashboard')
 
@@ -39,7 +44,7 @@ def dashboard():
         # Get account balance (if API is configured)
         account_balance = None
         try:
-            exchange_api = CryptoExchangeAPI()
+            exchange_api = get_exchange_api()
             if exchange_api.api_key and exchange_api.api_secret:
                 balances = exchange_api.get_balance()
                 if balances:
@@ -67,6 +72,7 @@ def dashboard():
 
 @dashboard_bp.route('/api/overview')
 @login_required
+@response_cache.cached()
 def api_overview():
     """API endpoint for dashboard overview data"""
     try:
@@ -107,23 +113,12 @@ def api_overview():
 
 @dashboard_bp.route('/api/signals')
 @login_required
+@response_cache.cached()
 def api_signals():
     """API endpoint for latest trading signals"""
     try:
-        # Get latest analyses for all coins
-        subquery = db.session.query(
-            TechnicalAnalysis.coin_id,
-            func.max(TechnicalAnalysis.timestamp).label('max_timestamp')
-        ).group_by(TechnicalAnalysis.coin_id).subquery()
-        
-        latest_analyses = db.session.query(TechnicalAnalysis)\
-            .join(subquery, 
-                  (TechnicalAnalysis.coin_id == subquery.c.coin_id) & 
-                  (TechnicalAnalysis.timestamp == subquery.c.max_timestamp))\
-            .join(Coin, TechnicalAnalysis.coin_id == Coin.id)\
-            .filter(Coin.is_active == True)\
-            .order_by(desc(TechnicalAnalysis.timestamp))\
-            .all()
+        # Get latest analyses for all coins from the one-row-per-coin snapshot
+        latest_analyses = get_latest_signals()
         
         signals_data = []
         for analysis in latest_analyses:
@@ -160,6 +155,7 @@ def api_signals():
 
 @dashboard_bp.route('/api/positions')
 @login_required
+@response_cache.cached()
 def api_positions():
     """API endpoint for open positions"""
     try:
@@ -199,6 +195,7 @@ def api_positions():
 
 @dashboard_bp.route('/api/orders')
 @login_required
+@response_cache.cached()
 def api_orders():
     """API endpoint for pending orders"""
     try:
@@ -237,41 +234,24 @@ def api_orders():
 
 @dashboard_bp.route('/api/performance')
 @login_required
+@response_cache.cached(max_age=60)  # Windows are relative to now
 def api_performance():
     """API endpoint for trading performance metrics"""
     try:
-        # Get performance for different time periods
-        performance_7d = get_trading_performance(days=7)
-        performance_30d = get_trading_performance(days=30)
-        performance_90d = get_trading_performance(days=90)
-        
-        # Get daily PnL for chart (last 30 days)
-        end_date = datetime.utcnow()
-        start_date = end_date - timedelta(days=30)
-        
-        daily_pnl = db.session.query(
-            func.date(Position.exit_date).label('date'),
-            func.sum(Position.realized_pnl).label('daily_pnl')
-        ).filter(
-            Position.status == 'closed',
-            Position.exit_date >= start_date,
-            Position.exit_date <= end_date
-        ).group_by(func.date(Position.exit_date)).all()
-        
-        # Format daily PnL for chart
-        pnl_chart_data = []
-        for record in daily_pnl:
-            pnl_chart_data.append({
-                'date': record.date.isoformat(),
-                'pnl': float(record.daily_pnl or 0)
-            })
+        # Get performance for different time periods (one aggregate query)
+        performance = get_performance_windows((7, 30, 90))
+        
+        # Daily PnL chart from the daily rollup (last 30 days by default)
+        days = min(max(request.args.get('days', 30, type=int), 1), 3650)
+        start_date = datetime.utcnow().date() - timedelta(days=days)
+        pnl_chart_data = pnl_rollup.daily(start_date)
         
         return jsonify({
             'status': 'success',
             'data': {
-                'performance_7d': performance_7d,
-                'performance_30d': performance_30d,
-                'performance_90d': performance_90d,
+                'performance_7d': performance[7],
+                'performance_30d': performance[30],
+                'performance_90d': performance[90],
                 'daily_pnl_chart': pnl_chart_data
             }
         })
@@ -282,12 +262,25 @@ def api_performance():
             'message': str(e)
         }), 500
 
+@dashboard_bp.route('/api/stream')
+@login_required
+def api_stream():
+    """Server-Sent Events stream of signal, position, order and log changes"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_seq = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_seq = None
+    
+    return Response(event_broker.stream(last_seq), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @dashboard_bp.route('/api/account-balance')
 @login_required
 def api_account_balance():
     """API endpoint for account balance from exchange"""
     try:
-        exchange_api = CryptoExchangeAPI()
+        exchange_api = get_exchange_api()
         
         if not exchange_api.api_key or not exchange_api.api_secret:
             return jsonify({
@@ -333,10 +326,13 @@ def api_account_balance():
 @dashboard_bp.route('/api/system-logs')
 @login_required
 def api_system_logs():
-    """API endpoint for recent system logs"""
+    """API endpoint for recent system logs, newest first, one keyset page at a time
+    
+    Query args: level, category, per_page (max 200), cursor (the previous
+    page's next_cursor), include_total=true for an approximate total.
+    """
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
+        per_page = pagination.page_size(request.args, default=20)
         level_filter = request.args.get('level', None)
         category_filter = request.args.get('category', None)
         
@@ -348,11 +344,12 @@ def api_system_logs():
         if category_filter:
             query = query.filter(SystemLog.category == category_filter.upper())
         
-        logs = query.order_by(desc(SystemLog.timestamp))\
-                   .paginate(page=page, per_page=per_page, error_out=False)
+        total = pagination.approximate_total(query) if pagination.wants_total(request.args) else None
+        logs, next_cursor = pagination.keyset_page(query, SystemLog.timestamp, SystemLog.id,
+                                                   request.args.get('cursor'), per_page)
         
         logs_data = []
-        for log in logs.items:
+        for log in logs:
             logs_data.append({
                 'id': log.id,
                 'timestamp': log.timestamp.isoformat(),
@@ -370,17 +367,15 @@ def api_system_logs():
             'status': 'success',
             'data': {
                 'logs': logs_data,
-                'pagination': {
-                    'page': logs.page,
-                    'pages': logs.pages,
-                    'total': logs.total,
-                    'per_page': logs.per_page,
-                    'has_prev': logs.has_prev,
-                    'has_next': logs.has_next
-                }
+                'pagination': pagination.pagination_info(per_page, next_cursor, total)
             }
         })
         
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -1,8 +1,11 @@
 from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
 from flask_login import login_required
 from datetime import datetime, timedelta
-from models import db, Order, SystemLog
-from services.crypto_exchange import CryptoExchangeAPI
+from sqlalchemy import select, or_
+from sqlalchemy.orm import joinedload
+from models import db, Coin, Order, SystemLog
+from services import csv_export, pagination
+from services.async_exchange import get_exchange_api
 
 orders_bp = Blueprint('orders', __name__, url_prefix='/orders')
 
@@ -15,10 +18,15 @@ def index():
 @orders_bp.route('/api/orders')
 @login_required
 def api_orders():
-    """Get orders with filters"""
+    """Get orders with filters, newest first, one keyset page at a time
+    
+    Query args: status, symbol, per_page (max 200), cursor (the previous
+    page's next_cursor), include_total=true for an approximate total.
+    """
     try:
         status_filter = request.args.get('status')
         coin_filter = request.args.get('symbol')
+        per_page = pagination.page_size(request.args)
         
         query = Order.query
         
@@ -26,36 +34,43 @@ def api_orders():
             query = query.filter(Order.status == status_filter.upper())
         
         if coin_filter:
-            query = query.filter(Order.symbol == coin_filter.upper())
+            symbol = coin_filter.upper()
+            query = query.join(Coin, Order.coin_id == Coin.id)\
+                .filter(or_(Coin.symbol == symbol, Coin.original_symbol == symbol))
         
-        orders = query.order_by(Order.created_at.desc()).all()
+        total = pagination.approximate_total(query) if pagination.wants_total(request.args) else None
+        orders, next_cursor = pagination.keyset_page(query.options(joinedload(Order.coin_ref)),
+                                                     Order.created_at, Order.id,
+                                                     request.args.get('cursor'), per_page)
         
         orders_data = []
         for order in orders:
             orders_data.append({
                 'id': order.id,
-                'order_id': order.order_id,
-                'symbol': order.symbol,
+                'order_id': order.exchange_order_id,
+                'symbol': order.coin_ref.symbol,
                 'order_type': order.order_type,
                 'side': order.side,
                 'quantity': order.quantity,
                 'price': order.price,
+                'stop_price': order.stop_price,
                 'filled_quantity': order.filled_quantity,
-                'total_value': order.total_value,
+                'average_fill_price': order.average_fill_price,
                 'status': order.status,
                 'created_at': order.created_at.isoformat() if order.created_at else None,
                 'updated_at': order.updated_at.isoformat() if order.updated_at else None,
                 'filled_at': order.filled_at.isoformat() if order.filled_at else None,
-                'cancelled_at': order.cancelled_at.isoformat() if order.cancelled_at else None,
-                'take_profit': order.take_profit,
-                'stop_loss': order.stop_loss
+                'cancelled_at': order.cancelled_at.isoformat() if order.cancelled_at else None
             })
         
         return jsonify({
             'success': True,
-            'orders': orders_data
+            'orders': orders_data,
+            'pagination': pagination.pagination_info(per_page, next_cursor, total)
         })
         
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
@@ -71,7 +86,7 @@ def cancel_order(order_id):
             return redirect(url_for('orders.index'))
         
         # Cancel on exchange
-        exchange_api = CryptoExchangeAPI()
+        exchange_api = get_exchange_api()
         success = exchange_api.cancel_order(order.exchange_order_id)
         
         if success:
@@ -131,7 +146,7 @@ def cancel_order_api(order_id):
             return jsonify({'success': False, 'message': 'Order cannot be cancelled'})
         
         # Try to cancel on exchange
-        exchange_api = CryptoExchangeAPI()
+        exchange_api = get_exchange_api()
         success = exchange_api.cancel_order(order.exchange_order_id)
         
         if success:
@@ -153,7 +168,7 @@ def cancel_all_pending_api():
     """Cancel all pending orders"""
     try:
         pending_orders = Order.query.filter_by(status='PENDING').all()
-        exchange_api = CryptoExchangeAPI()
+        exchange_api = get_exchange_api()
         
         cancelled_count = 0
         for order in pending_orders:
@@ -180,40 +195,41 @@ def cancel_all_pending_api():
 @orders_bp.route('/api/orders/export')
 @login_required
 def export_orders():
-    """Export orders to CSV"""
+    """Export orders to CSV, streamed in chunks
+    
+    Query args: date_from, date_to (ISO, on created_at), status, symbol,
+    gzip=1 for a .csv.gz download.
+    """
     try:
-        import csv
-        import io
-        from flask import make_response
-        
-        orders = Order.query.all()
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(['Order ID', 'Symbol', 'Side', 'Type', 'Quantity', 'Price', 
-                        'Filled Quantity', 'Total Value', 'Status', 'Created At'])
-        
-        # Write data
-        for order in orders:
-            writer.writerow([
-                order.order_id or order.id,
-                order.symbol,
-                order.side,
-                order.order_type,
-                order.quantity,
-                order.price,
-                order.filled_quantity,
-                order.total_value,
-                order.status,
-                order.created_at
-            ])
-        
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv'
-        response.headers['Content-Disposition'] = 'attachment; filename=orders.csv'
-        
-        return response
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)}) 
\ No newline at end of file
+        statement = select(
+            Order.id, Order.exchange_order_id, Coin.symbol, Order.side, Order.order_type,
+            Order.quantity, Order.price, Order.filled_quantity, Order.average_fill_price,
+            Order.status, Order.created_at, Order.filled_at, Order.cancelled_at
+        ).join(Coin, Order.coin_id == Coin.id)
+        statement = csv_export.apply_filters(statement, Order, request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid filter: {str(e)}'}), 400
+        
+    def format_row(row):
+        fill_price = row.average_fill_price or row.price
+        total_value = row.filled_quantity * fill_price if row.filled_quantity and fill_price else None
+        return [
+            row.exchange_order_id or row.id,
+            row.symbol,
+            row.side,
+            row.order_type,
+            row.quantity,
+            row.price,
+            row.filled_quantity,
+            total_value,
+            row.status,
+            csv_export.iso(row.created_at),
+            csv_export.iso(row.filled_at),
+            csv_export.iso(row.cancelled_at)
+        ]
+        
+    header = ['Order ID', 'Symbol', 'Side', 'Type', 'Quantity', 'Price', 'Filled Quantity',
+              'Total Value', 'Status', 'Created At', 'Filled At', 'Cancelled At']
+    rows = csv_export.keyset_rows(statement, Order.id)
+    return csv_export.csv_response(csv_export.stream_csv(header, rows, format_row), 'orders.csv',
+                                   csv_export.wants_gzip(request.args))
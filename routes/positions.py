@@ -1,6 +1,10 @@
 from flask import Blueprint, render_template, jsonify, request
 from flask_login import login_required
-from models import Position, get_open_positions, get_trading_performance
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from models import Coin, Position, get_open_positions, get_trading_performance
+from services import csv_export, pagination
+from services.trigger_book import get_trigger_book
 
 positions_bp = Blueprint('positions', __name__, url_prefix='/positions')
 
@@ -13,41 +17,52 @@ def index():
 @positions_bp.route('/api/positions')
 @login_required
 def api_positions():
-    """Get positions with filters"""
+    """Get positions with filters, newest first, one keyset page at a time
+    
+    Query args: status, per_page (max 200), cursor (the previous page's
+    next_cursor), include_total=true for an approximate total.
+    """
     try:
         status_filter = request.args.get('status', None)
+        per_page = pagination.page_size(request.args)
         
         query = Position.query
         if status_filter:
-            query = query.filter_by(status=status_filter.upper())
+            query = query.filter_by(status=status_filter.lower())
         
-        positions = query.order_by(Position.created_at.desc()).all()
+        total = pagination.approximate_total(query) if pagination.wants_total(request.args) else None
+        positions, next_cursor = pagination.keyset_page(query.options(joinedload(Position.coin_ref)),
+                                                        Position.created_at, Position.id,
+                                                        request.args.get('cursor'), per_page)
         
         positions_data = []
         for position in positions:
             positions_data.append({
                 'id': position.id,
-                'symbol': position.symbol,
+                'symbol': position.coin_ref.symbol,
                 'quantity': position.quantity,
                 'entry_price': position.entry_price,
                 'current_price': position.current_price,
-                'market_value': position.market_value,
+                'market_value': position.current_value,
                 'unrealized_pnl': position.unrealized_pnl,
+                'realized_pnl': position.realized_pnl,
                 'pnl_percentage': position.pnl_percentage,
                 'take_profit': position.take_profit,
                 'stop_loss': position.stop_loss,
                 'status': position.status,
-                'order_type': position.order_type,
                 'created_at': position.created_at.isoformat() if position.created_at else None,
                 'updated_at': position.updated_at.isoformat() if position.updated_at else None,
-                'closed_at': position.closed_at.isoformat() if position.closed_at else None
+                'closed_at': position.exit_date.isoformat() if position.exit_date else None
             })
         
         return jsonify({
             'success': True,
-            'positions': positions_data
+            'positions': positions_data,
+            'pagination': pagination.pagination_info(per_page, next_cursor, total)
         })
         
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -95,6 +110,9 @@ def update_tp_sl(position_id):
         
         db.session.commit()
         
+        # Move the position's levels in the TP/SL trigger book
+        get_trigger_book().upsert_position(position)
+        
         return jsonify({'success': True, 'message': 'TP/SL updated successfully'})
     except Exception as e:
         from models import db
@@ -104,39 +122,43 @@ def update_tp_sl(position_id):
 @positions_bp.route('/api/positions/export')
 @login_required
 def export_positions():
-    """Export positions to CSV"""
+    """Export positions to CSV, streamed in chunks
+    
+    Query args: date_from, date_to (ISO, on created_at), status, symbol,
+    gzip=1 for a .csv.gz download.
+    """
     try:
-        import csv
-        import io
-        from flask import make_response
-        
-        positions = Position.query.all()
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(['Symbol', 'Quantity', 'Entry Price', 'Current Price', 
-                        'Market Value', 'P&L', 'P&L %', 'Status', 'Created At'])
-        
-        # Write data
-        for position in positions:
-            writer.writerow([
-                position.symbol,
-                position.quantity,
-                position.entry_price,
-                position.current_price,
-                position.market_value,
-                position.unrealized_pnl,
-                position.pnl_percentage,
-                position.status,
-                position.created_at
-            ])
-        
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv'
-        response.headers['Content-Disposition'] = 'attachment; filename=positions.csv'
-        
-        return response
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)}) 
\ No newline at end of file
+        statement = select(
+            Position.id, Coin.symbol, Position.quantity, Position.entry_price, Position.current_price,
+            Position.exit_price, Position.unrealized_pnl, Position.realized_pnl, Position.fees_paid,
+            Position.status, Position.created_at, Position.exit_date
+        ).join(Coin, Position.coin_id == Coin.id)
+        statement = csv_export.apply_filters(statement, Position, request.args, status_case=str.lower)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid filter: {str(e)}'}), 400
+        
+    def format_row(row):
+        closed = row.status == 'closed'
+        price = (row.exit_price if closed else row.current_price) or row.entry_price
+        pnl = row.realized_pnl if closed else row.unrealized_pnl
+        return [
+            row.id,
+            row.symbol,
+            row.quantity,
+            row.entry_price,
+            row.current_price,
+            row.quantity * price,
+            pnl,
+            (price - row.entry_price) / row.entry_price * 100 if row.entry_price else 0.0,
+            row.exit_price,
+            row.fees_paid,
+            row.status,
+            csv_export.iso(row.created_at),
+            csv_export.iso(row.exit_date)
+        ]
+        
+    header = ['Position ID', 'Symbol', 'Quantity', 'Entry Price', 'Current Price', 'Market Value',
+              'P&L', 'P&L %', 'Exit Price', 'Fees', 'Status', 'Created At', 'Exit Date']
+    rows = csv_export.keyset_rows(statement, Position.id)
+    return csv_export.csv_response(csv_export.stream_csv(header, rows, format_row), 'positions.csv',
+                                   csv_export.wants_gzip(request.args))
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
 from models import db, TradingSettings
 
@@ -175,9 +175,9 @@ def reset_settings_api():
 def test_api_connection():
     """Test API connection"""
     try:
-        from services.crypto_exchange import CryptoExchangeAPI
+        from services.async_exchange import get_exchange_api
         
-        exchange_api = CryptoExchangeAPI()
+        exchange_api = get_exchange_api()
         
         # Test basic connection
         account_info = exchange_api.get_account_balance()
@@ -232,6 +232,19 @@ def system_info():
         start_time = datetime.now()  # This would normally be stored when app starts
         uptime = datetime.now() - start_time
         
+        from services.rate_limiter import get_rate_limiter
+        from services.log_writer import system_log_writer
+        from services.retention import retention_engine
+        from services.db_profile import database_info
+        from services.query_counter import request_query_counter
+        from services.response_cache import response_cache
+        from services.event_stream import event_broker
+        from services.analytics import analytics_engine
+        from services.pnl_rollup import pnl_rollup
+        from services.async_exchange import exchange_client_stats
+        from services.instrument_cache import instrument_cache_stats
+        from services.market_data import price_table_stats
+        
         return jsonify({
             'success': True,
             'db_version': 'SQLite 3.x',
@@ -243,7 +256,19 @@ def system_info():
                 'database': 'healthy', 
                 'trading_monitor': 'running',
                 'tp_sl_monitor': 'running'
-            }
+            },
+            'rate_limits': get_rate_limiter().stats(),
+            'system_log_writer': system_log_writer.stats(),
+            'retention': retention_engine.stats(),
+            'database': database_info(current_app, db),
+            'sql_queries': request_query_counter.stats(),
+            'response_cache': response_cache.stats(),
+            'event_stream': event_broker.stats(),
+            'analytics': analytics_engine.stats(),
+            'daily_pnl': pnl_rollup.stats(),
+            'instrument_cache': instrument_cache_stats(),
+            'price_tables': price_table_stats(),
+            'exchange_client': exchange_client_stats()
         })
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -1,8 +1,8 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime
-from models import db, Coin, TechnicalAnalysis, Order, Position, SystemLog
-from services.crypto_exchange import CryptoExchangeAPI
+from models import db, Coin, TechnicalAnalysis, LatestAnalysis, Order, Position, SystemLog
+from services.async_exchange import get_exchange_api
 from services.technical_analysis import TechnicalAnalysisService
 
 trading_bp = Blueprint('trading', __name__, url_prefix='/trading')
@@ -49,7 +49,7 @@ def add_coin():
             symbol = f"{original_symbol}_{base_currency}"
         
         # Test if the symbol exists on the exchange
-        exchange_api = CryptoExchangeAPI()
+        exchange_api = get_exchange_api()
         ticker = exchange_api.get_ticker(symbol)
         
         if not ticker:
@@ -164,7 +164,7 @@ def manual_order():
             return redirect(url_for('trading.manual_order'))
         
         # Place order through exchange API
-        exchange_api = CryptoExchangeAPI()
+        exchange_api = get_exchange_api()
         
         order_result = exchange_api.place_order(
             instrument_name=coin.symbol,
@@ -217,8 +217,11 @@ def api_coin_price(coin_id):
     try:
         coin = Coin.query.get_or_404(coin_id)
         
-        exchange_api = CryptoExchangeAPI()
-        ticker = exchange_api.get_ticker(coin.symbol)
+        exchange_api = get_exchange_api()
+        ticker = exchange_api.get_ticker_snapshot().get_ticker(coin.symbol)
+        if not ticker:
+            # Not in the bulk snapshot, ask for this instrument only
+            ticker = exchange_api.get_ticker(coin.symbol)
         
         if not ticker:
             return jsonify({
@@ -293,8 +296,8 @@ def api_analyze_coin(coin_id):
 def api_available_instruments():
     """Get available trading instruments from exchange"""
     try:
-        exchange_api = CryptoExchangeAPI()
-        instruments = exchange_api.get_instruments()
+        exchange_api = get_exchange_api()
+        instruments = exchange_api.get_cached_instruments()
         
         # Filter and format instruments
         formatted_instruments = []
@@ -363,7 +366,7 @@ def import_popular_coins():
             {'symbol': 'MATIC_USDT', 'original': 'MATIC'}
         ]
         
-        exchange_api = CryptoExchangeAPI()
+        exchange_api = get_exchange_api()
         added_count = 0
         
         for pair in popular_pairs:
@@ -438,12 +441,12 @@ def get_coins_api():
     try:
         coins = Coin.query.all()
         
+        # Latest analysis per coin, one snapshot row each
+        latest_analyses = {snapshot.coin_id: snapshot.analysis for snapshot in LatestAnalysis.query.all()}
+        
         coins_data = []
         for coin in coins:
-            # Get latest analysis
-            latest_analysis = TechnicalAnalysis.query.filter_by(
-                symbol=coin.symbol
-            ).order_by(TechnicalAnalysis.timestamp.desc()).first()
+            latest_analysis = latest_analyses.get(coin.id)
             
             coin_data = {
                 'symbol': coin.symbol,
@@ -454,7 +457,7 @@ def get_coins_api():
                 'market_cap': coin.market_cap,
                 'volume_24h': coin.volume_24h,
                 'rsi': latest_analysis.rsi if latest_analysis else None,
-                'signal': latest_analysis.signal if latest_analysis else 'HOLD'
+                'signal': latest_analysis.action if latest_analysis else 'HOLD'
             }
             coins_data.append(coin_data)
         
@@ -0,0 +1,498 @@
+import time
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import select, func, case
+from models import db, Coin, Position, Trade, TechnicalAnalysis, AnalysisRollup
+from services.response_cache import get_data_version
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS = 365  # Crypto trades every day
+SIGNAL_ACTIONS = ('BUY', 'SELL')
+EPOCH = datetime(1970, 1, 1)
+SIGNAL_EXECUTION_WINDOW = timedelta(minutes=5)  # A position opened/closed this soon after a signal executed it
+
+
+def parse_window(value) -> Optional[int]:
+    """Window in days from a `days` query argument; None for 'all'. Raises ValueError"""
+    if value is None or value == '':
+        return 30
+    if str(value).lower() == 'all':
+        return None
+    days = int(value)
+    if days <= 0:
+        raise ValueError('days must be positive or "all"')
+    return days
+
+
+def _datetimes(values) -> np.ndarray:
+    """datetime64[s] array of naive UTC datetimes (much faster than np.array(values, dtype=...))"""
+    seconds = np.fromiter(((value - EPOCH).total_seconds() for value in values), dtype=float, count=len(values))
+    return seconds.astype(np.int64).astype('datetime64[s]')
+
+
+def _columns(rows, count: int) -> List[tuple]:
+    """Result rows transposed to one tuple per column"""
+    return list(zip(*[tuple(row) for row in rows])) if rows else [()] * count
+
+
+def _day_labels(first_day: np.datetime64, n_days: int) -> List[str]:
+    return [str(day) for day in np.datetime_as_string(first_day + np.arange(n_days), unit='D')]
+
+
+def _number(value, digits: int = 2):
+    """JSON-safe rounded float; None for NaN/inf"""
+    if value is None:
+        return None
+    value = float(value)
+    return round(value, digits) if np.isfinite(value) else None
+
+
+def _numbers(values, digits: int = 2) -> List:
+    return [_number(value, digits) for value in values]
+
+
+def _max_run(mask: np.ndarray) -> int:
+    """Length of the longest run of True"""
+    if not mask.any():
+        return 0
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return int((np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)).max())
+
+
+def _forward_fill(values: np.ndarray) -> np.ndarray:
+    index = np.where(np.isnan(values), 0, np.arange(len(values)))
+    np.maximum.accumulate(index, out=index)
+    return values[index]
+
+
+class TradeHistory:
+    """Closed positions and trades of one window as NumPy arrays, loaded once"""
+    
+    def __init__(self, days: Optional[int], now: datetime = None):
+        self.days = days
+        self.now = now or datetime.utcnow()
+        self.start = self.now - timedelta(days=days) if days else None
+        self._load_positions()
+        self._load_trades()
+        self._load_before_window()
+        
+        today = np.datetime64(self.now, 'D')
+        if self.start is not None:
+            self.first_day = np.datetime64(self.start, 'D')
+        elif len(self.exit_time):
+            self.first_day = self.exit_time.min().astype('datetime64[D]')
+        else:
+            self.first_day = today
+        self.n_days = int((today - self.first_day).astype(np.int64)) + 1
+    
+    def _load_positions(self):
+        statement = select(
+            Position.exit_date, Coin.original_symbol, Position.quantity, Position.entry_price,
+            func.coalesce(Position.realized_pnl, 0.0), func.coalesce(Position.fees_paid, 0.0)
+        ).join(Coin, Position.coin_id == Coin.id).where(
+            Position.status == 'closed', Position.exit_date.isnot(None)
+        ).order_by(Position.exit_date, Position.id)
+        if self.start is not None:
+            statement = statement.where(Position.exit_date >= self.start)
+        
+        columns = _columns(db.session.execute(statement).all(), 6)
+        self.exit_time = _datetimes(columns[0])
+        self.symbol = np.array(columns[1], dtype=object)
+        self.cost = np.array(columns[2], dtype=float) * np.array(columns[3], dtype=float)
+        self.pnl = np.array(columns[4], dtype=float)
+        self.fees = np.array(columns[5], dtype=float)
+    
+    def _load_trades(self):
+        statement = select(Trade.executed_at, Trade.total_value).where(Trade.executed_at.isnot(None))
+        if self.start is not None:
+            statement = statement.where(Trade.executed_at >= self.start)
+        columns = _columns(db.session.execute(statement).all(), 2)
+        self.trade_time = _datetimes(columns[0])
+        self.trade_value = np.array(columns[1], dtype=float)
+    
+    def _load_before_window(self):
+        """Realized P&L before the window (for the starting equity) and in the period just before it"""
+        self.pnl_before = 0.0
+        self.previous_pnl = 0.0
+        if self.start is None:
+            return
+        
+        pnl = func.coalesce(Position.realized_pnl, 0.0)
+        previous_start = self.start - timedelta(days=self.days)
+        row = db.session.query(
+            func.sum(pnl),
+            func.sum(case((Position.exit_date >= previous_start, pnl), else_=0.0))
+        ).filter(Position.status == 'closed', Position.exit_date < self.start).one()
+        self.pnl_before = float(row[0] or 0)
+        self.previous_pnl = float(row[1] or 0)
+    
+    def day_index(self, times: np.ndarray) -> np.ndarray:
+        index = (times.astype('datetime64[D]') - self.first_day).astype(np.int64)
+        return np.clip(index, 0, self.n_days - 1)
+
+
+class AnalyticsEngine:
+    """Trading analytics computed with NumPy over the closed position history
+    
+    Each window's positions and trades are loaded once into arrays and every
+    metric of the analytics page is computed from them in vectorized form.
+    Results are cached per (report, window) and data version, so repeated
+    page loads cost nothing until a transaction changes data; `max_age`
+    bounds how long a result is served while the window slides.
+    """
+    
+    def __init__(self, starting_capital: float = 1000.0, cache_entries: int = 32, max_age: float = 300,
+                 signal_horizon_hours: float = 4, benchmark_symbol: str = 'BTC_USDT'):
+        self.starting_capital = starting_capital
+        self.cache_entries = cache_entries
+        self.max_age = max_age  # seconds
+        self.signal_horizon_hours = signal_horizon_hours
+        self.benchmark_symbol = benchmark_symbol
+        self._cache: 'OrderedDict[Tuple, Tuple[int, float, Dict]]' = OrderedDict()  # key -> (version, built, result)
+        self._lock = threading.Lock()
+        
+        # Counters
+        self.hits = 0
+        self.builds = 0
+    
+    def init_app(self, app):
+        self.starting_capital = app.config.get('ANALYTICS_STARTING_CAPITAL', self.starting_capital)
+        self.cache_entries = app.config.get('ANALYTICS_CACHE_ENTRIES', self.cache_entries)
+        self.max_age = app.config.get('ANALYTICS_CACHE_MAX_AGE', self.max_age)
+        self.signal_horizon_hours = app.config.get('ANALYTICS_SIGNAL_HORIZON_HOURS', self.signal_horizon_hours)
+        self.benchmark_symbol = app.config.get('ANALYTICS_BENCHMARK_SYMBOL', self.benchmark_symbol)
+    
+    def _cached(self, key: Tuple, build: Callable[[], Dict]) -> Dict:
+        version = get_data_version()  # Read before building so a concurrent write makes the result stale
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == version and time.monotonic() - cached[1] <= self.max_age:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached[2]
+        
+        result = build()
+        with self._lock:
+            self._cache[key] = (version, time.monotonic(), result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+            self.builds += 1
+        return result
+    
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+    
+    # Reports
+    
+    def report(self, days: Optional[int]) -> Dict:
+        """Performance, trade analysis and risk metrics of one window, from one load of its history"""
+        return self._cached(('report', days), lambda: self._build_report(TradeHistory(days)))
+    
+    def performance(self, days: Optional[int]) -> Dict:
+        return self.report(days)['performance']
+    
+    def trade_analysis(self, days: Optional[int]) -> Dict:
+        return self.report(days)['trade_analysis']
+    
+    def risk_metrics(self, days: Optional[int]) -> Dict:
+        return self.report(days)['risk']
+    
+    def signal_performance(self, days: Optional[int]) -> Dict:
+        return self._cached(('signals', days), lambda: self._build_signals(days))
+    
+    def allocation(self) -> Dict:
+        return self._cached(('allocation',), self._build_allocation)
+    
+    def _build_report(self, history: TradeHistory) -> Dict:
+        pnl = history.pnl
+        n_days = history.n_days
+        start_equity = self.starting_capital + history.pnl_before
+        
+        # Daily series
+        daily_pnl = np.bincount(history.day_index(history.exit_time), weights=pnl, minlength=n_days)
+        daily_volume = np.bincount(history.day_index(history.trade_time), weights=history.trade_value,
+                                   minlength=n_days)
+        cumulative_pnl = np.cumsum(daily_pnl)
+        equity = start_equity + cumulative_pnl
+        previous_equity = np.concatenate(([start_equity], equity[:-1]))
+        daily_returns = np.divide(daily_pnl, previous_equity, out=np.zeros(n_days), where=previous_equity > 0)
+        
+        peak = np.maximum.accumulate(np.concatenate(([start_equity], equity)))[1:]
+        drawdown_amount = equity - peak
+        drawdown = np.divide(drawdown_amount, peak, out=np.zeros(n_days), where=peak > 0) * 100
+        
+        # Trade statistics
+        total_trades = len(pnl)
+        wins = pnl > 0
+        losses = pnl < 0
+        total_pnl = float(pnl.sum())
+        gross_profit = float(pnl[wins].sum())
+        gross_loss = float(pnl[losses].sum())
+        
+        volatility = float(daily_returns.std(ddof=1)) if n_days > 1 else 0.0
+        sharpe = daily_returns.mean() / volatility * np.sqrt(TRADING_DAYS) if volatility > 0 else 0.0
+        total_return = total_pnl / start_equity if start_equity > 0 else 0.0
+        annualized = ((1 + total_return) ** (TRADING_DAYS / n_days) - 1) * 100 if total_return > -1 else -100.0
+        previous = history.previous_pnl
+        max_drawdown_amount = float(drawdown_amount.min()) if n_days else 0.0
+        
+        # Daily P&L tail risk (historical, 95%)
+        value_at_risk = float(np.percentile(daily_pnl, 5)) if n_days else 0.0
+        tail = daily_pnl[daily_pnl <= value_at_risk]
+        
+        # Monthly and per-asset breakdowns
+        months, month_index = np.unique(history.exit_time.astype('datetime64[M]'), return_inverse=True)
+        monthly_pnl = np.bincount(month_index, weights=pnl, minlength=len(months))
+        
+        dates = _day_labels(history.first_day, n_days)
+        return {
+            'performance': {
+                'total_pnl': _number(total_pnl),
+                'pnl_change': _number((total_pnl - previous) / abs(previous) * 100 if previous else 0),
+                'win_rate': _number(wins.sum() / total_trades * 100 if total_trades else 0),
+                'winning_trades': int(wins.sum()),
+                'total_trades': total_trades,
+                'avg_trade_size': _number(history.cost.mean() if total_trades else 0),
+                'total_fees': _number(history.fees.sum()),
+                'sharpe_ratio': _number(sharpe),
+                'dates': dates,
+                'cumulative_pnl': _numbers(cumulative_pnl),
+                'portfolio_values': _numbers(equity),
+                'daily_volume': _numbers(daily_volume)
+            },
+            'trade_analysis': {
+                'total_return': _number(total_pnl),
+                'total_return_percent': _number(total_return * 100),
+                'annualized_return': _number(annualized),
+                'max_drawdown': _number(drawdown.min() if n_days else 0),
+                'volatility': _number(volatility * np.sqrt(TRADING_DAYS) * 100),
+                'sharpe_ratio': _number(sharpe),
+                'total_trades': total_trades,
+                'winning_trades': int(wins.sum()),
+                'losing_trades': int(losses.sum()),
+                'avg_win': _number(pnl[wins].mean() if wins.any() else 0),
+                'avg_loss': _number(pnl[losses].mean() if losses.any() else 0),
+                'profit_factor': _number(gross_profit / -gross_loss) if gross_loss < 0 else None,
+                'monthly_labels': [str(month) for month in months],
+                'monthly_pnl': _numbers(monthly_pnl),
+                'top_assets': self._asset_breakdown(history.symbol, pnl)
+            },
+            'risk': {
+                'portfolio_beta': _number(self._beta(history, daily_returns)),
+                'value_at_risk': _number(value_at_risk),
+                'expected_shortfall': _number(tail.mean() if len(tail) else 0),
+                'max_consecutive_losses': _max_run(losses),
+                'current_drawdown': _number(drawdown[-1] if n_days else 0),
+                'recovery_factor': _number(total_pnl / -max_drawdown_amount) if max_drawdown_amount < 0 else None,
+                'position_size_vs_pnl': [{'x': x, 'y': y} for x, y in
+                                         zip(_numbers(history.cost[-500:]), _numbers(pnl[-500:]))],
+                'dates': dates,
+                'drawdown_series': _numbers(drawdown)
+            }
+        }
+    
+    @staticmethod
+    def _asset_breakdown(symbols: np.ndarray, pnl: np.ndarray, limit: int = 10) -> List[Dict]:
+        if not len(pnl):
+            return []
+        assets, index = np.unique(symbols.astype(str), return_inverse=True)
+        trades = np.bincount(index, minlength=len(assets))
+        wins = np.bincount(index, weights=pnl > 0, minlength=len(assets))
+        totals = np.bincount(index, weights=pnl, minlength=len(assets))
+        order = np.argsort(-totals)[:limit]
+        return [{
+            'symbol': str(assets[i]),
+            'trades': int(trades[i]),
+            'win_rate': _number(wins[i] / trades[i] * 100, 1),
+            'total_pnl': _number(totals[i]),
+            'avg_pnl': _number(totals[i] / trades[i])
+        } for i in order]
+    
+    def _beta(self, history: TradeHistory, daily_returns: np.ndarray) -> Optional[float]:
+        """Beta of daily portfolio returns against the benchmark coin's daily closes"""
+        closes = self._daily_closes(history)
+        if closes is None:
+            return None
+        benchmark = closes[1:] / closes[:-1] - 1
+        portfolio = daily_returns[1:]
+        valid = np.isfinite(benchmark)
+        if valid.sum() < 2 or benchmark[valid].var() == 0:
+            return None
+        return float(np.cov(portfolio[valid], benchmark[valid])[0, 1] / benchmark[valid].var(ddof=1))
+    
+    def _daily_closes(self, history: TradeHistory) -> Optional[np.ndarray]:
+        """Last known benchmark price of each day of the window, from rollups and raw analyses"""
+        coin_id = db.session.query(Coin.id).filter_by(symbol=self.benchmark_symbol).scalar()
+        if coin_id is None:
+            return None
+        
+        start = history.first_day.astype('datetime64[s]').astype(datetime)
+        rollups = db.session.execute(
+            select(AnalysisRollup.last_timestamp, AnalysisRollup.close_price)
+            .where(AnalysisRollup.coin_id == coin_id, AnalysisRollup.last_timestamp >= start)
+        ).all()
+        raw = db.session.execute(
+            select(TechnicalAnalysis.timestamp, TechnicalAnalysis.last_price)
+            .where(TechnicalAnalysis.coin_id == coin_id, TechnicalAnalysis.timestamp >= start)
+        ).all()
+        rows = [row for row in rollups + raw if row[1]]
+        if not rows:
+            return None
+        
+        times, prices = _columns(rows, 2)
+        times = _datetimes(times)
+        prices = np.array(prices, dtype=float)
+        order = np.argsort(times, kind='stable')
+        days = history.day_index(times[order])
+        
+        # Last price of each day: first occurrence of each day in the reversed order
+        last_days, first_in_reversed = np.unique(days[::-1], return_index=True)
+        closes = np.full(history.n_days, np.nan)
+        closes[last_days] = prices[order][::-1][first_in_reversed]
+        return _forward_fill(closes)
+    
+    def _build_signals(self, days: Optional[int]) -> Dict:
+        """Forward returns of BUY/SELL signals after the signal horizon
+        
+        Uses the raw analyses still kept by the retention engine, so the
+        evaluated period is at most the raw retention window.
+        """
+        since = datetime.utcnow() - timedelta(days=days) if days else None
+        horizon = int(self.signal_horizon_hours * 3600)
+        
+        signal_coins = select(TechnicalAnalysis.coin_id).where(TechnicalAnalysis.action.in_(SIGNAL_ACTIONS))
+        statement = select(
+            TechnicalAnalysis.coin_id, TechnicalAnalysis.timestamp, TechnicalAnalysis.last_price,
+            TechnicalAnalysis.action
+        ).order_by(TechnicalAnalysis.coin_id, TechnicalAnalysis.timestamp, TechnicalAnalysis.id)
+        if since is not None:
+            statement = statement.where(TechnicalAnalysis.timestamp >= since)
+            signal_coins = signal_coins.where(TechnicalAnalysis.timestamp >= since)
+        rows = db.session.execute(statement.where(TechnicalAnalysis.coin_id.in_(signal_coins.distinct()))).all()
+        
+        action_counts = dict(db.session.execute(
+            select(TechnicalAnalysis.action, func.count()).where(
+                *([TechnicalAnalysis.timestamp >= since] if since is not None else [])
+            ).group_by(TechnicalAnalysis.action)
+        ).all())
+        distribution = [0, action_counts.get('BUY', 0), action_counts.get('WAIT', 0), action_counts.get('SELL', 0), 0]
+        
+        if not rows:
+            return {'dates': [], 'accuracy_over_time': [], 'signal_distribution': distribution,
+                    'signal_performance': [], 'horizon_hours': self.signal_horizon_hours, 'evaluated_since': None}
+        
+        coin_ids, times, prices, actions = _columns(rows, 4)
+        coins, coin_rank = np.unique(np.array(coin_ids), return_inverse=True)
+        seconds = _datetimes(times).astype(np.int64)
+        prices = np.array([price or np.nan for price in prices], dtype=float)
+        actions = np.array(actions, dtype=object)
+        
+        # One sorted key per row: (coin, time) packed into an int so searchsorted finds the row at t + horizon
+        origin = seconds.min()
+        span = int(seconds.max() - origin) + horizon + 1
+        keys = coin_rank * span + (seconds - origin)
+        
+        is_signal = np.isin(actions, SIGNAL_ACTIONS)
+        signal_keys = keys[is_signal]
+        target = np.searchsorted(keys, signal_keys + horizon)
+        evaluated = target < len(keys)
+        target = np.minimum(target, len(keys) - 1)
+        evaluated &= coin_rank[target] == coin_rank[is_signal]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            forward = prices[target] / prices[is_signal] - 1
+        evaluated &= np.isfinite(forward)
+        signal_actions = actions[is_signal]
+        success = np.where(signal_actions == 'BUY', forward > 0, forward < 0) & evaluated
+        
+        executed = self._executed_signals(coins, span, origin, signal_keys, signal_actions)
+        
+        # Daily accuracy of the evaluated signals
+        first_day = np.datetime64(since or min(times), 'D')
+        n_days = int((np.datetime64(datetime.utcnow(), 'D') - first_day).astype(np.int64)) + 1
+        signal_days = np.clip(((seconds[is_signal] // 86400) - first_day.astype(np.int64)), 0, n_days - 1)
+        evaluated_per_day = np.bincount(signal_days[evaluated], minlength=n_days)
+        success_per_day = np.bincount(signal_days[success], minlength=n_days)
+        accuracy = np.divide(success_per_day * 100.0, evaluated_per_day, out=np.full(n_days, np.nan),
+                             where=evaluated_per_day > 0)
+        
+        performance = []
+        for action in SIGNAL_ACTIONS:
+            mask = signal_actions == action
+            measured = mask & evaluated
+            performance.append({
+                'type': action,
+                'total_signals': int(mask.sum()),
+                'executed': int((mask & executed).sum()),
+                'evaluated': int(measured.sum()),
+                'success_rate': _number(success[mask].sum() / measured.sum() * 100 if measured.any() else 0, 1),
+                'avg_return': _number(forward[measured].mean() * 100 if measured.any() else 0)
+            })
+        
+        return {
+            'dates': _day_labels(first_day, n_days),
+            'accuracy_over_time': _numbers(accuracy, 1),
+            'signal_distribution': distribution,
+            'signal_performance': performance,
+            'horizon_hours': self.signal_horizon_hours,
+            'evaluated_since': min(times).isoformat()
+        }
+    
+    @staticmethod
+    def _executed_signals(coins: np.ndarray, span: int, origin: int, signal_keys: np.ndarray,
+                          signal_actions: np.ndarray) -> np.ndarray:
+        """Whether a position was opened (BUY) or closed (SELL) on the coin shortly after each signal"""
+        executed = np.zeros(len(signal_keys), dtype=bool)
+        window = int(SIGNAL_EXECUTION_WINDOW.total_seconds())
+        start = datetime.utcfromtimestamp(int(origin))
+        
+        for action, column in (('BUY', Position.entry_date), ('SELL', Position.exit_date)):
+            rows = db.session.execute(
+                select(Position.coin_id, column).where(column >= start, Position.coin_id.in_(coins.tolist()))
+            ).all()
+            mask = signal_actions == action
+            if not rows or not mask.any():
+                continue
+            
+            coin_ids, times = _columns(rows, 2)
+            rank = np.searchsorted(coins, np.array(coin_ids))
+            event_keys = np.sort(rank * span + (_datetimes(times).astype(np.int64) - origin))
+            keys = signal_keys[mask]
+            found = np.searchsorted(event_keys, keys + window, side='right') - np.searchsorted(event_keys, keys)
+            executed[mask] = found > 0
+        return executed
+    
+    def _build_allocation(self) -> Dict:
+        """Market value of the open positions per coin"""
+        value = func.sum(Position.quantity * func.coalesce(Position.current_price, Position.entry_price))
+        rows = db.session.query(Coin.original_symbol, value).join(Coin, Position.coin_id == Coin.id)\
+            .filter(Position.status == 'open').group_by(Coin.original_symbol).order_by(value.desc()).all()
+        
+        symbols = [symbol for symbol, _ in rows]
+        values = np.array([total or 0 for _, total in rows], dtype=float)
+        total = values.sum()
+        return {
+            'symbols': symbols,
+            'values': _numbers(values),
+            'percentages': _numbers(values / total * 100 if total > 0 else np.zeros(len(values))),
+            'total_value': _number(total)
+        }
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._cache),
+                'hits': self.hits,
+                'builds': self.builds,
+                'data_version': get_data_version()
+            }
+
+
+# Shared engine, bound to the app in app.py
+analytics_engine = AnalyticsEngine()
@@ -0,0 +1,632 @@
+import os
+import asyncio
+import logging
+import threading
+import functools
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from models import SystemLog
+from services.crypto_exchange import CryptoExchangeAPI
+from services.market_data import PriceTable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 100  # Keep-alive connections to the exchange
+DEFAULT_MAX_IN_FLIGHT = 5000  # Requests awaiting a rate limit slot or a response
+
+
+class AsyncCryptoExchangeAPI(CryptoExchangeAPI):
+    """Asyncio Crypto.com Exchange API client
+    
+    Same methods and return values as CryptoExchangeAPI, but every network
+    call is a coroutine. Requests share one aiohttp session with a pool of
+    keep-alive connections, and wait for the process-wide rate limiter with
+    asyncio.sleep, so thousands of requests can be in flight on one event
+    loop while the exchange limits are still respected.
+    
+    The session is bound to the event loop that first uses the client.
+    """
+    
+    def __init__(self, api_key: str = None, api_secret: str = None, sandbox: bool = True,
+                 pool_size: int = None, max_in_flight: int = None, **kwargs):
+        super().__init__(api_key=api_key, api_secret=api_secret, sandbox=sandbox, **kwargs)
+        self.pool_size = pool_size or int(os.getenv('EXCHANGE_POOL_SIZE', DEFAULT_POOL_SIZE))
+        self.max_in_flight = max_in_flight or int(os.getenv('EXCHANGE_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT))
+        
+        # Created on first use, inside the event loop
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._in_flight_slots: Optional[asyncio.Semaphore] = None
+        self._snapshot_lock: Optional[asyncio.Lock] = None
+        self._instruments_lock: Optional[asyncio.Lock] = None
+        
+        # Counters
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+    
+    def _get_http(self) -> aiohttp.ClientSession:
+        if self._http is None or self._http.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30, ttl_dns_cache=300)
+            self._http = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+            self._in_flight_slots = asyncio.Semaphore(self.max_in_flight)
+            self._snapshot_lock = asyncio.Lock()
+            self._instruments_lock = asyncio.Lock()
+        return self._http
+    
+    async def close(self):
+        """Close the connection pool"""
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
+        self._http = None
+    
+    async def __aenter__(self):
+        self._get_http()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+    
+    async def _wait_for_rate_limit(self, endpoint: str):
+        """Reserve a token from the endpoint's bucket and sleep until it is due"""
+        wait = self.rate_limiter.reserve(endpoint)
+        if wait > 0:
+            await asyncio.sleep(wait)
+    
+    async def _make_request(self, method: str, endpoint: str, params: dict = None,
+                            data: dict = None, authenticated: bool = False) -> dict:
+        """Make HTTP request to the API"""
+        http = self._get_http()
+        async with self._in_flight_slots:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                await self._wait_for_rate_limit(endpoint)
+                
+                url, headers, body = self._prepare_request(method, endpoint, params, data, authenticated)
+                if params:
+                    # aiohttp only accepts str, int and float query values
+                    params = {key: value if isinstance(value, (int, float)) else str(value)
+                              for key, value in params.items()}
+                
+                try:
+                    async with http.request(method, url, params=params, data=body or None,
+                                            headers=headers) as response:
+                        self.requests += 1
+                        self._log_response(method, endpoint, response.status, params, data, authenticated)
+                        
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+                
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self._log_request_error(method, endpoint, e, params, data)
+                    raise
+            finally:
+                self.in_flight -= 1
+    
+    async def test_connection(self) -> bool:
+        """Test API connection"""
+        try:
+            response = await self._make_request('GET', '/public/get-instruments')
+            return response.get('code') == 0
+        except Exception as e:
+            logger.error(f"Connection test failed: {str(e)}")
+            return False
+    
+    async def get_instruments(self) -> List[dict]:
+        """Get available trading instruments"""
+        try:
+            response = await self._make_request('GET', '/public/get-instruments')
+            if response.get('code') == 0:
+                return response.get('result', {}).get('data', [])
+            else:
+                logger.error(f"Failed to get instruments: {response}")
+                return []
+        except Exception as e:
+            logger.error(f"Error getting instruments: {str(e)}")
+            return []
+    
+    async def get_ticker(self, instrument_name: str) -> Optional[dict]:
+        """Get ticker information for an instrument"""
+        try:
+            params = {'instrument_name': instrument_name}
+            response = await self._make_request('GET', '/public/get-ticker', params=params)
+            
+            if response.get('code') == 0:
+                data = response.get('result', {}).get('data', [])
+                return data[0] if data else None
+            else:
+                logger.error(f"Failed to get ticker for {instrument_name}: {response}")
+                return None
+        except Exception as e:
+            logger.error(f"Error getting ticker for {instrument_name}: {str(e)}")
+            return None
+    
+    async def get_tickers(self) -> List[dict]:
+        """Get tickers for every instrument in one request"""
+        try:
+            response = await self._make_request('GET', '/public/get-tickers')
+            
+            if response.get('code') == 0:
+                return response.get('result', {}).get('data', [])
+            else:
+                logger.error(f"Failed to get tickers: {response}")
+                return []
+        except Exception as e:
+            logger.error(f"Error getting tickers: {str(e)}")
+            return []
+    
+    async def get_ticker_snapshot(self, max_age: float = None) -> PriceTable:
+        """Get the shared price table, downloading a new snapshot if it is older than max_age"""
+        table = self.price_table
+        if not table.is_stale(max_age):
+            return table
+        
+        self._get_http()
+        async with self._snapshot_lock:
+            # Another task may have refreshed while we waited
+            if table.is_stale(max_age):
+                tickers = await self.get_tickers()
+                if tickers:
+                    table.update(tickers)
+                else:
+                    table.failures += 1
+        return table
+    
+    async def get_orderbook(self, instrument_name: str, depth: int = 10) -> Optional[dict]:
+        """Get orderbook for an instrument"""
+        try:
+            params = {
+                'instrument_name': instrument_name,
+                'depth': depth
+            }
+            response = await self._make_request('GET', '/public/get-book', params=params)
+            
+            if response.get('code') == 0:
+                data = response.get('result', {}).get('data', [])
+                return data[0] if data else None
+            else:
+                logger.error(f"Failed to get orderbook for {instrument_name}: {response}")
+                return None
+        except Exception as e:
+            logger.error(f"Error getting orderbook for {instrument_name}: {str(e)}")
+            return None
+    
+    async def get_candlestick_data(self, instrument_name: str, timeframe: str = '5m',
+                                   count: int = 100, start_ts: int = None,
+                                   end_ts: int = None) -> List[dict]:
+        """Get candlestick data for technical analysis"""
+        try:
+            params = {
+                'instrument_name': instrument_name,
+                'timeframe': timeframe,
+                'count': count
+            }
+            
+            if start_ts:
+                params['start_ts'] = start_ts
+            if end_ts:
+                params['end_ts'] = end_ts
+            response = await self._make_request('GET', '/public/get-candlestick', params=params)
+            
+            if response.get('code') == 0:
+                return response.get('result', {}).get('data', [])
+            else:
+                logger.error(f"Failed to get candlestick data for {instrument_name}: {response}")
+                return []
+        except Exception as e:
+            logger.error(f"Error getting candlestick data for {instrument_name}: {str(e)}")
+            return []
+    
+    # Authenticated endpoints
+    async def get_account_info(self) -> Optional[dict]:
+        """Get account information"""
+        try:
+            response = await self._make_request('POST', '/private/get-account-summary', authenticated=True)
+            
+            if response.get('code') == 0:
+                return response.get('result')
+            else:
+                logger.error(f"Failed to get account info: {response}")
+                return None
+        except Exception as e:
+            logger.error(f"Error getting account info: {str(e)}")
+            return None
+    
+    async def get_balance(self, currency: str = None) -> List[dict]:
+        """Get account balance"""
+        try:
+            data = {}
+            if currency:
+                data['currency'] = currency
+            
+            response = await self._make_request('POST', '/private/get-account-summary',
+                                                data=data, authenticated=True)
+            
+            if response.get('code') == 0:
+                accounts = response.get('result', {}).get('accounts', [])
+                if currency:
+                    return [acc for acc in accounts if acc.get('currency') == currency]
+                return accounts
+            else:
+                logger.error(f"Failed to get balance: {response}")
+                return []
+        except Exception as e:
+            logger.error(f"Error getting balance: {str(e)}")
+            return []
+    
+    async def place_order(self, instrument_name: str, side: str, type_: str,
+                          quantity: float, price: float = None, time_in_force: str = 'GTC',
+                          client_oid: str = None) -> Optional[dict]:
+        """Place a new order"""
+        try:
+            data = {
+                'instrument_name': instrument_name,
+                'side': side.upper(),  # BUY or SELL
+                'type': type_.upper(),  # LIMIT, MARKET, STOP_LOSS, STOP_LIMIT, TAKE_PROFIT, TAKE_PROFIT_LIMIT
+                'quantity': str(quantity),
+                'time_in_force': time_in_force
+            }
+            
+            if price:
+                data['price'] = str(price)
+            
+            if client_oid:
+                data['client_oid'] = client_oid
+            
+            response = await self._make_request('POST', '/private/create-order',
+                                                data=data, authenticated=True)
+            
+            if response.get('code') == 0:
+                result = response.get('result')
+                
+                SystemLog.log(
+                    level='INFO',
+                    category='TRADING',
+                    message=f"Order placed: {side} {quantity} {instrument_name}",
+                    details={
+                        'order_id': result.get('order_id'),
+                        'client_oid': result.get('client_oid'),
+                        'type': type_,
+                        'price': price
+                    }
+                )
+                
+                return result
+            else:
+                error_msg = f"Failed to place order: {response}"
+                logger.error(error_msg)
+                
+                SystemLog.log(
+                    level='ERROR',
+                    category='TRADING',
+                    message=error_msg,
+                    details={
+                        'instrument_name': instrument_name,
+                        'side': side,
+                        'type': type_,
+                        'quantity': quantity,
+                        'price': price
+                    }
+                )
+                
+                return None
+        except Exception as e:
+            error_msg = f"Error placing order: {str(e)}"
+            logger.error(error_msg)
+            
+            SystemLog.log(
+                level='ERROR',
+                category='TRADING',
+                message=error_msg,
+                details={
+                    'instrument_name': instrument_name,
+                    'side': side,
+                    'type': type_,
+                    'quantity': quantity,
+                    'price': price,
+                    'error': str(e)
+                }
+            )
+            
+            return None
+    
+    async def cancel_order(self, order_id: str) -> bool:
+        """Cancel an existing order"""
+        try:
+            data = {'order_id': order_id}
+            response = await self._make_request('POST', '/private/cancel-order',
+                                                data=data, authenticated=True)
+            
+            if response.get('code') == 0:
+                SystemLog.log(
+                    level='INFO',
+                    category='TRADING',
+                    message=f"Order cancelled: {order_id}"
+                )
+                return True
+            else:
+                logger.error(f"Failed to cancel order {order_id}: {response}")
+                return False
+        except Exception as e:
+            logger.error(f"Error cancelling order {order_id}: {str(e)}")
+            return False
+    
+    async def get_order_status(self, order_id: str) -> Optional[dict]:
+        """Get order status"""
+        try:
+            data = {'order_id': order_id}
+            response = await self._make_request('POST', '/private/get-order-detail',
+                                                data=data, authenticated=True)
+            
+            if response.get('code') == 0:
+                return response.get('result')
+            else:
+                logger.error(f"Failed to get order status for {order_id}: {response}")
+                return None
+        except Exception as e:
+            logger.error(f"Error getting order status for {order_id}: {str(e)}")
+            return None
+    
+    async def get_open_orders(self, instrument_name: str = None) -> List[dict]:
+        """Get open orders"""
+        try:
+            data = {}
+            if instrument_name:
+                data['instrument_name'] = instrument_name
+            
+            response = await self._make_request('POST', '/private/get-open-orders',
+                                                data=data, authenticated=True)
+            
+            if response.get('code') == 0:
+                return response.get('result', {}).get('order_list', [])
+            else:
+                logger.error(f"Failed to get open orders: {response}")
+                return []
+        except Exception as e:
+            logger.error(f"Error getting open orders: {str(e)}")
+            return []
+    
+    async def get_order_history(self, instrument_name: str = None,
+                                start_ts: int = None, end_ts: int = None,
+                                page_size: int = 100, page: int = 0) -> List[dict]:
+        """Get order history"""
+        try:
+            data = {
+                'page_size': page_size,
+                'page': page
+            }
+            
+            if instrument_name:
+                data['instrument_name'] = instrument_name
+            if start_ts:
+                data['start_ts'] = start_ts
+            if end_ts:
+                data['end_ts'] = end_ts
+            
+            response = await self._make_request('POST', '/private/get-order-history',
+                                                data=data, authenticated=True)
+            
+            if response.get('code') == 0:
+                return response.get('result', {}).get('order_list', [])
+            else:
+                logger.error(f"Failed to get order history: {response}")
+                return []
+        except Exception as e:
+            logger.error(f"Error getting order history: {str(e)}")
+            return []
+    
+    async def get_trades(self, instrument_name: str = None,
+                         start_ts: int = None, end_ts: int = None,
+                         page_size: int = 100, page: int = 0) -> List[dict]:
+        """Get trade history"""
+        try:
+            data = {
+                'page_size': page_size,
+                'page': page
+            }
+            
+            if instrument_name:
+                data['instrument_name'] = instrument_name
+            if start_ts:
+                data['start_ts'] = start_ts
+            if end_ts:
+                data['end_ts'] = end_ts
+            
+            response = await self._make_request('POST', '/private/get-trades',
+                                                data=data, authenticated=True)
+            
+            if response.get('code') == 0:
+                return response.get('result', {}).get('trade_list', [])
+            else:
+                logger.error(f"Failed to get trades: {response}")
+                return []
+        except Exception as e:
+            logger.error(f"Error getting trades: {str(e)}")
+            return []
+    
+    # Helper methods
+    async def _refresh_instruments_if_needed(self, instrument_name: str = None):
+        """Download the instrument list when the shared cache would, one task at a time"""
+        cache = self.instrument_cache
+        if not cache.wants_refresh(instrument_name):
+            return
+        
+        self._get_http()
+        async with self._instruments_lock:
+            if cache.wants_refresh(instrument_name):
+                instruments = await self.get_instruments()
+                cache.refresh(lambda: instruments)
+    
+    async def get_instrument(self, instrument_name: str) -> Optional[dict]:
+        """Get cached metadata for an instrument"""
+        await self._refresh_instruments_if_needed(instrument_name)
+        return self.instrument_cache.lookup(instrument_name)
+    
+    async def get_cached_instruments(self) -> List[dict]:
+        """Get all instruments from the metadata cache"""
+        await self._refresh_instruments_if_needed()
+        return list(self.instrument_cache.instruments.values())
+    
+    async def refresh_instruments(self) -> bool:
+        """Force a reload of the instrument metadata cache"""
+        instruments = await self.get_instruments()
+        return self.instrument_cache.refresh(lambda: instruments)
+    
+    async def get_minimum_order_size(self, instrument_name: str) -> float:
+        """Get minimum order size for an instrument"""
+        instrument = await self.get_instrument(instrument_name)
+        if instrument:
+            return float(instrument.get('min_quantity', 0))
+        return 0.0
+    
+    async def get_price_precision(self, instrument_name: str) -> int:
+        """Get price precision for an instrument"""
+        instrument = await self.get_instrument(instrument_name)
+        if instrument:
+            return int(instrument.get('price_decimals', 2))
+        return 2
+    
+    async def get_quantity_precision(self, instrument_name: str) -> int:
+        """Get quantity precision for an instrument"""
+        instrument = await self.get_instrument(instrument_name)
+        if instrument:
+            return int(instrument.get('quantity_decimals', 6))
+        return 6
+    
+    async def format_price(self, price: float, instrument_name: str) -> str:
+        """Format price according to instrument precision"""
+        precision = await self.get_price_precision(instrument_name)
+        return f"{price:.{precision}f}"
+    
+    async def format_quantity(self, quantity: float, instrument_name: str) -> str:
+        """Format quantity according to instrument precision"""
+        precision = await self.get_quantity_precision(instrument_name)
+        return f"{quantity:.{precision}f}"
+    
+    async def is_sufficient_balance(self, currency: str, required_amount: float) -> bool:
+        """Check if account has sufficient balance"""
+        try:
+            balances = await self.get_balance(currency)
+            if not balances:
+                return False
+            
+            available = float(balances[0].get('available', 0))
+            return available >= required_amount
+        except Exception as e:
+            logger.error(f"Error checking balance for {currency}: {str(e)}")
+            return False
+    
+    def stats(self) -> Dict:
+        return {
+            'pool_size': self.pool_size,
+            'max_in_flight': self.max_in_flight,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'requests': self.requests
+        }
+
+
+class EventLoopThread:
+    """An asyncio event loop running forever in a daemon thread
+    
+    Synchronous code hands coroutines to it with run() (blocking) or submit()
+    (returns a concurrent.futures.Future). Coroutines run in a copy of the
+    caller's context, so a Flask app context active in the caller is active
+    in the coroutine too.
+    """
+    
+    def __init__(self, name: str = 'exchange-loop'):
+        self.name = name
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+    
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+    
+    def in_loop_thread(self) -> bool:
+        return threading.current_thread() is self.thread
+    
+    def submit(self, coro):
+        """Schedule a coroutine on the loop; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+    
+    def run(self, coro, timeout: float = None):
+        """Run a coroutine on the loop and block until it returns"""
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError(f"Blocking call from the {self.name} thread would deadlock; await the coroutine instead")
+        return self.submit(coro).result(timeout)
+    
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+
+class SyncExchangeAPI:
+    """Blocking facade over AsyncCryptoExchangeAPI
+    
+    Exposes the CryptoExchangeAPI method surface for Flask routes and other
+    synchronous callers: coroutine methods run on the shared event loop
+    thread and block for the result, everything else is passed through.
+    Concurrent callers share the async client's connection pool.
+    """
+    
+    def __init__(self, async_api: AsyncCryptoExchangeAPI = None, loop_thread: EventLoopThread = None):
+        self.loop_thread = loop_thread or get_event_loop_thread()
+        self.async_api = async_api or AsyncCryptoExchangeAPI()
+    
+    def __getattr__(self, name):
+        attr = getattr(self.async_api, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+        
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            return self.loop_thread.run(attr(*args, **kwargs))
+        return call
+
+
+_shared_loop_thread = None
+_shared_exchange_api = None
+_shared_lock = threading.Lock()
+
+
+def get_event_loop_thread() -> EventLoopThread:
+    """Process-wide event loop thread for exchange I/O and async monitors"""
+    global _shared_loop_thread
+    with _shared_lock:
+        if _shared_loop_thread is None:
+            _shared_loop_thread = EventLoopThread()
+        return _shared_loop_thread
+
+
+def get_exchange_api():
+    """Exchange client for synchronous callers such as Flask routes
+    
+    The shared SyncExchangeAPI facade when EXCHANGE_ASYNC_CLIENT is enabled
+    (the default), otherwise a plain requests-based CryptoExchangeAPI.
+    """
+    global _shared_exchange_api
+    if os.getenv('EXCHANGE_ASYNC_CLIENT', 'true').lower() != 'true':
+        return CryptoExchangeAPI()
+    
+    loop_thread = get_event_loop_thread()
+    with _shared_lock:
+        if _shared_exchange_api is None:
+            _shared_exchange_api = SyncExchangeAPI(loop_thread=loop_thread)
+        return _shared_exchange_api
+
+
+def exchange_client_stats() -> Optional[Dict]:
+    """Stats for the shared async client, if it has been created"""
+    with _shared_lock:
+        if _shared_exchange_api is None:
+            return None
+        return _shared_exchange_api.async_api.stats()
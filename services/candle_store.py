@@ -0,0 +1,295 @@
+import os
+import re
+import time
+import asyncio
+import threading
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from services.crypto_exchange import CryptoExchangeAPI
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 'instance', 'candles')
+
+# Column name in the exchange payload -> column name in the analysis DataFrame
+COLUMNS = (('t', 't'), ('o', 'open'), ('h', 'high'), ('l', 'low'), ('c', 'close'), ('v', 'volume'))
+
+# Candle length in milliseconds per exchange timeframe
+TIMEFRAME_MS = {
+    '1m': 60000, '5m': 300000, '15m': 900000, '30m': 1800000,
+    '1h': 3600000, '2h': 7200000, '4h': 14400000, '6h': 21600000, '12h': 43200000,
+    '1D': 86400000, '7D': 604800000, '14D': 1209600000
+}
+
+
+class CandleSeries:
+    """Columnar candle history for one (instrument, timeframe)"""
+    
+    def __init__(self, columns: Dict[str, np.ndarray] = None):
+        columns = columns or {}
+        self.t = np.asarray(columns.get('t', []), dtype=np.int64)
+        self.o = np.asarray(columns.get('o', []), dtype=float)
+        self.h = np.asarray(columns.get('h', []), dtype=float)
+        self.l = np.asarray(columns.get('l', []), dtype=float)
+        self.c = np.asarray(columns.get('c', []), dtype=float)
+        self.v = np.asarray(columns.get('v', []), dtype=float)
+        self.dirty = False  # Candles changed since the last save
+    
+    def __len__(self):
+        return len(self.t)
+    
+    @property
+    def last_timestamp(self) -> Optional[int]:
+        return int(self.t[-1]) if len(self.t) else None
+    
+    def columns(self) -> Dict[str, np.ndarray]:
+        return {'t': self.t, 'o': self.o, 'h': self.h, 'l': self.l, 'c': self.c, 'v': self.v}
+    
+    def merge(self, candles: List[dict], max_candles: int) -> Tuple[int, int]:
+        """Merge exchange candles: revise the stored open candle and append newer ones
+        
+        Returns (revised, appended) counts. Candles older than the last stored one are ignored.
+        """
+        last_timestamp = self.last_timestamp
+        rows = {}
+        for candle in candles:
+            try:
+                timestamp = int(candle['t'])
+                if last_timestamp is None or timestamp >= last_timestamp:
+                    rows[timestamp] = tuple(float(candle[key]) for key, _ in COLUMNS[1:])
+            except (KeyError, TypeError, ValueError):
+                continue
+        
+        if not rows:
+            return 0, 0
+        
+        revised = 0
+        if last_timestamp in rows:
+            values = rows.pop(last_timestamp)
+            if values != (self.o[-1], self.h[-1], self.l[-1], self.c[-1], self.v[-1]):
+                self.o[-1], self.h[-1], self.l[-1], self.c[-1], self.v[-1] = values
+                self.dirty = True
+            revised = 1
+        
+        if rows:
+            timestamps = sorted(rows)
+            values = np.array([rows[timestamp] for timestamp in timestamps], dtype=float)
+            self.t = np.concatenate([self.t, np.array(timestamps, dtype=np.int64)])[-max_candles:]
+            self.o = np.concatenate([self.o, values[:, 0]])[-max_candles:]
+            self.h = np.concatenate([self.h, values[:, 1]])[-max_candles:]
+            self.l = np.concatenate([self.l, values[:, 2]])[-max_candles:]
+            self.c = np.concatenate([self.c, values[:, 3]])[-max_candles:]
+            self.v = np.concatenate([self.v, values[:, 4]])[-max_candles:]
+            self.dirty = True
+        
+        return revised, len(rows)
+    
+    def to_frame(self, count: int) -> pd.DataFrame:
+        """Latest `count` candles in the format TechnicalAnalysisService expects"""
+        df = pd.DataFrame({
+            name: getattr(self, key)[-count:] for key, name in COLUMNS
+        })
+        df['timestamp'] = pd.to_datetime(df['t'], unit='ms')
+        return df
+
+
+class CandleStore:
+    """Persistent local candlestick store keyed by (instrument, timeframe)
+    
+    Each series is kept in memory as numpy columns and saved as an .npz file.
+    Syncing only asks the exchange for candles from the last stored timestamp
+    onwards, so the still-open candle is revised and newer candles are appended
+    instead of re-downloading the whole window.
+    """
+    
+    def __init__(self, exchange_api: CryptoExchangeAPI = None, directory: str = None,
+                 max_candles: int = 1000, delta_count: int = 300):
+        self.exchange_api = exchange_api or CryptoExchangeAPI()
+        self.directory = directory or os.getenv('CANDLE_STORE_DIR', DEFAULT_STORE_DIR)
+        self.max_candles = max_candles  # Candles kept per series
+        self.delta_count = delta_count  # Max candles per delta request (exchange limit is 300)
+        
+        self._series: Dict[Tuple[str, str], CandleSeries] = {}
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._async_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        
+        os.makedirs(self.directory, exist_ok=True)
+        logger.info(f"Candle store initialized at {self.directory}")
+    
+    def _lock_for(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._locks_guard:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+    
+    def _async_lock_for(self, key: Tuple[str, str]) -> asyncio.Lock:
+        if key not in self._async_locks:
+            self._async_locks[key] = asyncio.Lock()
+        return self._async_locks[key]
+    
+    def _path_for(self, key: Tuple[str, str]) -> str:
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', f"{key[0]}__{key[1]}")
+        return os.path.join(self.directory, f"{name}.npz")
+    
+    def _load(self, key: Tuple[str, str]) -> CandleSeries:
+        """Load a series from memory or disk"""
+        series = self._series.get(key)
+        if series is not None:
+            return series
+        
+        path = self._path_for(key)
+        series = CandleSeries()
+        if os.path.exists(path):
+            try:
+                with np.load(path) as data:
+                    series = CandleSeries({key_: data[key_] for key_, _ in COLUMNS})
+            except Exception as e:
+                logger.error(f"Error loading candle store file {path}: {str(e)}")
+        
+        self._series[key] = series
+        return series
+    
+    def _save(self, key: Tuple[str, str], series: CandleSeries):
+        """Atomically write a series to disk"""
+        path = self._path_for(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **series.columns())
+            os.replace(tmp_path, path)
+            series.dirty = False
+        except Exception as e:
+            logger.error(f"Error saving candle store file {path}: {str(e)}")
+    
+    def _fetch_full(self, instrument_name: str, timeframe: str, count: int) -> CandleSeries:
+        candles = self.exchange_api.get_candlestick_data(
+            instrument_name=instrument_name,
+            timeframe=timeframe,
+            count=count
+        )
+        return self._full_series(candles, count)
+    
+    def _full_series(self, candles: List[dict], count: int) -> CandleSeries:
+        series = CandleSeries()
+        series.merge(candles, max(self.max_candles, count))
+        return series
+    
+    def _delta_request(self, series: CandleSeries, count: int) -> Optional[Dict]:
+        """Candle request parameters that bring a series up to date, None if a full fetch is needed"""
+        if len(series) < count:
+            # Not enough history stored yet
+            return None
+        return {'count': self.delta_count, 'start_ts': series.last_timestamp}
+    
+    def _merge_delta(self, instrument_name: str, timeframe: str, series: CandleSeries,
+                     candles: List[dict], count: int) -> bool:
+        """Merge delta candles into a series; False if they leave a gap after the stored history"""
+        timestamps = [int(candle['t']) for candle in candles if 't' in candle]
+        if not timestamps:
+            # Empty or failed delta: fine while the stored candle is still open, stale once the next one is due
+            interval = TIMEFRAME_MS.get(timeframe)
+            if interval and time.time() * 1000 >= series.last_timestamp + interval:
+                logger.info(f"Empty candle delta for {instrument_name} {timeframe}, refetching")
+                return False
+            return True
+        if min(timestamps) > series.last_timestamp:
+            # No overlap with the stored history, candles may be missing
+            logger.info(f"Candle gap detected for {instrument_name} {timeframe}, refetching")
+            return False
+        series.merge(candles, max(self.max_candles, count))
+        return True
+    
+    def _store(self, key: Tuple[str, str], series: CandleSeries):
+        self._series[key] = series
+        if series.dirty:
+            self._save(key, series)
+    
+    async def _store_async(self, key: Tuple[str, str], series: CandleSeries):
+        """_store() for an event loop, writing the .npz file on the default executor"""
+        self._series[key] = series
+        if series.dirty:
+            await asyncio.get_running_loop().run_in_executor(None, self._save, key, series)
+    
+    def sync(self, instrument_name: str, timeframe: str, count: int) -> CandleSeries:
+        """Bring a series up to date with the exchange, fetching only missing candles"""
+        key = (instrument_name, timeframe)
+        with self._lock_for(key):
+            series = self._load(key)
+            
+            delta = self._delta_request(series, count)
+            if delta is not None:
+                candles = self.exchange_api.get_candlestick_data(
+                    instrument_name=instrument_name,
+                    timeframe=timeframe,
+                    **delta
+                )
+                if not self._merge_delta(instrument_name, timeframe, series, candles, count):
+                    delta = None
+            
+            if delta is None:
+                fetched = self._fetch_full(instrument_name, timeframe, count)
+                if len(fetched):
+                    series = fetched
+            
+            self._store(key, series)
+            return series
+    
+    async def sync_async(self, instrument_name: str, timeframe: str, count: int, async_api) -> CandleSeries:
+        """sync() for an event loop, fetching through an AsyncCryptoExchangeAPI
+        
+        Concurrent syncs of one series on the loop are serialized by a per-series
+        asyncio.Lock. Only safe while a single event loop owns the store's series.
+        """
+        key = (instrument_name, timeframe)
+        async with self._async_lock_for(key):
+            series = self._load(key)
+            
+            delta = self._delta_request(series, count)
+            if delta is not None:
+                candles = await async_api.get_candlestick_data(
+                    instrument_name=instrument_name,
+                    timeframe=timeframe,
+                    **delta
+                )
+                if not self._merge_delta(instrument_name, timeframe, series, candles, count):
+                    delta = None
+            
+            if delta is None:
+                candles = await async_api.get_candlestick_data(
+                    instrument_name=instrument_name,
+                    timeframe=timeframe,
+                    count=count
+                )
+                fetched = self._full_series(candles, count)
+                if len(fetched):
+                    series = fetched
+            
+            await self._store_async(key, series)
+            return series
+    
+    def get_frame(self, instrument_name: str, timeframe: str, count: int) -> Optional[pd.DataFrame]:
+        """Get the latest `count` candles as a DataFrame, syncing with the exchange first"""
+        try:
+            series = self.sync(instrument_name, timeframe, count)
+            if not len(series):
+                return None
+            return series.to_frame(count)
+        except Exception as e:
+            logger.error(f"Error getting candles from store for {instrument_name}: {str(e)}")
+            return None
+
+    async def get_frame_async(self, instrument_name: str, timeframe: str, count: int,
+                              async_api) -> Optional[pd.DataFrame]:
+        """get_frame() for an event loop, fetching through an AsyncCryptoExchangeAPI"""
+        try:
+            series = await self.sync_async(instrument_name, timeframe, count, async_api)
+            if not len(series):
+                return None
+            return series.to_frame(count)
+        except Exception as e:
+            logger.error(f"Error getting candles from store for {instrument_name}: {str(e)}")
+            return None
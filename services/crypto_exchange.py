@@ -6,15 +6,19 @@ import requests
 import json
 import logging
 from typing import Dict, List, Optional, Tuple
-from datetime import datetime
-from models import db, SystemLog
+from models import SystemLog
+from services.rate_limiter import RateLimiter, get_rate_limiter
+from services.instrument_cache import InstrumentCache, get_instrument_cache
+from services.market_data import PriceTable, get_price_table
 
 logger = logging.getLogger(__name__)
 
 class CryptoExchangeAPI:
     """Crypto.com Exchange API Integration"""
     
-    def __init__(self, api_key: str = None, api_secret: str = None, sandbox: bool = True):
+    def __init__(self, api_key: str = None, api_secret: str = None, sandbox: bool = True,
+                 rate_limiter: RateLimiter = None, instrument_cache: InstrumentCache = None,
+                 price_table: PriceTable = None):
         self.api_key = api_key or os.getenv('CRYPTO_API_KEY')
         self.api_secret = api_secret or os.getenv('CRYPTO_API_SECRET')
         self.sandbox = sandbox
@@ -30,19 +34,20 @@ class CryptoExchangeAPI:
             'User-Agent': 'crypto-trading-webapp/1.0'
         })
         
-        # Rate limiting
-        self.last_request_time = 0
-        self.min_request_interval = 0.1  # 100ms between requests
+        # Rate limiting (process-wide token buckets per endpoint class)
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        
+        # Instrument metadata (shared by every client for the same environment)
+        self.instrument_cache = instrument_cache or get_instrument_cache(self.base_url)
+        
+        # Bulk ticker snapshot (shared by every client for the same environment)
+        self.price_table = price_table or get_price_table(self.base_url)
         
         logger.info(f"Crypto.com API initialized - Sandbox: {self.sandbox}")
     
-    def _wait_for_rate_limit(self):
-        """Ensure minimum time between requests"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-        if time_since_last < self.min_request_interval:
-            time.sleep(self.min_request_interval - time_since_last)
-        self.last_request_time = time.time()
+    def _wait_for_rate_limit(self, endpoint: str):
+        """Wait for a token from the endpoint's rate limit bucket"""
+        self.rate_limiter.acquire(endpoint)
     
     def _generate_signature(self, method: str, path: str, params: dict = None, body: str = "") -> str:
         """Generate signature for authenticated requests"""
@@ -69,13 +74,11 @@ class CryptoExchangeAPI:
         
         return signature, nonce
     
-    def _make_request(self, method: str, endpoint: str, params: dict = None, 
-                     data: dict = None, authenticated: bool = False) -> dict:
-        """Make HTTP request to the API"""
-        self._wait_for_rate_limit()
-        
+    def _prepare_request(self, method: str, endpoint: str, params: dict = None,
+                         data: dict = None, authenticated: bool = False) -> Tuple[str, dict, str]:
+        """Build the URL, headers and JSON body for a request, signing it if required"""
         url = f"{self.base_url}{endpoint}"
-        headers = self.session.headers.copy()
+        headers = dict(self.session.headers)
         
         # Prepare request body
         body = ""
@@ -94,6 +97,51 @@ class CryptoExchangeAPI:
                 'nonce': nonce
             })
         
+        return url, headers, body
+    
+    def _log_response(self, method: str, endpoint: str, status_code: int, params: dict = None,
+                      data: dict = None, authenticated: bool = False):
+        """Log a completed request and report 429s to the rate limiter"""
+        SystemLog.log(
+            level='INFO',
+            category='API',
+            message=f"API Request: {method} {endpoint}",
+            details={
+                'status_code': status_code,
+                'authenticated': authenticated,
+                'params': params,
+                'data': data
+            }
+        )
+        
+        if status_code == 429:
+            self.rate_limiter.record_rejection(endpoint)
+    
+    def _log_request_error(self, method: str, endpoint: str, error: Exception, params: dict = None,
+                           data: dict = None):
+        error_msg = f"API request failed: {method} {endpoint} - {str(error)}"
+        logger.error(error_msg)
+        
+        SystemLog.log(
+            level='ERROR',
+            category='API',
+            message=error_msg,
+            details={
+                'method': method,
+                'endpoint': endpoint,
+                'error': str(error),
+                'params': params,
+                'data': data
+            }
+        )
+    
+    def _make_request(self, method: str, endpoint: str, params: dict = None, 
+                     data: dict = None, authenticated: bool = False) -> dict:
+        """Make HTTP request to the API"""
+        self._wait_for_rate_limit(endpoint)
+        
+        url, headers, body = self._prepare_request(method, endpoint, params, data, authenticated)
+        
         try:
             response = self.session.request(
                 method=method,
@@ -104,39 +152,13 @@ class CryptoExchangeAPI:
                 timeout=30
             )
             
-            # Log request
-            SystemLog.log(
-                level='INFO',
-                category='API',
-                message=f"API Request: {method} {endpoint}",
-                details={
-                    'status_code': response.status_code,
-                    'authenticated': authenticated,
-                    'params': params,
-                    'data': data
-                }
-            )
+            self._log_response(method, endpoint, response.status_code, params, data, authenticated)
             
             response.raise_for_status()
             return response.json()
             
         except requests.exceptions.RequestException as e:
-            error_msg = f"API request failed: {method} {endpoint} - {str(e)}"
-            logger.error(error_msg)
-            
-            SystemLog.log(
-                level='ERROR',
-                category='API',
-                message=error_msg,
-                details={
-                    'method': method,
-                    'endpoint': endpoint,
-                    'error': str(e),
-                    'params': params,
-                    'data': data
-                }
-            )
-            
+            self._log_request_error(method, endpoint, e, params, data)
             raise
     
     def test_connection(self) -> bool:
@@ -177,6 +199,36 @@ class CryptoExchangeAPI:
             logger.error(f"Error getting ticker for {instrument_name}: {str(e)}")
             return None
     
+    def get_tickers(self) -> List[dict]:
+        """Get tickers for every instrument in one request"""
+        try:
+            response = self._make_request('GET', '/public/get-tickers')
+            
+            if response.get('code') == 0:
+                return response.get('result', {}).get('data', [])
+            else:
+                logger.error(f"Failed to get tickers: {response}")
+                return []
+        except Exception as e:
+            logger.error(f"Error getting tickers: {str(e)}")
+            return []
+    
+    def get_ticker_snapshot(self, max_age: float = None) -> PriceTable:
+        """Get the shared price table, downloading a new snapshot if it is older than max_age"""
+        table = self.price_table
+        if not table.is_stale(max_age):
+            return table
+        
+        with table.refresh_lock:
+            # Another thread may have refreshed while we waited
+            if table.is_stale(max_age):
+                tickers = self.get_tickers()
+                if tickers:
+                    table.update(tickers)
+                else:
+                    table.failures += 1
+        return table
+    
     def get_orderbook(self, instrument_name: str, depth: int = 10) -> Optional[dict]:
         """Get orderbook for an instrument"""
         try:
@@ -197,7 +249,8 @@ class CryptoExchangeAPI:
             return None
     
     def get_candlestick_data(self, instrument_name: str, timeframe: str = '5m', 
-                           count: int = 100) -> List[dict]:
+                           count: int = 100, start_ts: int = None,
+                           end_ts: int = None) -> List[dict]:
         """Get candlestick data for technical analysis"""
         try:
             params = {
@@ -205,6 +258,11 @@ class CryptoExchangeAPI:
                 'timeframe': timeframe,
                 'count': count
             }
+            
+            if start_ts:
+                params['start_ts'] = start_ts
+            if end_ts:
+                params['end_ts'] = end_ts
             response = self._make_request('GET', '/public/get-candlestick', params=params)
             
             if response.get('code') == 0:
@@ -444,28 +502,37 @@ class CryptoExchangeAPI:
             return []
     
     # Helper methods
+    def get_instrument(self, instrument_name: str) -> Optional[dict]:
+        """Get cached metadata for an instrument"""
+        return self.instrument_cache.get(instrument_name, self.get_instruments)
+    
+    def get_cached_instruments(self) -> List[dict]:
+        """Get all instruments from the metadata cache"""
+        return self.instrument_cache.all(self.get_instruments)
+    
+    def refresh_instruments(self) -> bool:
+        """Force a reload of the instrument metadata cache"""
+        return self.instrument_cache.refresh(self.get_instruments)
+    
     def get_minimum_order_size(self, instrument_name: str) -> float:
         """Get minimum order size for an instrument"""
-        instruments = self.get_instruments()
-        for instrument in instruments:
-            if instrument.get('instrument_name') == instrument_name:
-                return float(instrument.get('min_quantity', 0))
+        instrument = self.get_instrument(instrument_name)
+        if instrument:
+            return float(instrument.get('min_quantity', 0))
         return 0.0
     
     def get_price_precision(self, instrument_name: str) -> int:
         """Get price precision for an instrument"""
-        instruments = self.get_instruments()
-        for instrument in instruments:
-            if instrument.get('instrument_name') == instrument_name:
-                return int(instrument.get('price_decimals', 2))
+        instrument = self.get_instrument(instrument_name)
+        if instrument:
+            return int(instrument.get('price_decimals', 2))
         return 2
     
     def get_quantity_precision(self, instrument_name: str) -> int:
         """Get quantity precision for an instrument"""
-        instruments = self.get_instruments()
-        for instrument in instruments:
-            if instrument.get('instrument_name') == instrument_name:
-                return int(instrument.get('quantity_decimals', 6))
+        instrument = self.get_instrument(instrument_name)
+        if instrument:
+            return int(instrument.get('quantity_decimals', 6))
         return 6
     
     def format_price(self, price: float, instrument_name: str) -> str:
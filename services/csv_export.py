@@ -0,0 +1,135 @@
+import csv
+import zlib
+import logging
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional, Sequence
+from flask import Response, stream_with_context
+from sqlalchemy import or_
+from models import db, Coin
+
+logger = logging.getLogger(__name__)
+
+
+class _LineBuffer:
+    """File-like target for csv.writer that hands back what was written"""
+    
+    def __init__(self):
+        self.parts: List[str] = []
+    
+    def write(self, text: str):
+        self.parts.append(text)
+    
+    def take(self) -> str:
+        text = ''.join(self.parts)
+        self.parts = []
+        return text
+
+
+def keyset_rows(statement, key_column, chunk_size: int = 1000) -> Iterator:
+    """Rows of a select in key order, read in keyset-paginated chunks
+    
+    Each chunk is its own bounded query (key > last key seen) fetched with
+    yield_per, so neither the database cursor nor the session holds more
+    than one chunk however many rows the statement matches.
+    """
+    last_key = None
+    while True:
+        chunk = statement
+        if last_key is not None:
+            chunk = chunk.where(key_column > last_key)
+        chunk = chunk.order_by(key_column).limit(chunk_size).execution_options(yield_per=chunk_size)
+        
+        count = 0
+        for row in db.session.execute(chunk):
+            last_key = row._mapping[key_column.key]
+            count += 1
+            yield row
+        if count < chunk_size:
+            return
+
+
+def stream_csv(header: Sequence[str], rows: Iterator, format_row: Callable[..., Sequence],
+               flush_rows: int = 500) -> Iterator[str]:
+    """CSV text in pieces of about `flush_rows` rows"""
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    
+    pending = 0
+    try:
+        for row in rows:
+            writer.writerow(format_row(row))
+            pending += 1
+            if pending >= flush_rows:
+                yield buffer.take()
+                pending = 0
+    except Exception as e:
+        # Headers are already sent; the client sees a truncated file
+        logger.error(f"Error streaming CSV export: {str(e)}")
+        raise
+    yield buffer.take()
+
+
+def gzip_stream(chunks: Iterator[str], level: int = 6) -> Iterator[bytes]:
+    """Gzip-compress a text stream on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def parse_date(value: Optional[str]) -> Optional[datetime]:
+    """Parse an ISO date or datetime query argument; raises ValueError"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
+
+def iso(value) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def apply_filters(statement, model, args, date_column=None, status_case=str.upper):
+    """Apply the export query arguments: date_from, date_to, status and symbol
+    
+    Dates filter `date_column` (default `model.created_at`); symbol matches
+    either the pair (BTC_USDT) or the coin (BTC). Raises ValueError on a
+    malformed date.
+    """
+    date_column = date_column if date_column is not None else model.created_at
+    date_from = parse_date(args.get('date_from'))
+    date_to = parse_date(args.get('date_to'))
+    status = args.get('status')
+    symbol = args.get('symbol')
+    
+    if date_from:
+        statement = statement.where(date_column >= date_from)
+    if date_to:
+        if len(args.get('date_to')) <= 10:  # Plain date: include the whole day
+            date_to = date_to.replace(hour=23, minute=59, second=59, microsecond=999999)
+        statement = statement.where(date_column <= date_to)
+    if status:
+        statement = statement.where(model.status == status_case(status))
+    if symbol:
+        symbol = symbol.upper()
+        statement = statement.where(or_(Coin.symbol == symbol, Coin.original_symbol == symbol))
+    return statement
+
+
+def wants_gzip(args) -> bool:
+    return args.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+
+def csv_response(chunks: Iterator[str], filename: str, compress: bool = False) -> Response:
+    """Streamed attachment response; the request context stays open until the last row"""
+    if compress:
+        body, mimetype, filename = gzip_stream(chunks), 'application/gzip', f"{filename}.gz"
+    else:
+        body, mimetype = (chunk.encode('utf-8') for chunk in chunks), 'text/csv'
+    
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
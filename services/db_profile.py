@@ -0,0 +1,198 @@
+"""Database engine profiles
+
+Usage:
+    python -m services.db_profile
+
+Prints the active profile and the settings the database actually runs
+with, and exits with status 1 if they differ from the profile.
+
+Profiles (DB_PROFILE, default `auto` = chosen from DATABASE_URL):
+
+- sqlite: WAL journal, synchronous=NORMAL, busy timeout, mmap, page cache
+  and in-memory temp store, applied to every new connection
+- postgres: a real connection pool (size, overflow, timeout, recycle,
+  pre-ping)
+- default: SQLAlchemy defaults, no tuning
+"""
+import os
+import sys
+import logging
+from typing import Dict, List
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+PROFILES = ('auto', 'sqlite', 'postgres', 'default')
+
+# PRAGMA name -> value; applied in this order on every new SQLite connection
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 268435456)),  # 256MB
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -65536)),  # Negative = KiB, i.e. 64MB
+    'temp_store': os.getenv('SQLITE_TEMP_STORE', 'MEMORY'),
+}
+
+# How PRAGMA reads report the named settings
+SQLITE_PRAGMA_CODES = {
+    'synchronous': {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3},
+    'temp_store': {'DEFAULT': 0, 'FILE': 1, 'MEMORY': 2},
+}
+
+POSTGRES_POOL = {
+    'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+    'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+    'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+    'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    'pool_pre_ping': True,
+}
+
+
+def resolve_profile(database_uri: str, profile: str = None) -> str:
+    """Profile to use for a database URI; `auto` picks by the URI's backend"""
+    profile = (profile or os.getenv('DB_PROFILE', 'auto')).lower()
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown database profile: {profile}")
+    if profile != 'auto':
+        return profile
+    
+    backend = make_url(database_uri).get_backend_name()
+    if backend == 'sqlite':
+        return 'sqlite'
+    if backend == 'postgresql':
+        return 'postgres'
+    return 'default'
+
+
+def engine_options(database_uri: str, profile: str) -> Dict:
+    """SQLALCHEMY_ENGINE_OPTIONS for a profile"""
+    if profile == 'sqlite':
+        # The driver's own lock wait; busy_timeout below covers the same for SQLite itself
+        return {'connect_args': {'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000}}
+    if profile == 'postgres':
+        return dict(POSTGRES_POOL)
+    return {}
+
+
+def configure_engine_options(app, profile: str = None) -> str:
+    """Set the engine options for the app's database; call before db.init_app()"""
+    profile = resolve_profile(app.config['SQLALCHEMY_DATABASE_URI'], profile)
+    options = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], profile)
+    app.config['DB_PROFILE'] = profile
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**options, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+    return profile
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def install(engine, profile: str):
+    """Hook the profile's per-connection settings into an engine"""
+    if profile == 'sqlite' and engine.dialect.name == 'sqlite':
+        if not event.contains(engine, 'connect', _apply_sqlite_pragmas):
+            event.listen(engine, 'connect', _apply_sqlite_pragmas)
+
+
+def install_profile(app, db):
+    """Install the configured profile on the app's engine; call after db.init_app()"""
+    with app.app_context():
+        install(db.engine, app.config.get('DB_PROFILE', 'default'))
+
+
+def expected_settings(profile: str) -> Dict:
+    """Settings a profile asks for, in the form effective_settings() reports them"""
+    if profile == 'sqlite':
+        expected = {}
+        for name, value in SQLITE_PRAGMAS.items():
+            codes = SQLITE_PRAGMA_CODES.get(name)
+            if codes is not None:
+                value = codes[str(value).upper()]
+            elif isinstance(value, str):
+                value = value.lower()
+            expected[name] = value
+        return expected
+    if profile == 'postgres':
+        return {key: POSTGRES_POOL[key] for key in ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle')}
+    return {}
+
+
+def effective_settings(engine) -> Dict:
+    """Settings the database and pool actually run with"""
+    settings = {'dialect': engine.dialect.name, 'pool': engine.pool.__class__.__name__}
+    
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            for name in SQLITE_PRAGMAS:
+                value = connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+                settings[name] = value.lower() if isinstance(value, str) else value
+        return settings
+    
+    pool = engine.pool
+    for key, attribute in (('pool_size', 'size'), ('max_overflow', '_max_overflow'),
+                           ('pool_timeout', '_timeout'), ('pool_recycle', '_recycle')):
+        value = getattr(pool, attribute, None)
+        value = value() if callable(value) else value
+        if value is not None:
+            settings[key] = value
+    if engine.dialect.name == 'postgresql':
+        with engine.connect() as connection:
+            for name in ('max_connections', 'shared_buffers', 'synchronous_commit'):
+                settings[name] = connection.execute(text(f"SHOW {name}")).scalar()
+    return settings
+
+
+def check_settings(engine, profile: str) -> List[str]:
+    """Differences between the profile and the effective settings"""
+    effective = effective_settings(engine)
+    in_memory = effective.get('journal_mode') == 'memory'
+    problems = []
+    for name, expected in expected_settings(profile).items():
+        actual = effective.get(name)
+        if in_memory and name in ('journal_mode', 'mmap_size'):
+            continue  # In-memory databases have neither a journal file nor a file to map
+        if actual != expected:
+            problems.append(f"{name} is {actual}, profile {profile} expects {expected}")
+    return problems
+
+
+def database_info(app, db) -> Dict:
+    """Profile, effective settings and mismatches for the system info page"""
+    profile = app.config.get('DB_PROFILE', 'default')
+    try:
+        return {
+            'profile': profile,
+            'settings': effective_settings(db.engine),
+            'problems': check_settings(db.engine, profile)
+        }
+    except Exception as e:
+        logger.error(f"Error reading database settings: {str(e)}")
+        return {'profile': profile, 'error': str(e)}
+
+
+def main():
+    from app import app
+    from models import db
+    
+    with app.app_context():
+        info = database_info(app, db)
+    
+    print(f"profile: {info['profile']}")
+    for name, value in info.get('settings', {}).items():
+        print(f"  {name}: {value}")
+    for problem in info.get('problems', []):
+        print(f"MISMATCH {problem}")
+    if info.get('error'):
+        print(f"ERROR {info['error']}")
+    sys.exit(1 if info.get('problems') or info.get('error') else 0)
+
+
+if __name__ == '__main__':
+    main()
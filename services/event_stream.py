@@ -0,0 +1,262 @@
+import json
+import time
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _signal(analysis) -> Dict:
+    return {
+        'id': analysis.id,
+        'coin_id': analysis.coin_id,
+        'action': analysis.action,
+        'last_price': analysis.last_price,
+        'rsi': analysis.rsi,
+        'volume_ratio': analysis.volume_ratio,
+        'take_profit': analysis.take_profit,
+        'stop_loss': analysis.stop_loss,
+        'timestamp': _iso(analysis.timestamp)
+    }
+
+
+def _position(position) -> Dict:
+    return {
+        'id': position.id,
+        'coin_id': position.coin_id,
+        'status': position.status,
+        'quantity': position.quantity,
+        'entry_price': position.entry_price,
+        'current_price': position.current_price,
+        'unrealized_pnl': position.unrealized_pnl,
+        'realized_pnl': position.realized_pnl,
+        'stop_loss': position.stop_loss,
+        'take_profit': position.take_profit,
+        'exit_date': _iso(position.exit_date)
+    }
+
+
+def _order(order) -> Dict:
+    return {
+        'id': order.id,
+        'coin_id': order.coin_id,
+        'side': order.side,
+        'order_type': order.order_type,
+        'status': order.status,
+        'quantity': order.quantity,
+        'price': order.price,
+        'filled_quantity': order.filled_quantity,
+        'average_fill_price': order.average_fill_price,
+        'exchange_order_id': order.exchange_order_id
+    }
+
+
+def _log(values) -> Dict:
+    get = values.get if isinstance(values, dict) else lambda key: getattr(values, key, None)
+    return {
+        'id': get('id'),
+        'timestamp': _iso(get('timestamp')),
+        'level': get('level'),
+        'category': get('category'),
+        'message': get('message'),
+        'coin_id': get('coin_id')
+    }
+
+
+# table -> (event type, serializer, publish on update)
+STREAMED_TABLES = {
+    'technical_analyses': ('signal', _signal, False),
+    'positions': ('position', _position, True),
+    'orders': ('order', _order, True),
+    'system_logs': ('log', _log, False),
+}
+
+
+class EventBroker:
+    """In-process fan-out of data change events to Server-Sent Events clients
+    
+    Events get consecutive sequence numbers and are kept in a bounded ring
+    buffer that every subscriber reads from, so publishing costs the same
+    for one subscriber or a thousand. A client resumes by sending the last
+    id it saw (Last-Event-ID); if that id has already left the buffer, or
+    comes from an earlier process, it gets a `reset` event and should reload
+    its state. Sequence numbers start at the process start time in
+    milliseconds so they keep increasing across restarts.
+    """
+    
+    def __init__(self, buffer_size: int = 1000, heartbeat_interval: float = 15):
+        self.buffer_size = buffer_size
+        self.heartbeat_interval = heartbeat_interval  # seconds
+        self._events: deque = deque(maxlen=buffer_size)  # (seq, event type, JSON data)
+        self._seq = int(time.time() * 1000)
+        self._condition = threading.Condition()
+        self._closed = False
+        
+        # Counters
+        self.published = 0
+        self.subscribers = 0
+        self.resets = 0
+    
+    def init_app(self, app):
+        self.buffer_size = app.config.get('EVENT_STREAM_BUFFER_SIZE', self.buffer_size)
+        self.heartbeat_interval = app.config.get('EVENT_STREAM_HEARTBEAT_SECONDS', self.heartbeat_interval)
+        with self._condition:
+            self._events = deque(self._events, maxlen=self.buffer_size)
+        install_session_hooks()
+    
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+    
+    def publish(self, event_type: str, data: Dict) -> int:
+        return self.publish_many([(event_type, data)])
+    
+    def publish_many(self, events: List[Tuple[str, Dict]]) -> int:
+        """Append events and wake every subscriber once; returns the last sequence number"""
+        encoded = [(event_type, json.dumps(data, default=str)) for event_type, data in events]
+        with self._condition:
+            for event_type, payload in encoded:
+                self._seq += 1
+                self._events.append((self._seq, event_type, payload))
+            self.published += len(encoded)
+            if encoded:
+                self._condition.notify_all()
+            return self._seq
+    
+    def events_after(self, last_seq: int) -> Tuple[List[Tuple[int, str, str]], bool]:
+        """Buffered events after `last_seq`, and whether the client missed events and must reset"""
+        with self._condition:
+            return self._events_after(last_seq)
+    
+    def _events_after(self, last_seq: int):
+        if last_seq > self._seq:
+            return [], True  # Id from a later process; cannot resume
+        if last_seq == self._seq:
+            return [], False
+        if not self._events or last_seq < self._events[0][0] - 1:
+            return [], True
+        start = last_seq - self._events[0][0] + 1  # Sequence numbers are consecutive
+        return [self._events[i] for i in range(start, len(self._events))], False
+    
+    def close(self):
+        """Wake all subscribers and end their streams"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+    
+    @staticmethod
+    def format(seq: Optional[int], event_type: str, payload: str) -> str:
+        lines = [f"id: {seq}"] if seq is not None else []
+        lines.append(f"event: {event_type}")
+        lines.append(f"data: {payload}")
+        return "\n".join(lines) + "\n\n"
+    
+    def stream(self, last_seq: Optional[int] = None) -> Iterator[str]:
+        """SSE text for one subscriber, starting after `last_seq` (None = from now)"""
+        with self._condition:
+            self.subscribers += 1
+        try:
+            yield "retry: 3000\n\n"
+            if last_seq is None:
+                last_seq = self._seq
+                yield self.format(last_seq, 'hello', json.dumps({'seq': last_seq}))
+            
+            while not self._closed:
+                with self._condition:
+                    self._condition.wait_for(lambda: self._seq != last_seq or self._closed,
+                                             self.heartbeat_interval)
+                    events, reset = self._events_after(last_seq)
+                    if reset:
+                        self.resets += 1
+                        last_seq = self._seq
+                
+                if reset:
+                    yield self.format(last_seq, 'reset', json.dumps({'seq': last_seq}))
+                elif events:
+                    for seq, event_type, payload in events:
+                        yield self.format(seq, event_type, payload)
+                    last_seq = events[-1][0]
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            with self._condition:
+                self.subscribers -= 1
+    
+    def stats(self) -> Dict:
+        with self._condition:
+            return {
+                'last_seq': self._seq,
+                'buffered': len(self._events),
+                'buffer_size': self.buffer_size,
+                'published': self.published,
+                'subscribers': self.subscribers,
+                'resets': self.resets
+            }
+
+
+# Shared broker, bound to the app in app.py
+event_broker = EventBroker()
+
+
+def _pending(session) -> list:
+    return session.info.setdefault('stream_events', [])
+
+
+def _after_flush(session, flush_context):
+    for objects, created, deleted in ((session.new, True, False), (session.dirty, False, False),
+                                      (session.deleted, False, True)):
+        for obj in objects:
+            streamed = STREAMED_TABLES.get(getattr(obj, '__tablename__', None))
+            if streamed is None:
+                continue
+            event_type, serialize, on_update = streamed
+            if deleted:
+                _pending(session).append((event_type, {'id': obj.id, 'deleted': True}))
+            elif created or (on_update and session.is_modified(obj, include_collections=False)):
+                _pending(session).append((event_type, serialize(obj)))
+
+
+def _do_orm_execute(orm_execute_state):
+    # Bulk inserts such as the SystemLog write-behind batches bypass the flush
+    if not orm_execute_state.is_insert or orm_execute_state.bind_mapper is None:
+        return
+    streamed = STREAMED_TABLES.get(orm_execute_state.bind_mapper.local_table.name)
+    if streamed is None:
+        return
+    event_type, serialize, _ = streamed
+    parameters = orm_execute_state.parameters
+    rows = parameters if isinstance(parameters, list) else [parameters] if parameters else []
+    _pending(orm_execute_state.session).extend((event_type, serialize(row)) for row in rows)
+
+
+def _after_commit(session):
+    events = session.info.pop('stream_events', None)
+    if events:
+        # Several flushes in one transaction: only the last state of each row is published
+        latest = {}
+        for index, (event_type, data) in enumerate(events):
+            key = (event_type, data['id']) if data.get('id') is not None else index
+            latest.pop(key, None)
+            latest[key] = (event_type, data)
+        event_broker.publish_many(list(latest.values()))
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop('stream_events', None)
+
+
+def install_session_hooks():
+    """Publish streamed table changes when their transaction commits; safe to call repeatedly"""
+    for name, listener in (('after_flush', _after_flush), ('do_orm_execute', _do_orm_execute),
+                           ('after_commit', _after_commit), ('after_soft_rollback', _after_rollback)):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
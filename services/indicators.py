@@ -0,0 +1,326 @@
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Largest exponent used when unrolling an exponential recurrence in closed form.
+# decay ** -k must stay well inside float64 range (about 1e308), so each chunk
+# is limited to the number of steps that keeps it below e**345 (about 1e150).
+_MAX_LOG_GROWTH = 345.0
+
+
+def _exponential_filter(values: np.ndarray, alpha: float, initial: float) -> np.ndarray:
+    """Vectorized y[i] = (1 - alpha) * y[i-1] + alpha * values[i], seeded with y[-1] = initial
+    
+    The recurrence is unrolled in closed form:
+        y[k] = decay**k * (initial + alpha * sum(values[j] * decay**-j, j = 1..k))
+    and evaluated with np.cumsum in chunks short enough that decay**-k cannot overflow.
+    """
+    values = np.asarray(values, dtype=float)
+    out = np.empty(len(values))
+    if len(values) == 0:
+        return out
+    
+    decay = 1.0 - alpha
+    if decay <= 0.0:
+        out[:] = values
+        return out
+    
+    chunk = max(1, int(_MAX_LOG_GROWTH / -np.log(decay)))
+    previous = float(initial)
+    for start in range(0, len(values), chunk):
+        segment = values[start:start + chunk]
+        steps = np.arange(1, len(segment) + 1)
+        growth = np.power(decay, -steps)
+        out[start:start + len(segment)] = (previous + alpha * np.cumsum(segment * growth)) / growth
+        previous = out[start + len(segment) - 1]
+    
+    return out
+
+
+def sma(values: np.ndarray, period: int) -> np.ndarray:
+    """Simple Moving Average using a cumulative sum (expanding mean for the first period - 1 values)"""
+    values = np.asarray(values, dtype=float)
+    if len(values) < period:
+        return np.full(len(values), np.mean(values))
+    
+    # Shift by the first value so the running sum stays small and the
+    # window differences do not lose precision on large price levels
+    shift = values[0]
+    csum = np.cumsum(values - shift)
+    
+    result = np.empty(len(values))
+    result[:period - 1] = csum[:period - 1] / np.arange(1, period)
+    
+    window_sums = csum[period - 1:].copy()
+    window_sums[1:] -= csum[:-period]
+    result[period - 1:] = window_sums / period
+    
+    return result + shift
+
+
+def ema(values: np.ndarray, period: int) -> np.ndarray:
+    """Exponential Moving Average seeded with the first value"""
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return np.array([])
+    
+    result = np.empty(len(values))
+    result[0] = values[0]
+    result[1:] = _exponential_filter(values[1:], 2 / (period + 1), values[0])
+    return result
+
+
+def rsi(prices: np.ndarray, period: int = 14) -> np.ndarray:
+    """Wilder RSI; the first `period` values are padded with a neutral 50"""
+    prices = np.asarray(prices, dtype=float)
+    if len(prices) < period + 1:
+        return np.full(len(prices), 50.0)
+    
+    deltas = np.diff(prices)
+    gains = np.where(deltas > 0, deltas, 0.0)
+    losses = np.where(deltas < 0, -deltas, 0.0)
+    
+    avg_gains = np.empty(len(gains) - period + 1)
+    avg_losses = np.empty(len(gains) - period + 1)
+    avg_gains[0] = np.mean(gains[:period])
+    avg_losses[0] = np.mean(losses[:period])
+    avg_gains[1:] = _exponential_filter(gains[period:], 1 / period, avg_gains[0])
+    avg_losses[1:] = _exponential_filter(losses[period:], 1 / period, avg_losses[0])
+    
+    rs = np.divide(avg_gains, avg_losses, out=np.zeros_like(avg_gains), where=avg_losses != 0)
+    rsi_values = np.where(avg_losses != 0, 100 - (100 / (1 + rs)), 100.0)
+    
+    result = np.full(len(prices), 50.0)
+    result[period:] = rsi_values
+    return result
+
+
+def true_range(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray) -> np.ndarray:
+    """True Range; the first value is just high - low"""
+    highs = np.asarray(highs, dtype=float)
+    lows = np.asarray(lows, dtype=float)
+    closes = np.asarray(closes, dtype=float)
+    
+    tr = np.empty(len(highs))
+    if len(highs) == 0:
+        return tr
+    
+    tr[0] = highs[0] - lows[0]
+    previous_closes = closes[:-1]
+    tr[1:] = np.maximum.reduce([
+        highs[1:] - lows[1:],
+        np.abs(highs[1:] - previous_closes),
+        np.abs(lows[1:] - previous_closes)
+    ])
+    return tr
+
+
+def atr(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray, period: int = 14) -> np.ndarray:
+    """Average True Range as a simple moving average of the True Range"""
+    if len(highs) < period or len(lows) < period or len(closes) < period:
+        return np.full(len(highs), 0.0)
+    
+    return sma(true_range(highs, lows, closes), period)
+
+
+class _RunningWindow:
+    """Running sum over the last `size - 1` committed values plus one provisional value"""
+    
+    def __init__(self, size: int):
+        self.size = size
+        self.values = deque(maxlen=max(size - 1, 0))
+        self.total = 0.0
+    
+    def __len__(self):
+        return len(self.values)
+    
+    def push(self, value: float):
+        """Commit a value, evicting the oldest one once the window is full"""
+        if self.values.maxlen == 0:
+            return
+        if len(self.values) == self.values.maxlen:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+    
+    def mean_with(self, value: float) -> float:
+        """Mean of the committed values and a provisional latest value"""
+        return (self.total + value) / (len(self.values) + 1)
+
+
+class IndicatorState:
+    """Streaming indicator state for one instrument
+    
+    Holds everything needed to produce the latest RSI, MA50, MA200, EMA10, ATR,
+    volume ratio and recent high/low in O(1) per candle. Indicators are committed
+    up to the previous candle; the latest (still open) candle is kept separately,
+    so a revision of it only replaces that candle instead of replaying history.
+    
+    Moving averages and ATR match the batch kernels up to rounding. EMA and RSI continue
+    from the seed instead of restarting at the start of a fixed window, so they
+    differ from a batch run only by the decayed weight of the dropped candles.
+    """
+    
+    def __init__(self, rsi_period: int = 14, ma50_period: int = 50, ma200_period: int = 200,
+                 ema10_period: int = 10, atr_period: int = 14, volume_period: int = 14,
+                 level_period: int = 20):
+        self.rsi_period = rsi_period
+        self.ema_multiplier = 2 / (ema10_period + 1)
+        self.atr_period = atr_period
+        self.volume_period = volume_period
+        
+        self.candle_count = 0
+        self.last_timestamp = None
+        self.last_candle = None  # (open, high, low, close, volume) of the open candle
+        
+        # Committed state up to the candle before last_candle
+        self.previous_close = None
+        self.ma50_window = _RunningWindow(ma50_period)
+        self.ma200_window = _RunningWindow(ma200_period)
+        self.ema_value = None
+        self.delta_count = 0
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+        self.tr_window = _RunningWindow(atr_period)
+        self.volumes = deque(maxlen=volume_period)
+        self.volume_total = 0.0
+        self.highs = deque(maxlen=max(level_period - 1, 0))
+        self.lows = deque(maxlen=max(level_period - 1, 0))
+    
+    def update(self, timestamp: int, open_: float, high: float, low: float,
+               close: float, volume: float) -> bool:
+        """Apply a new candle or a revision of the latest one; older candles are ignored"""
+        if self.last_timestamp is not None:
+            if timestamp < self.last_timestamp:
+                return False
+            if timestamp > self.last_timestamp:
+                self._commit_last_candle()
+                self.candle_count += 1
+        else:
+            self.candle_count = 1
+        
+        self.last_timestamp = timestamp
+        self.last_candle = (open_, high, low, close, volume)
+        return True
+    
+    def seed(self, df: pd.DataFrame):
+        """Initialise the state from a history of candles sorted by timestamp"""
+        for row in df[['t', 'open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=float):
+            self.update(int(row[0]), *row[1:])
+    
+    def update_from_frame(self, df: pd.DataFrame) -> bool:
+        """Apply the candles in `df` that are at or after the latest known candle
+        
+        Returns False when `df` does not overlap the latest known candle, i.e. some
+        candles may be missing and the state should be re-seeded from history.
+        """
+        if self.last_timestamp is None or df is None or len(df) == 0:
+            return False
+        
+        timestamps = df['t'].to_numpy(dtype=np.int64)
+        if timestamps[0] > self.last_timestamp:
+            return False
+        
+        recent = df[timestamps >= self.last_timestamp]
+        for row in recent[['t', 'open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=float):
+            self.update(int(row[0]), *row[1:])
+        return True
+    
+    def _true_range(self, high: float, low: float) -> float:
+        if self.previous_close is None:
+            return high - low
+        return max(high - low, abs(high - self.previous_close), abs(low - self.previous_close))
+    
+    def _commit_last_candle(self):
+        """Fold the latest candle into the committed state before a newer one arrives"""
+        _, high, low, close, volume = self.last_candle
+        
+        self.ma50_window.push(close)
+        self.ma200_window.push(close)
+        self.tr_window.push(self._true_range(high, low))
+        
+        if self.ema_value is None:
+            self.ema_value = close
+        else:
+            self.ema_value = (close - self.ema_value) * self.ema_multiplier + self.ema_value
+        
+        if self.previous_close is not None:
+            self.avg_gain, self.avg_loss = self._rsi_averages(close)
+            self.delta_count += 1
+        
+        if len(self.volumes) == self.volumes.maxlen:
+            self.volume_total -= self.volumes[0]
+        self.volumes.append(volume)
+        self.volume_total += volume
+        
+        if self.highs.maxlen:
+            self.highs.append(high)
+            self.lows.append(low)
+        
+        self.previous_close = close
+    
+    def _rsi_averages(self, close: float) -> Tuple[float, float]:
+        """Average gain and loss after applying the delta from previous_close to `close`"""
+        delta = close - self.previous_close
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        period = self.rsi_period
+        
+        if self.delta_count < period:
+            # Still accumulating the initial simple average
+            return self.avg_gain + gain / period, self.avg_loss + loss / period
+        
+        return ((self.avg_gain * (period - 1) + gain) / period,
+                (self.avg_loss * (period - 1) + loss) / period)
+    
+    def snapshot(self) -> Optional[Dict]:
+        """Latest indicator values including the open candle"""
+        if self.last_candle is None:
+            return None
+        
+        _, high, low, close, volume = self.last_candle
+        
+        # RSI
+        if self.previous_close is None or self.delta_count + 1 < self.rsi_period:
+            current_rsi = 50.0
+        else:
+            avg_gain, avg_loss = self._rsi_averages(close)
+            current_rsi = 100 - (100 / (1 + avg_gain / avg_loss)) if avg_loss != 0 else 100.0
+        
+        # EMA
+        if self.ema_value is None:
+            current_ema = close
+        else:
+            current_ema = (close - self.ema_value) * self.ema_multiplier + self.ema_value
+        
+        # ATR
+        if self.candle_count < self.atr_period:
+            current_atr = 0.0
+        else:
+            current_atr = self.tr_window.mean_with(self._true_range(high, low))
+        
+        # Volume ratio against the average of the preceding candles
+        if len(self.volumes) < self.volume_period:
+            volume_ratio = 1.0
+        else:
+            avg_volume = self.volume_total / len(self.volumes)
+            volume_ratio = volume / avg_volume if avg_volume > 0 else 1.0
+        
+        return {
+            'timestamp': self.last_timestamp,
+            'candle_count': self.candle_count,
+            'close': close,
+            'high': high,
+            'low': low,
+            'volume': volume,
+            'rsi': current_rsi,
+            'ma50': self.ma50_window.mean_with(close),
+            'ma200': self.ma200_window.mean_with(close),
+            'ema10': current_ema,
+            'atr': current_atr,
+            'volume_ratio': volume_ratio,
+            'recent_high': max(high, *self.highs) if self.highs else high,
+            'recent_low': min(low, *self.lows) if self.lows else low
+        }
@@ -0,0 +1,144 @@
+import os
+import time
+import threading
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 3600.0  # Instrument specs rarely change
+MISS_REFRESH_INTERVAL = 60.0  # Min seconds between refreshes caused by unknown instruments
+RETRY_INTERVAL = 30.0  # Seconds before retrying after a failed download
+
+
+class InstrumentCache:
+    """Instrument metadata indexed by instrument name
+    
+    The full instrument list is downloaded at most once per TTL (or on demand
+    via refresh()) and kept as a dict, so precision and minimum size lookups
+    are plain memory reads. A failed download keeps the previous index.
+    """
+    
+    def __init__(self, ttl: float = DEFAULT_TTL, miss_refresh_interval: float = MISS_REFRESH_INTERVAL):
+        self.ttl = ttl
+        self.miss_refresh_interval = miss_refresh_interval
+        self.instruments: Dict[str, dict] = {}
+        self.loaded_at = None  # time.time() of the last successful load
+        self._next_refresh = 0.0  # monotonic deadline for the next scheduled refresh
+        self._last_attempt = 0.0
+        self.lock = threading.Lock()
+        self._refresh_lock = threading.Lock()  # One download at a time
+        
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+    
+    def load(self, instruments: List[dict]):
+        """Replace the index with a freshly downloaded instrument list"""
+        index = {
+            instrument['instrument_name']: instrument
+            for instrument in instruments
+            if instrument.get('instrument_name')
+        }
+        with self.lock:
+            self.instruments = index
+            self.loaded_at = time.time()
+            self._next_refresh = time.monotonic() + self.ttl
+            self.refreshes += 1
+    
+    def is_stale(self) -> bool:
+        return time.monotonic() >= self._next_refresh
+    
+    def refresh(self, fetch: Callable[[], List[dict]]) -> bool:
+        """Download the instrument list now; returns False if the download failed"""
+        with self._refresh_lock:
+            return self._refresh(fetch)
+    
+    def _refresh(self, fetch: Callable[[], List[dict]]) -> bool:
+        self._last_attempt = time.monotonic()
+        instruments = fetch()
+        if not instruments:
+            with self.lock:
+                self._next_refresh = time.monotonic() + RETRY_INTERVAL
+            logger.warning("Instrument list download failed, keeping cached instruments")
+            return False
+        
+        self.load(instruments)
+        logger.debug(f"Instrument cache refreshed with {len(self.instruments)} instruments")
+        return True
+    
+    def _refresh_if_stale(self, fetch: Callable[[], List[dict]]):
+        if not self.is_stale():
+            return
+        with self._refresh_lock:
+            # Another thread may have refreshed while we waited
+            if self.is_stale():
+                self._refresh(fetch)
+    
+    def get(self, instrument_name: str, fetch: Callable[[], List[dict]]) -> Optional[dict]:
+        """Metadata for one instrument, refreshing the index if it is stale"""
+        self._refresh_if_stale(fetch)
+        
+        instrument = self.instruments.get(instrument_name)
+        if instrument is None:
+            with self._refresh_lock:
+                instrument = self.instruments.get(instrument_name)
+                if instrument is None and time.monotonic() - self._last_attempt >= self.miss_refresh_interval:
+                    # Possibly a newly listed instrument
+                    self._refresh(fetch)
+                    instrument = self.instruments.get(instrument_name)
+        
+        return self.lookup(instrument_name)
+    
+    def lookup(self, instrument_name: str) -> Optional[dict]:
+        """Metadata for one instrument from memory only, never downloading"""
+        instrument = self.instruments.get(instrument_name)
+        if instrument is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return instrument
+    
+    def wants_refresh(self, instrument_name: str = None) -> bool:
+        """Whether get() would download: the index is stale, or the instrument is
+        unknown and the last attempt is older than the miss refresh interval"""
+        if self.is_stale():
+            return True
+        return (instrument_name is not None and instrument_name not in self.instruments
+                and time.monotonic() - self._last_attempt >= self.miss_refresh_interval)
+    
+    def all(self, fetch: Callable[[], List[dict]]) -> List[dict]:
+        """Every cached instrument, refreshing the index if it is stale"""
+        self._refresh_if_stale(fetch)
+        return list(self.instruments.values())
+    
+    def stats(self) -> Dict:
+        return {
+            'instruments': len(self.instruments),
+            'loaded_at': self.loaded_at,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes
+        }
+
+
+_shared_caches: Dict[str, InstrumentCache] = {}
+_shared_caches_lock = threading.Lock()
+
+
+def get_instrument_cache(base_url: str) -> InstrumentCache:
+    """Process-wide instrument cache for an exchange environment (sandbox or production)"""
+    with _shared_caches_lock:
+        if base_url not in _shared_caches:
+            _shared_caches[base_url] = InstrumentCache(
+                ttl=float(os.getenv('INSTRUMENT_CACHE_TTL', DEFAULT_TTL))
+            )
+        return _shared_caches[base_url]
+
+
+def instrument_cache_stats() -> Dict[str, Dict]:
+    """Stats for every shared instrument cache, keyed by base URL"""
+    with _shared_caches_lock:
+        return {base_url: cache.stats() for base_url, cache in _shared_caches.items()}
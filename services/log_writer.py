@@ -0,0 +1,208 @@
+import time
+import atexit
+import threading
+import logging
+from collections import deque
+from typing import Dict, List
+from sqlalchemy import insert
+from models import db, SystemLog
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+# Columns written for every entry so all rows in a batch share one INSERT shape
+LOG_COLUMNS = ('timestamp', 'level', 'category', 'message', 'details',
+               'coin_id', 'trade_id', 'order_id', 'position_id')
+
+
+class SystemLogWriter:
+    """Write-behind sink for SystemLog entries
+    
+    SystemLog.log() hands entries to a bounded in-memory buffer instead of
+    committing them on the caller's session. A background thread bulk-inserts
+    them in one transaction every `flush_interval` seconds or as soon as
+    `batch_size` entries are waiting. When the buffer is full the overflow
+    policy decides what happens:
+    
+    - drop_oldest: discard the oldest buffered entry to make room
+    - drop_newest: discard the entry being logged
+    - block: wait up to `block_timeout` seconds for room, then discard it
+    """
+    
+    def __init__(self, app=None, max_queue_size: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 0.5, overflow_policy: str = 'drop_oldest',
+                 block_timeout: float = 1.0):
+        self.app = None
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval  # seconds
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._flushed = threading.Condition(self._lock)
+        self._flush_requested = 0
+        self._flush_completed = 0
+        self._stopping = False
+        self._thread = None
+        
+        # Counters
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """Read writer settings from the app config"""
+        self.app = app
+        self.max_queue_size = app.config.get('SYSTEM_LOG_QUEUE_SIZE', self.max_queue_size)
+        self.batch_size = app.config.get('SYSTEM_LOG_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('SYSTEM_LOG_FLUSH_INTERVAL_MS', self.flush_interval * 1000) / 1000
+        self.overflow_policy = app.config.get('SYSTEM_LOG_OVERFLOW_POLICY', self.overflow_policy)
+        
+        if self.overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown SystemLog overflow policy: {self.overflow_policy}")
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        """Start the background writer and route SystemLog.log() through it"""
+        if self.app is None:
+            raise RuntimeError("SystemLogWriter.init_app() must be called before start()")
+        if self.running:
+            return
+        
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='system-log-writer', daemon=True)
+        self._thread.start()
+        
+        SystemLog.set_sink(self)
+        atexit.register(self.stop)
+        logger.info(f"SystemLog writer started (batch {self.batch_size}, "
+                    f"interval {self.flush_interval * 1000:.0f}ms, overflow {self.overflow_policy})")
+    
+    def stop(self, timeout: float = 5.0):
+        """Flush buffered entries synchronously and stop the writer"""
+        if SystemLog.get_sink() is self:
+            SystemLog.set_sink(None)
+        
+        if not self.running:
+            return
+        
+        with self._lock:
+            self._stopping = True
+            self._not_empty.notify_all()
+        self._thread.join(timeout)
+        logger.info(f"SystemLog writer stopped ({self.written} written, {self.dropped} dropped)")
+    
+    def submit(self, entry: Dict) -> bool:
+        """Queue an entry for writing; returns False if it was dropped"""
+        with self._lock:
+            if self._stopping:
+                return False
+            
+            if len(self._buffer) >= self.max_queue_size:
+                if self.overflow_policy == 'drop_oldest':
+                    self._buffer.popleft()
+                    self.dropped += 1
+                elif self.overflow_policy == 'block':
+                    if not self._not_full.wait_for(lambda: len(self._buffer) < self.max_queue_size,
+                                                   self.block_timeout):
+                        self.dropped += 1
+                        return False
+                else:
+                    self.dropped += 1
+                    return False
+            
+            self._buffer.append(normalize_entry(entry))
+            self.enqueued += 1
+            if len(self._buffer) >= self.batch_size:
+                self._not_empty.notify()
+            return True
+    
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything queued so far has been written"""
+        if not self.running:
+            return False
+        
+        with self._lock:
+            self._flush_requested += 1
+            target = self._flush_requested
+            self._not_empty.notify()
+            return self._flushed.wait_for(lambda: self._flush_completed >= target, timeout)
+    
+    def _next_batch(self) -> List[Dict]:
+        """Wait for a full batch, the flush interval, a flush request or shutdown"""
+        with self._lock:
+            deadline = time.monotonic() + self.flush_interval
+            while not (self._stopping or len(self._buffer) >= self.batch_size
+                       or self._flush_requested > self._flush_completed):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._not_empty.wait(remaining)
+            
+            batch = [self._buffer.popleft() for _ in range(min(len(self._buffer), self.batch_size))]
+            self._not_full.notify_all()
+            return batch
+    
+    def _write(self, batch: List[Dict]):
+        """Bulk insert a batch in a single transaction"""
+        try:
+            db.session.execute(insert(SystemLog), batch)
+            db.session.commit()
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            db.session.rollback()
+            self.failed += len(batch)
+            logger.error(f"Error writing {len(batch)} system logs: {str(e)}")
+    
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch = self._next_batch()
+                if batch:
+                    self._write(batch)
+                
+                with self._lock:
+                    if not self._buffer:
+                        if self._flush_requested > self._flush_completed:
+                            self._flush_completed = self._flush_requested
+                            self._flushed.notify_all()
+                        if self._stopping:
+                            break
+            
+            db.session.remove()
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'running': self.running,
+                'queued': len(self._buffer),
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'batches': self.batches,
+                'overflow_policy': self.overflow_policy
+            }
+
+
+def normalize_entry(entry: Dict) -> Dict:
+    """Give a log entry every column so batches share one INSERT statement"""
+    return {column: entry.get(column) for column in LOG_COLUMNS}
+
+
+# Shared writer, bound to the app in app.py
+system_log_writer = SystemLogWriter()
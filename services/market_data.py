@@ -0,0 +1,149 @@
+import os
+import time
+import threading
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE = 2.0  # Seconds a ticker snapshot is reused before downloading a new one
+
+
+class PriceTable:
+    """In-memory ticker snapshot for every instrument, keyed by instrument name
+    
+    Filled from a single all-instruments ticker request, so pricing any number
+    of positions costs one round-trip. Tickers keep the exchange field names
+    ('a' ask, 'b' bid, 'h'/'l' 24h high/low, 'v' volume, 'c' 24h change).
+    
+    Listeners registered with subscribe() are called with
+    ({instrument_name: price}, observed_at) whenever prices change, whether
+    they came from a bulk snapshot or a single observation (streaming feed).
+    observed_at is a time.monotonic() timestamp. Listeners run on the
+    updating thread and must return quickly. Only live quotes belong in the
+    table: a candle close is minutes old and would fire TP/SL levels on a
+    stale price.
+    """
+    
+    def __init__(self, max_age: float = DEFAULT_MAX_AGE):
+        self.max_age = max_age
+        self.tickers: Dict[str, dict] = {}
+        self.updated_at = None  # time.time() of the last snapshot
+        self._updated_monotonic = None
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()  # One snapshot download at a time
+        self.listeners: List[Callable[[Dict[str, float], float], None]] = []
+        
+        # Counters
+        self.refreshes = 0
+        self.failures = 0
+    
+    def update(self, tickers: List[dict]):
+        """Replace the table with a freshly downloaded snapshot"""
+        observed_at = time.monotonic()
+        table = {ticker['i']: ticker for ticker in tickers if ticker.get('i')}
+        with self.lock:
+            previous = self.tickers
+            self.tickers = table
+            self.updated_at = time.time()
+            self._updated_monotonic = observed_at
+            self.refreshes += 1
+        
+        if self.listeners:
+            changed = {}
+            for instrument_name, ticker in table.items():
+                old_ticker = previous.get(instrument_name)
+                if old_ticker is None or old_ticker.get('a') != ticker.get('a'):
+                    price = _ask_price(ticker)
+                    if price:
+                        changed[instrument_name] = price
+            self._notify(changed, observed_at)
+    
+    def observe(self, instrument_name: str, price: float, observed_at: float = None, **fields):
+        """Record a single price observation for an instrument (ask price plus optional ticker fields)"""
+        if not price or price <= 0:
+            return
+        observed_at = observed_at or time.monotonic()
+        with self.lock:
+            ticker = dict(self.tickers.get(instrument_name) or {'i': instrument_name})
+            ticker.update(fields)
+            ticker['a'] = price
+            tickers = dict(self.tickers)
+            tickers[instrument_name] = ticker
+            self.tickers = tickers
+        self._notify({instrument_name: float(price)}, observed_at)
+    
+    def subscribe(self, listener: Callable[[Dict[str, float], float], None]):
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+    
+    def unsubscribe(self, listener: Callable[[Dict[str, float], float], None]):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+    
+    def _notify(self, prices: Dict[str, float], observed_at: float):
+        if not prices:
+            return
+        for listener in list(self.listeners):
+            try:
+                listener(prices, observed_at)
+            except Exception as e:
+                logger.error(f"Error in price listener {listener}: {str(e)}")
+    
+    def age(self) -> Optional[float]:
+        """Seconds since the last snapshot, None if there is none yet"""
+        if self._updated_monotonic is None:
+            return None
+        return time.monotonic() - self._updated_monotonic
+    
+    def is_stale(self, max_age: float = None) -> bool:
+        age = self.age()
+        return age is None or age >= (self.max_age if max_age is None else max_age)
+    
+    def get_ticker(self, instrument_name: str) -> Optional[dict]:
+        return self.tickers.get(instrument_name)
+    
+    def get_price(self, instrument_name: str) -> Optional[float]:
+        """Ask price for an instrument, None if it is not in the snapshot"""
+        return _ask_price(self.tickers.get(instrument_name))
+    
+    def stats(self) -> Dict:
+        return {
+            'instruments': len(self.tickers),
+            'updated_at': self.updated_at,
+            'age': self.age(),
+            'max_age': self.max_age,
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'listeners': len(self.listeners)
+        }
+
+
+def _ask_price(ticker: Optional[dict]) -> Optional[float]:
+    if not ticker:
+        return None
+    try:
+        price = float(ticker.get('a', 0))
+    except (TypeError, ValueError):
+        return None
+    return price if price > 0 else None
+
+
+_shared_tables: Dict[str, PriceTable] = {}
+_shared_tables_lock = threading.Lock()
+
+
+def get_price_table(base_url: str) -> PriceTable:
+    """Process-wide price table for an exchange environment (sandbox or production)"""
+    with _shared_tables_lock:
+        if base_url not in _shared_tables:
+            _shared_tables[base_url] = PriceTable(
+                max_age=float(os.getenv('TICKER_SNAPSHOT_MAX_AGE', DEFAULT_MAX_AGE))
+            )
+        return _shared_tables[base_url]
+
+
+def price_table_stats() -> Dict[str, Dict]:
+    """Stats for every shared price table, keyed by base URL"""
+    with _shared_tables_lock:
+        return {base_url: table.stats() for base_url, table in _shared_tables.items()}
@@ -0,0 +1,422 @@
+"""Local WebSocket server that replays recorded exchange market data
+
+Lets MarketStream be tested and benchmarked offline. A recording is a JSON
+lines file with one pushed message per line:
+
+    {"offset": 0.125, "message": {"id": -1, "method": "subscribe", "code": 0, "result": {...}}}
+
+where offset is seconds since the start of the recording.
+
+Usage:
+    python -m services.market_replay record out.jsonl --instruments BTC_USDT,ETH_USDT --duration 60
+    python -m services.market_replay synthesize out.jsonl --instruments 20 --duration 60
+    python -m services.market_replay serve out.jsonl --port 8765 [--speed 1] [--loop]
+
+Point the application at the server with
+MARKET_STREAM_URL=ws://127.0.0.1:8765/exchange/v1/market.
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+import aiohttp
+from aiohttp import web
+from services.candle_store import TIMEFRAME_MS
+from services.market_stream import SANDBOX_STREAM_URL
+
+logger = logging.getLogger(__name__)
+
+
+def load_recording(path: str) -> List[dict]:
+    records = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def save_recording(path: str, records: Iterable[dict]):
+    with open(path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+
+def _push(subscription: str, channel: str, instrument_name: str, data: List[dict], **extra) -> dict:
+    result = {'instrument_name': instrument_name, 'subscription': subscription, 'channel': channel, 'data': data}
+    result.update(extra)
+    return {'id': -1, 'method': 'subscribe', 'code': 0, 'result': result}
+
+
+def synthesize_recording(instruments: Iterable[str], duration: float = 60.0, ticks_per_second: float = 5.0,
+                         timeframe: str = '1m', book_depth: int = 10, seed: int = 42) -> List[dict]:
+    """Random-walk ticker, book and candle pushes for a set of instruments"""
+    rng = random.Random(seed)
+    instruments = list(instruments)
+    interval_ms = TIMEFRAME_MS[timeframe]
+    start_ms = int(time.time() * 1000) // interval_ms * interval_ms
+    
+    prices = {name: rng.uniform(1, 50000) for name in instruments}
+    update_ids = {name: 1 for name in instruments}
+    candles = {name: None for name in instruments}
+    
+    records = []
+    steps = int(duration * ticks_per_second)
+    for step in range(steps):
+        offset = step / ticks_per_second
+        now_ms = start_ms + int(offset * 1000)
+        for name in instruments:
+            price = prices[name] = prices[name] * (1 + rng.gauss(0, 0.0008))
+            spread = price * 0.0002
+            ticker = {
+                'i': name, 'a': f"{price + spread / 2:.6f}", 'b': f"{price - spread / 2:.6f}",
+                'k': f"{price + spread / 2:.6f}", 'h': f"{price * 1.02:.6f}", 'l': f"{price * 0.98:.6f}",
+                'v': f"{rng.uniform(100, 10000):.4f}", 'c': f"{rng.gauss(0, 0.01):.4f}", 't': now_ms
+            }
+            records.append({'offset': offset, 'message': _push(f"ticker.{name}", 'ticker', name, [ticker])})
+            
+            previous_id = update_ids[name]
+            update_ids[name] = previous_id + rng.randint(1, 3)
+            levels = [(price - spread * (i + 1), price + spread * (i + 1)) for i in range(book_depth)]
+            book = {
+                'bids': [[f"{bid:.6f}", f"{rng.uniform(0.1, 5):.4f}", str(rng.randint(1, 9))] for bid, _ in levels],
+                'asks': [[f"{ask:.6f}", f"{rng.uniform(0.1, 5):.4f}", str(rng.randint(1, 9))] for _, ask in levels],
+                't': now_ms, 'u': update_ids[name], 'pu': previous_id
+            }
+            records.append({'offset': offset, 'message': _push(f"book.{name}.{book_depth}", 'book', name, [book],
+                                                               depth=book_depth)})
+            
+            candle_start = now_ms // interval_ms * interval_ms
+            candle = candles[name]
+            if candle is None or candle['t'] != candle_start:
+                candle = candles[name] = {'t': candle_start, 'o': price, 'h': price, 'l': price, 'c': price, 'v': 0.0}
+            candle['h'] = max(candle['h'], price)
+            candle['l'] = min(candle['l'], price)
+            candle['c'] = price
+            candle['v'] += rng.uniform(0.01, 1)
+            data = [{key: (f"{value:.6f}" if key != 't' else value) for key, value in candle.items()}]
+            records.append({'offset': offset, 'message': _push(f"candlestick.{timeframe}.{name}", 'candlestick',
+                                                               name, data, interval=timeframe)})
+    return records
+
+
+async def record(url: str, channels: List[str], duration: float) -> List[dict]:
+    """Record pushed messages from a live market data WebSocket"""
+    records = []
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(url) as ws:
+            await asyncio.sleep(1)  # The exchange rejects requests sent right after connecting
+            await ws.send_json({'id': 1, 'method': 'subscribe', 'params': {'channels': channels},
+                                'nonce': int(time.time() * 1000)})
+            started = time.monotonic()
+            while time.monotonic() - started < duration:
+                try:
+                    message = await ws.receive(timeout=max(0.1, duration - (time.monotonic() - started)))
+                except asyncio.TimeoutError:
+                    break
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    break
+                data = json.loads(message.data)
+                if data.get('method') == 'public/heartbeat':
+                    await ws.send_json({'id': data.get('id'), 'method': 'public/respond-heartbeat'})
+                elif data.get('result', {}).get('data') is not None:
+                    records.append({'offset': round(time.monotonic() - started, 6), 'message': data})
+    return records
+
+
+class _Client:
+    def __init__(self, ws: web.WebSocketResponse):
+        self.ws = ws
+        self.subscriptions: Set[str] = set()
+        self.heartbeat_pending = None  # id of the unanswered heartbeat
+        self.sent = 0
+
+
+class ReplayServer:
+    """Replays a recording to every connected client, like the exchange would
+    
+    Playback runs on one shared clock: a client that reconnects resumes at
+    the current position, missing whatever was pushed while it was away.
+    On subscribe a client gets the latest ticker and book and the candles so
+    far for that channel, as a snapshot. Heartbeats are sent every
+    `heartbeat_interval` seconds and clients that do not answer before the
+    next one are disconnected.
+    
+    Fault injection for tests: `drop_every` silently skips every Nth push to
+    each client (creates sequence gaps) and `disconnect_after` closes every
+    connection once that many pushes have been played.
+    
+    With `stamp_field` set, each pushed data entry gets the wall-clock send
+    time in milliseconds under that key, for latency measurements.
+    """
+    
+    def __init__(self, records: List[dict], host: str = '127.0.0.1', port: int = 0, speed: float = 1.0,
+                 loop: bool = False, heartbeat_interval: float = 30.0, drop_every: int = None,
+                 disconnect_after: int = None, max_snapshot_candles: int = 300, stamp_field: str = None,
+                 autoplay: bool = True):
+        self.records = sorted(records, key=lambda record: record['offset'])
+        self.host = host
+        self.port = port
+        self.speed = speed  # 0 plays as fast as possible
+        self.loop = loop
+        self.heartbeat_interval = heartbeat_interval
+        self.drop_every = drop_every
+        self.disconnect_after = disconnect_after
+        self.max_snapshot_candles = max_snapshot_candles
+        self.stamp_field = stamp_field
+        self.autoplay = autoplay  # False: wait for play(), e.g. until clients have subscribed
+        
+        self.clients: Set[_Client] = set()
+        self.latest: Dict[str, dict] = {}  # subscription -> latest push (ticker, book)
+        self.candles: Dict[str, Dict[int, dict]] = {}  # subscription -> candles by timestamp
+        self.played = 0
+        self._runner = None
+        self._tasks = []
+        self._thread = None
+        self._loop = None
+        self._ready = threading.Event()
+        self._done = threading.Event()
+    
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/exchange/v1/market"
+    
+    # Asyncio API
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        self._tasks = [asyncio.ensure_future(self._heartbeats())]
+        if self.autoplay:
+            self.play()
+        logger.info(f"Replay server listening on {self.url} ({len(self.records)} messages)")
+    
+    def play(self):
+        """Start playing the recording (call on the server's event loop)"""
+        self._done.clear()
+        self._tasks.append(asyncio.ensure_future(self._playback()))
+    
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for client in list(self.clients):
+            await client.ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+    
+    # Thread API for synchronous callers (tests, benchmarks)
+    def start_in_thread(self) -> str:
+        """Run the server on its own event loop thread; returns the WebSocket URL"""
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            self._ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+        
+        self._thread = threading.Thread(target=run, name='market-replay', daemon=True)
+        self._thread.start()
+        self._ready.wait(10)
+        return self.url
+    
+    def play_in_thread(self):
+        """Start playback of a server running on its own thread"""
+        self._loop.call_soon_threadsafe(self.play)
+    
+    def stop_in_thread(self, timeout: float = 5.0):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def wait_finished(self, timeout: float = None) -> bool:
+        """Block until the recording has been played to the end (not with loop=True)"""
+        return self._done.wait(timeout)
+    
+    # Server side
+    async def _handle(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        client = _Client(ws)
+        self.clients.add(client)
+        try:
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                data = json.loads(message.data)
+                method = data.get('method')
+                if method == 'public/respond-heartbeat':
+                    if data.get('id') == client.heartbeat_pending:
+                        client.heartbeat_pending = None
+                elif method in ('subscribe', 'unsubscribe'):
+                    channels = data.get('params', {}).get('channels', [])
+                    await ws.send_json({'id': data.get('id'), 'method': method, 'code': 0})
+                    if method == 'subscribe':
+                        client.subscriptions.update(channels)
+                        for channel in channels:
+                            await self._send_snapshot(client, channel)
+                    else:
+                        client.subscriptions.difference_update(channels)
+                else:
+                    await ws.send_json({'id': data.get('id'), 'method': method, 'code': 10004,
+                                        'message': 'BAD_REQUEST'})
+        finally:
+            self.clients.discard(client)
+        return ws
+    
+    async def _send_snapshot(self, client: _Client, subscription: str):
+        if subscription in self.candles:
+            candles = self.candles[subscription]
+            data = [candles[timestamp] for timestamp in sorted(candles)[-self.max_snapshot_candles:]]
+            message = json.loads(json.dumps(self.latest[subscription]))
+            message['result']['data'] = data
+        elif subscription in self.latest:
+            message = json.loads(json.dumps(self.latest[subscription]))
+            # A snapshot starts a new book sequence
+            for entry in message['result']['data']:
+                entry.pop('pu', None)
+        else:
+            return
+        await client.ws.send_str(json.dumps(message))
+    
+    def _remember(self, message: dict):
+        result = message.get('result', {})
+        subscription = result.get('subscription')
+        if result.get('channel') == 'candlestick':
+            candles = self.candles.setdefault(subscription, {})
+            for candle in result.get('data', []):
+                candles[int(candle['t'])] = candle
+        self.latest[subscription] = message
+    
+    async def _playback(self):
+        while True:
+            started = time.monotonic()
+            for record in self.records:
+                if self.speed:
+                    delay = started + record['offset'] / self.speed - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                
+                message = record['message']
+                self._remember(message)
+                subscription = message.get('result', {}).get('subscription')
+                if self.stamp_field:
+                    message = json.loads(json.dumps(message))
+                    sent_at = round(time.time() * 1000, 3)
+                    for entry in message['result'].get('data', []):
+                        entry[self.stamp_field] = sent_at
+                payload = json.dumps(message)
+                self.played += 1
+                
+                for client in list(self.clients):
+                    if subscription not in client.subscriptions or client.ws.closed:
+                        continue
+                    client.sent += 1
+                    if self.drop_every and client.sent % self.drop_every == 0:
+                        continue
+                    try:
+                        await client.ws.send_str(payload)
+                    except Exception:
+                        self.clients.discard(client)
+                
+                if self.disconnect_after and self.played == self.disconnect_after:
+                    for client in list(self.clients):
+                        await client.ws.close()
+                
+                if not self.speed and self.played % 100 == 0:
+                    await asyncio.sleep(0)  # Let clients run when playing flat out
+            
+            if not self.loop:
+                self._done.set()
+                return
+    
+    async def _heartbeats(self):
+        heartbeat_id = 0
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            for client in list(self.clients):
+                if client.heartbeat_pending is not None:
+                    logger.info("Replay client missed a heartbeat, disconnecting")
+                    await client.ws.close()
+                    continue
+                heartbeat_id += 1
+                client.heartbeat_pending = heartbeat_id
+                await client.ws.send_json({'id': heartbeat_id, 'method': 'public/heartbeat', 'code': 0})
+
+
+def _channels(instruments: List[str], timeframe: str, book_depth: int) -> List[str]:
+    channels = []
+    for name in instruments:
+        channels += [f"ticker.{name}", f"book.{name}.{book_depth}", f"candlestick.{timeframe}.{name}"]
+    return channels
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Record, synthesize or replay exchange market data")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    record_parser = commands.add_parser('record', help='record live market data')
+    record_parser.add_argument('path')
+    record_parser.add_argument('--instruments', required=True, help='comma separated instrument names')
+    record_parser.add_argument('--duration', type=float, default=60)
+    record_parser.add_argument('--timeframe', default='1m')
+    record_parser.add_argument('--depth', type=int, default=10)
+    record_parser.add_argument('--url', default=SANDBOX_STREAM_URL)
+    
+    synth_parser = commands.add_parser('synthesize', help='generate a random-walk recording')
+    synth_parser.add_argument('path')
+    synth_parser.add_argument('--instruments', type=int, default=10)
+    synth_parser.add_argument('--duration', type=float, default=60)
+    synth_parser.add_argument('--rate', type=float, default=5, help='updates per instrument per second')
+    synth_parser.add_argument('--timeframe', default='1m')
+    
+    serve_parser = commands.add_parser('serve', help='replay a recording')
+    serve_parser.add_argument('path')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--speed', type=float, default=1.0, help='playback speed, 0 for flat out')
+    serve_parser.add_argument('--loop', action='store_true')
+    serve_parser.add_argument('--heartbeat', type=float, default=30.0)
+    
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    if args.command == 'record':
+        instruments = [name.strip() for name in args.instruments.split(',') if name.strip()]
+        records = asyncio.run(record(args.url, _channels(instruments, args.timeframe, args.depth), args.duration))
+        save_recording(args.path, records)
+        print(f"Recorded {len(records)} messages to {args.path}")
+    elif args.command == 'synthesize':
+        instruments = [f"SYN{i}_USDT" for i in range(args.instruments)]
+        records = synthesize_recording(instruments, args.duration, args.rate, args.timeframe)
+        save_recording(args.path, records)
+        print(f"Wrote {len(records)} messages for {len(instruments)} instruments to {args.path}")
+    else:
+        server = ReplayServer(load_recording(args.path), host=args.host, port=args.port, speed=args.speed,
+                              loop=args.loop, heartbeat_interval=args.heartbeat)
+        
+        async def serve():
+            await server.start()
+            print(f"Replaying {args.path} on {server.url}")
+            while True:
+                await asyncio.sleep(3600)
+        
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
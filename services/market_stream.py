@@ -0,0 +1,394 @@
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+import logging
+from typing import Dict, Iterable, List, Optional
+import aiohttp
+import pandas as pd
+from services.candle_store import CandleSeries, TIMEFRAME_MS
+from services.market_data import PriceTable
+
+logger = logging.getLogger(__name__)
+
+SANDBOX_STREAM_URL = "wss://uat-stream.3ona.co/exchange/v1/market"
+PRODUCTION_STREAM_URL = "wss://stream.crypto.com/exchange/v1/market"
+
+DEFAULT_CHANNELS = ('ticker', 'book', 'candlestick')
+
+
+class InstrumentState:
+    """Latest streamed ticker, order book and candles for one instrument"""
+    
+    def __init__(self, instrument_name: str):
+        self.instrument_name = instrument_name
+        self.ticker: Optional[dict] = None
+        self.bids: Dict[float, tuple] = {}  # price -> (quantity, order count)
+        self.asks: Dict[float, tuple] = {}
+        self.book_update_id: Optional[int] = None
+        self.book_timestamp: Optional[int] = None
+        self.candles: Dict[str, CandleSeries] = {}  # timeframe -> series
+        self.updated_at: Optional[float] = None
+    
+    @staticmethod
+    def _levels(levels: Iterable) -> Dict[float, tuple]:
+        book = {}
+        for level in levels or []:
+            price = float(level[0])
+            quantity = float(level[1])
+            if quantity > 0:
+                book[price] = (quantity, int(level[2]) if len(level) > 2 else 0)
+        return book
+    
+    def set_book(self, bids: Iterable, asks: Iterable, update_id: Optional[int], timestamp: Optional[int]):
+        """Replace the book with a snapshot"""
+        self.bids = self._levels(bids)
+        self.asks = self._levels(asks)
+        self.book_update_id = update_id
+        self.book_timestamp = timestamp
+    
+    def apply_book_delta(self, bids: Iterable, asks: Iterable, update_id: Optional[int], timestamp: Optional[int]):
+        """Apply an incremental book update; a zero quantity removes the level"""
+        for side, levels in ((self.bids, bids), (self.asks, asks)):
+            for level in levels or []:
+                price = float(level[0])
+                quantity = float(level[1])
+                if quantity > 0:
+                    side[price] = (quantity, int(level[2]) if len(level) > 2 else 0)
+                else:
+                    side.pop(price, None)
+        self.book_update_id = update_id
+        self.book_timestamp = timestamp
+    
+    def book(self, depth: int = None) -> dict:
+        bids = sorted(self.bids.items(), key=lambda level: -level[0])[:depth]
+        asks = sorted(self.asks.items(), key=lambda level: level[0])[:depth]
+        return {
+            'bids': [[price, quantity, count] for price, (quantity, count) in bids],
+            'asks': [[price, quantity, count] for price, (quantity, count) in asks],
+            'u': self.book_update_id,
+            't': self.book_timestamp
+        }
+
+
+class MarketStream:
+    """Streaming market data over the exchange WebSocket
+    
+    Subscribes to ticker, book and candlestick channels for a set of
+    instruments and keeps the latest state per instrument in memory. Runs its
+    own asyncio loop in a background thread.
+    
+    - Heartbeats from the server are answered; if nothing arrives within
+      `heartbeat_timeout` the connection is treated as dead.
+    - Dropped connections are re-established with exponential backoff and
+      every channel is subscribed again.
+    - A book update whose previous update id does not match the last one
+      applied, or a candle that skips an interval, is a gap: the affected
+      channel is resubscribed to get a fresh snapshot.
+    
+    Ticker updates are published to a PriceTable (observe()), so anything
+    listening for prices (e.g. event-driven TP/SL) reacts to streamed ticks.
+    """
+    
+    def __init__(self, instruments: Iterable[str] = None, channels: Iterable[str] = DEFAULT_CHANNELS,
+                 timeframe: str = '5m', book_depth: int = 10, url: str = None, sandbox: bool = True,
+                 price_table: PriceTable = None, heartbeat_timeout: float = 35.0,
+                 max_reconnect_delay: float = 30.0, subscribe_delay: float = None, max_candles: int = 1000):
+        if sandbox:
+            default_url = SANDBOX_STREAM_URL
+        else:
+            default_url = PRODUCTION_STREAM_URL
+        self.url = url or os.getenv('MARKET_STREAM_URL', default_url)
+        self.instruments = set(instruments or [])
+        self.channels = tuple(channels)
+        self.timeframe = timeframe
+        self.book_depth = book_depth
+        self.price_table = price_table
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_reconnect_delay = max_reconnect_delay
+        self.max_candles = max_candles
+        # The exchange asks clients to wait 1s after connecting before sending requests
+        if subscribe_delay is None:
+            subscribe_delay = float(os.getenv('MARKET_STREAM_SUBSCRIBE_DELAY', 1.0))
+        self.subscribe_delay = subscribe_delay
+        
+        self.states: Dict[str, InstrumentState] = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.connected = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._ws = None
+        self._stop_event = None
+        self._request_id = 0
+        
+        # Counters
+        self.messages = 0
+        self.updates = {channel: 0 for channel in ('ticker', 'book', 'candlestick')}
+        self.connects = 0
+        self.reconnects = 0
+        self.gaps = 0
+        self.heartbeats = 0
+        self.errors = 0
+        self.last_message_at = None
+    
+    # Subscriptions
+    def channels_for(self, instrument_name: str) -> List[str]:
+        """Subscription names for one instrument"""
+        names = []
+        for channel in self.channels:
+            if channel == 'ticker':
+                names.append(f"ticker.{instrument_name}")
+            elif channel == 'book':
+                names.append(f"book.{instrument_name}.{self.book_depth}")
+            elif channel == 'candlestick':
+                names.append(f"candlestick.{self.timeframe}.{instrument_name}")
+        return names
+    
+    def _all_channels(self) -> List[str]:
+        return [name for instrument_name in sorted(self.instruments) for name in self.channels_for(instrument_name)]
+    
+    def subscribe(self, instruments: Iterable[str]):
+        """Start streaming more instruments (takes effect immediately when connected)"""
+        added = [name for name in instruments if name not in self.instruments]
+        self.instruments.update(added)
+        if added and self.connected.is_set():
+            channels = [name for instrument_name in added for name in self.channels_for(instrument_name)]
+            asyncio.run_coroutine_threadsafe(self._send('subscribe', channels), self._loop)
+    
+    def unsubscribe(self, instruments: Iterable[str]):
+        removed = [name for name in instruments if name in self.instruments]
+        self.instruments.difference_update(removed)
+        if removed and self.connected.is_set():
+            channels = [name for instrument_name in removed for name in self.channels_for(instrument_name)]
+            asyncio.run_coroutine_threadsafe(self._send('unsubscribe', channels), self._loop)
+    
+    # Lifecycle
+    def start(self):
+        """Connect and stream in a background thread"""
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._run_loop, name='market-stream', daemon=True)
+        self._thread.start()
+        logger.info(f"Market stream starting for {len(self.instruments)} instruments at {self.url}")
+    
+    def stop(self, timeout: float = 5.0):
+        self.running = False
+        if self._loop is not None and self._stop_event is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        logger.info("Market stream stopped")
+    
+    def wait_connected(self, timeout: float = None) -> bool:
+        return self.connected.wait(timeout)
+    
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+    
+    async def _main(self):
+        self._stop_event = asyncio.Event()
+        delay = 1.0
+        async with aiohttp.ClientSession() as session:
+            while self.running:
+                try:
+                    await self._connect_and_read(session)
+                    delay = 1.0
+                except Exception as e:
+                    if not self.running:
+                        break
+                    self.errors += 1
+                    logger.warning(f"Market stream connection lost: {str(e)}")
+                
+                if not self.running:
+                    break
+                
+                # Reconnect with exponential backoff and jitter
+                self.reconnects += 1
+                wait = delay * (0.5 + random.random() / 2)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+    
+    async def _connect_and_read(self, session: aiohttp.ClientSession):
+        async with session.ws_connect(self.url, autoping=True) as ws:
+            self._ws = ws
+            self.connects += 1
+            stop_task = asyncio.ensure_future(self._stop_event.wait())
+            try:
+                if self.subscribe_delay:
+                    await asyncio.sleep(self.subscribe_delay)
+                await self._send('subscribe', self._all_channels())
+                self.connected.set()
+                logger.info(f"Market stream connected, {len(self.instruments)} instruments subscribed")
+                
+                while self.running:
+                    receive_task = asyncio.ensure_future(ws.receive())
+                    done, _ = await asyncio.wait({receive_task, stop_task}, timeout=self.heartbeat_timeout,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    if stop_task in done:
+                        receive_task.cancel()
+                        break
+                    if receive_task not in done:
+                        receive_task.cancel()
+                        raise ConnectionError(f"no message for {self.heartbeat_timeout}s")
+                    
+                    message = receive_task.result()
+                    if message.type == aiohttp.WSMsgType.TEXT:
+                        await self._handle(json.loads(message.data))
+                    elif message.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED,
+                                          aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.ERROR):
+                        raise ConnectionError(f"websocket closed ({message.type.name})")
+            finally:
+                stop_task.cancel()
+                self.connected.clear()
+                self._ws = None
+    
+    async def _send(self, method: str, channels: List[str]):
+        if not channels or self._ws is None:
+            return
+        self._request_id += 1
+        await self._ws.send_json({
+            'id': self._request_id,
+            'method': method,
+            'params': {'channels': channels},
+            'nonce': int(time.time() * 1000)
+        })
+    
+    async def _resubscribe(self, subscription: str):
+        """Get a fresh snapshot for one channel after a gap"""
+        await self._send('unsubscribe', [subscription])
+        await self._send('subscribe', [subscription])
+    
+    # Message handling
+    async def _handle(self, message: dict):
+        self.messages += 1
+        self.last_message_at = time.time()
+        method = message.get('method')
+        
+        if method == 'public/heartbeat':
+            self.heartbeats += 1
+            await self._ws.send_json({'id': message.get('id'), 'method': 'public/respond-heartbeat'})
+            return
+        
+        if message.get('code'):
+            self.errors += 1
+            logger.error(f"Market stream error response: {message}")
+            return
+        
+        result = message.get('result')
+        if method == 'subscribe' and result and result.get('data') is not None:
+            gap = self._apply(result)
+            if gap:
+                self.gaps += 1
+                logger.info(f"Market stream gap on {result.get('subscription')}, resubscribing")
+                await self._resubscribe(result.get('subscription'))
+    
+    def _state(self, instrument_name: str) -> InstrumentState:
+        state = self.states.get(instrument_name)
+        if state is None:
+            state = self.states[instrument_name] = InstrumentState(instrument_name)
+        return state
+    
+    def _apply(self, result: dict) -> bool:
+        """Apply a channel push to the instrument state; returns True on a sequence gap"""
+        channel = result.get('channel')
+        instrument_name = result.get('instrument_name')
+        data = result.get('data') or []
+        if not instrument_name or not data:
+            return False
+        
+        if channel == 'ticker':
+            ticker = data[-1]
+            with self.lock:
+                state = self._state(instrument_name)
+                state.ticker = ticker
+                state.updated_at = time.time()
+            self.updates['ticker'] += 1
+            if self.price_table is not None and ticker.get('a') is not None:
+                self.price_table.observe(instrument_name, float(ticker['a']), **ticker)
+            return False
+        
+        if channel in ('book', 'book.update'):
+            with self.lock:
+                state = self._state(instrument_name)
+                for entry in data:
+                    previous_id = entry.get('pu')
+                    if previous_id is not None and state.book_update_id is not None \
+                            and previous_id != state.book_update_id:
+                        # Accept whatever snapshot the resubscribe brings
+                        state.book_update_id = None
+                        return True
+                    if 'update' in entry:
+                        update = entry['update']
+                        state.apply_book_delta(update.get('bids'), update.get('asks'), entry.get('u'), entry.get('t'))
+                    else:
+                        state.set_book(entry.get('bids'), entry.get('asks'), entry.get('u'), entry.get('t'))
+                state.updated_at = time.time()
+            self.updates['book'] += 1
+            return False
+        
+        if channel == 'candlestick':
+            timeframe = result.get('interval') or self.timeframe
+            interval_ms = TIMEFRAME_MS.get(timeframe)
+            with self.lock:
+                state = self._state(instrument_name)
+                series = state.candles.setdefault(timeframe, CandleSeries())
+                first_timestamp = min(int(candle['t']) for candle in data)
+                if interval_ms and series.last_timestamp is not None \
+                        and first_timestamp > series.last_timestamp + interval_ms:
+                    # Missed at least one candle; the resubscribe snapshot fills it in
+                    return True
+                series.merge(data, self.max_candles)
+                state.updated_at = time.time()
+            self.updates['candlestick'] += 1
+            return False
+        
+        return False
+    
+    # Readers
+    def get_ticker(self, instrument_name: str) -> Optional[dict]:
+        with self.lock:
+            state = self.states.get(instrument_name)
+            return dict(state.ticker) if state and state.ticker else None
+    
+    def get_orderbook(self, instrument_name: str, depth: int = None) -> Optional[dict]:
+        with self.lock:
+            state = self.states.get(instrument_name)
+            if state is None or state.book_update_id is None and not state.bids and not state.asks:
+                return None
+            return state.book(depth or self.book_depth)
+    
+    def get_candles(self, instrument_name: str, timeframe: str = None, count: int = None) -> Optional[pd.DataFrame]:
+        """Streamed candles as a DataFrame in the format TechnicalAnalysisService expects"""
+        with self.lock:
+            state = self.states.get(instrument_name)
+            series = state.candles.get(timeframe or self.timeframe) if state else None
+            if series is None or not len(series):
+                return None
+            return series.to_frame(count or len(series))
+    
+    def stats(self) -> Dict:
+        return {
+            'url': self.url,
+            'connected': self.connected.is_set(),
+            'instruments': len(self.instruments),
+            'messages': self.messages,
+            'updates': dict(self.updates),
+            'connects': self.connects,
+            'reconnects': self.reconnects,
+            'gaps': self.gaps,
+            'heartbeats': self.heartbeats,
+            'errors': self.errors,
+            'last_message_at': self.last_message_at
+        }
@@ -0,0 +1,65 @@
+import threading
+from bisect import bisect_left
+from typing import Dict, Sequence
+
+# Upper bounds in milliseconds; anything slower lands in the overflow bucket
+DEFAULT_LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Thread-safe fixed-bucket latency histogram"""
+    
+    def __init__(self, name: str, buckets_ms: Sequence[float] = DEFAULT_LATENCY_BUCKETS_MS):
+        self.name = name
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.lock = threading.Lock()
+    
+    def observe(self, seconds: float):
+        """Record one latency sample given in seconds"""
+        ms = max(seconds, 0.0) * 1000
+        with self.lock:
+            self.counts[bisect_left(self.buckets_ms, ms)] += 1
+            self.count += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+    
+    def percentile(self, fraction: float) -> float:
+        """Upper bucket bound containing the given fraction of samples (ms)"""
+        with self.lock:
+            if not self.count:
+                return 0.0
+            target = fraction * self.count
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= target:
+                    return float(self.buckets_ms[index]) if index < len(self.buckets_ms) else self.max_ms
+            return self.max_ms
+    
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * (len(self.buckets_ms) + 1)
+            self.count = 0
+            self.total_ms = 0.0
+            self.max_ms = 0.0
+    
+    def stats(self) -> Dict:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        p99 = self.percentile(0.99)
+        with self.lock:
+            buckets = {f"le_{bound}ms": count for bound, count in zip(self.buckets_ms, self.counts)}
+            buckets['overflow'] = self.counts[-1]
+            return {
+                'count': self.count,
+                'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+                'max_ms': round(self.max_ms, 3),
+                'p50_ms': p50,
+                'p95_ms': p95,
+                'p99_ms': p99,
+                'buckets': buckets
+            }
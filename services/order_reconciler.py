@@ -0,0 +1,320 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from models import db, Order, Position, SyncCursor, SystemLog
+
+logger = logging.getLogger(__name__)
+
+CURSOR_NAME = 'orders'
+PENDING_STATUSES = ('PENDING', 'PARTIALLY_FILLED')
+
+# Exchange order status -> local terminal status
+TERMINAL_STATUSES = {
+    'CANCELED': 'CANCELLED',
+    'CANCELLED': 'CANCELLED',
+    'EXPIRED': 'CANCELLED',
+    'REJECTED': 'REJECTED',
+}
+
+
+async def _run_inline(function, *args):
+    return function(*args)
+
+
+class ExchangeOrderSnapshot:
+    """Exchange-side state of the orders that changed in a sync window"""
+    
+    def __init__(self, start_ts: int, end_ts: int):
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.orders: Dict[str, dict] = {}  # exchange order id -> merged status
+        self.complete = True  # False if paging stopped before the end of the window
+        self.requests = 0
+    
+    @staticmethod
+    def _update_time(order: dict) -> int:
+        return int(order.get('update_time') or order.get('create_time') or 0)
+    
+    def add_orders(self, orders: List[dict]):
+        """Merge order records; the most recently updated record per order wins"""
+        for record in orders:
+            order_id = str(record.get('order_id') or '')
+            if not order_id:
+                continue
+            known = self.orders.get(order_id)
+            if known is None or self._update_time(record) >= self._update_time(known):
+                self.orders[order_id] = dict(record)
+    
+    def add_trades(self, trades: List[dict]):
+        """Fold executed trades into the order records they belong to"""
+        fills: Dict[str, List[float]] = {}  # order id -> [quantity, notional]
+        for trade in trades:
+            order_id = str(trade.get('order_id') or '')
+            if not order_id:
+                continue
+            quantity = float(trade.get('traded_quantity', 0) or 0)
+            fill = fills.setdefault(order_id, [0.0, 0.0])
+            fill[0] += quantity
+            fill[1] += quantity * float(trade.get('traded_price', 0) or 0)
+        
+        for order_id, (quantity, notional) in fills.items():
+            record = self.orders.setdefault(order_id, {'order_id': order_id, 'status': 'ACTIVE'})
+            if quantity > float(record.get('cumulative_quantity', 0) or 0):
+                # Trades seen after the last order record was taken
+                record['cumulative_quantity'] = quantity
+                record['avg_price'] = notional / quantity if quantity else 0.0
+
+
+class OrderReconciler:
+    """Bulk order reconciliation against open orders and order/trade history
+    
+    Each cycle downloads the open orders plus every order and trade that
+    changed since the persisted sync cursor (paged), diffs them in memory
+    against the local pending Order rows and applies all fills, partial fills
+    and cancels in one transaction together with the new cursor. API cost per
+    cycle depends on how much changed, not on how many orders are pending.
+    
+    Pending orders the window cannot account for (e.g. placed before the
+    first sync) are looked up individually, a bounded number per cycle.
+    """
+    
+    def __init__(self, exchange_api, page_size: int = 100, max_pages: int = 20,
+                 overlap_ms: int = 60000, initial_lookback_ms: int = 86400000,
+                 max_status_lookups: int = None,
+                 open_position: Callable[[Order], Optional[Position]] = None,
+                 position_opened: Callable[[Position], None] = None):
+        self.exchange_api = exchange_api
+        self.page_size = page_size
+        self.max_pages = max_pages  # Per history stream per cycle
+        self.overlap_ms = overlap_ms  # Re-read this much before the cursor to tolerate clock skew
+        self.initial_lookback_ms = initial_lookback_ms  # Window start when there is no cursor yet
+        self.max_status_lookups = max_status_lookups if max_status_lookups is not None else \
+            int(os.getenv('ORDER_SYNC_MAX_LOOKUPS', 10))
+        
+        # Position handling for filled buy orders: open_position must not commit,
+        # position_opened runs after the transaction is committed
+        self.open_position = open_position
+        self.position_opened = position_opened
+        
+        self.last_sync_stats = None
+    
+    # Sync window
+    def _window(self, pending_orders: List[Order]) -> Dict[str, int]:
+        now_ms = int(time.time() * 1000)
+        cursor = SyncCursor.query.filter_by(name=CURSOR_NAME).first()
+        if cursor is not None and cursor.cursor_ts:
+            start_ts = cursor.cursor_ts - self.overlap_ms
+        else:
+            oldest = min((order.created_at for order in pending_orders if order.created_at), default=None)
+            start_ts = now_ms - self.initial_lookback_ms
+            if oldest is not None:
+                start_ts = max(start_ts, int((oldest - datetime(1970, 1, 1)).total_seconds() * 1000) - self.overlap_ms)
+        return {'start_ts': start_ts, 'end_ts': now_ms}
+    
+    @staticmethod
+    def _pending_orders() -> List[Order]:
+        return Order.query.filter(
+            Order.status.in_(PENDING_STATUSES),
+            Order.exchange_order_id.isnot(None)
+        ).all()
+    
+    def _unaccounted(self, pending_orders: List[Order], snapshot: ExchangeOrderSnapshot) -> List[Order]:
+        """Pending orders older than the window that no snapshot record covers, oldest first"""
+        window_start = datetime.utcfromtimestamp(snapshot.start_ts / 1000)
+        missing = [order for order in pending_orders
+                   if order.exchange_order_id not in snapshot.orders
+                   and order.created_at is not None and order.created_at < window_start]
+        missing.sort(key=lambda order: order.created_at)
+        return missing[:self.max_status_lookups]
+    
+    # Exchange I/O
+    def _fetch_pages(self, fetch: Callable[..., List[dict]], snapshot: ExchangeOrderSnapshot) -> List[dict]:
+        records = []
+        for page in range(self.max_pages):
+            batch = fetch(start_ts=snapshot.start_ts, end_ts=snapshot.end_ts,
+                          page_size=self.page_size, page=page)
+            snapshot.requests += 1
+            records.extend(batch)
+            if len(batch) < self.page_size:
+                return records
+        snapshot.complete = False
+        return records
+    
+    def fetch_snapshot(self, pending_orders: List[Order]) -> ExchangeOrderSnapshot:
+        """Download everything that changed in the sync window"""
+        snapshot = ExchangeOrderSnapshot(**self._window(pending_orders))
+        
+        snapshot.add_orders(self._fetch_pages(self.exchange_api.get_order_history, snapshot))
+        snapshot.add_orders(self.exchange_api.get_open_orders())
+        snapshot.requests += 1
+        snapshot.add_trades(self._fetch_pages(self.exchange_api.get_trades, snapshot))
+        
+        for order in self._unaccounted(pending_orders, snapshot):
+            status = self.exchange_api.get_order_status(order.exchange_order_id)
+            snapshot.requests += 1
+            if status:
+                snapshot.add_orders([dict(status, order_id=order.exchange_order_id)])
+        return snapshot
+    
+    async def _fetch_pages_async(self, fetch, snapshot: ExchangeOrderSnapshot) -> List[dict]:
+        records = []
+        for page in range(self.max_pages):
+            batch = await fetch(start_ts=snapshot.start_ts, end_ts=snapshot.end_ts,
+                                page_size=self.page_size, page=page)
+            snapshot.requests += 1
+            records.extend(batch)
+            if len(batch) < self.page_size:
+                return records
+        snapshot.complete = False
+        return records
+    
+    async def fetch_snapshot_async(self, pending_orders: List[Order], async_api,
+                                   window: Dict[str, int] = None) -> ExchangeOrderSnapshot:
+        """fetch_snapshot() on an event loop; the three streams are downloaded concurrently"""
+        snapshot = ExchangeOrderSnapshot(**(window or self._window(pending_orders)))
+        
+        history, open_orders, trades = await asyncio.gather(
+            self._fetch_pages_async(async_api.get_order_history, snapshot),
+            async_api.get_open_orders(),
+            self._fetch_pages_async(async_api.get_trades, snapshot)
+        )
+        snapshot.requests += 1
+        snapshot.add_orders(history)
+        snapshot.add_orders(open_orders)
+        snapshot.add_trades(trades)
+        
+        missing = self._unaccounted(pending_orders, snapshot)
+        statuses = await asyncio.gather(*(async_api.get_order_status(order.exchange_order_id) for order in missing))
+        snapshot.requests += len(missing)
+        for order, status in zip(missing, statuses):
+            if status:
+                snapshot.add_orders([dict(status, order_id=order.exchange_order_id)])
+        return snapshot
+    
+    # Applying changes
+    def apply_status(self, order: Order, record: dict) -> Optional[str]:
+        """Move a local order to its exchange state (not committed); returns the change made"""
+        exchange_status = str(record.get('status', '')).upper()
+        filled_quantity = float(record.get('cumulative_quantity', 0) or 0)
+        avg_price = float(record.get('avg_price', 0) or 0)
+        change = None
+        
+        if filled_quantity > (order.filled_quantity or 0):
+            order.filled_quantity = filled_quantity
+            order.average_fill_price = avg_price or order.average_fill_price
+            change = 'partial_fill'
+        
+        if exchange_status in TERMINAL_STATUSES:
+            order.status = TERMINAL_STATUSES[exchange_status]
+            if order.status == 'CANCELLED':
+                order.cancelled_at = datetime.utcnow()
+            return order.status.lower()
+        
+        if exchange_status == 'FILLED' or (order.filled_quantity and order.filled_quantity >= order.quantity):
+            order.status = 'FILLED'
+            order.filled_at = datetime.utcnow()
+            return 'filled'
+        
+        if change and order.status != 'PARTIALLY_FILLED':
+            order.status = 'PARTIALLY_FILLED'
+        return change
+    
+    def apply(self, pending_orders: List[Order], snapshot: ExchangeOrderSnapshot) -> Dict:
+        """Apply a snapshot to the pending orders and advance the cursor in one transaction"""
+        changes = {}
+        opened = []
+        
+        try:
+            for order in pending_orders:
+                record = snapshot.orders.get(order.exchange_order_id)
+                if record is None:
+                    continue
+                
+                change = self.apply_status(order, record)
+                if change is None:
+                    continue
+                changes[change] = changes.get(change, 0) + 1
+                
+                if change == 'filled' and order.side == 'BUY' and self.open_position is not None:
+                    position = self.open_position(order)
+                    if position is not None:
+                        opened.append(position)
+            
+            if snapshot.complete:
+                SyncCursor.get(CURSOR_NAME).cursor_ts = snapshot.end_ts
+            else:
+                logger.warning("Order history paging hit max_pages; keeping the sync cursor for the next cycle")
+            
+            db.session.commit()
+        
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error applying order reconciliation: {str(e)}")
+            raise
+        
+        for position in opened:
+            if self.position_opened is not None:
+                self.position_opened(position)
+        
+        if changes:
+            SystemLog.log(
+                level='INFO',
+                category='TRADING',
+                message="Orders reconciled: " + ", ".join(f"{count} {change}" for change, count in changes.items()),
+                details={'changes': changes, 'requests': snapshot.requests,
+                         'start_ts': snapshot.start_ts, 'end_ts': snapshot.end_ts}
+            )
+        
+        return {
+            'pending': len(pending_orders),
+            'exchange_records': len(snapshot.orders),
+            'requests': snapshot.requests,
+            'changes': changes,
+            'positions_opened': len(opened),
+            'cursor': snapshot.end_ts if snapshot.complete else None
+        }
+    
+    def _advance_idle_cursor(self) -> Dict:
+        """Nothing pending: move the cursor towards now so the next window stays short
+        
+        The idle cursor is rounded down to the overlap step, so it is only
+        written when that value actually moves (at most once per step).
+        """
+        now_ms = int(time.time() * 1000)
+        idle_ts = now_ms - now_ms % max(self.overlap_ms, 1)
+        cursor = SyncCursor.get(CURSOR_NAME)
+        if cursor.cursor_ts is None or cursor.cursor_ts < idle_ts:
+            cursor.cursor_ts = idle_ts
+            db.session.commit()
+        return {'pending': 0, 'exchange_records': 0, 'requests': 0, 'changes': {},
+                'positions_opened': 0}
+    
+    def reconcile(self) -> Dict:
+        """Run one reconciliation cycle"""
+        pending_orders = self._pending_orders()
+        if not pending_orders:
+            stats = self._advance_idle_cursor()
+        else:
+            stats = self.apply(pending_orders, self.fetch_snapshot(pending_orders))
+        self.last_sync_stats = stats
+        return stats
+    
+    async def reconcile_async(self, async_api, run_db=None) -> Dict:
+        """reconcile() with the exchange downloads on an event loop
+        
+        Database steps are awaited through `run_db(function, *args)` when given
+        (e.g. a run_in_executor wrapper) so they stay off the loop thread.
+        """
+        run_db = run_db or _run_inline
+        pending_orders = await run_db(self._pending_orders)
+        if not pending_orders:
+            stats = await run_db(self._advance_idle_cursor)
+        else:
+            window = await run_db(self._window, pending_orders)
+            snapshot = await self.fetch_snapshot_async(pending_orders, async_api, window)
+            stats = await run_db(self.apply, pending_orders, snapshot)
+        self.last_sync_stats = stats
+        return stats
@@ -0,0 +1,108 @@
+import json
+import base64
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, or_, func, select, text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+COUNT_CAP = 10000  # Count exactly up to this many rows, estimate above
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Opaque cursor for the row a page ended at"""
+    raw = json.dumps([timestamp.isoformat(), row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """(timestamp, id) from a cursor; raises ValueError if it was not made by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def page_size(args, default: int = None, maximum: int = None) -> int:
+    """`per_page` (or `limit`) query argument clamped to 1..maximum"""
+    default = default or DEFAULT_PAGE_SIZE
+    maximum = maximum or MAX_PAGE_SIZE
+    size = args.get('per_page', type=int) or args.get('limit', type=int) or default
+    return max(1, min(size, maximum))
+
+
+def wants_total(args) -> bool:
+    return args.get('include_total', '').lower() in ('1', 'true', 'yes')
+
+
+def keyset_page(query, timestamp_column, id_column, cursor: Optional[str] = None,
+                per_page: int = DEFAULT_PAGE_SIZE) -> Tuple[List, Optional[str]]:
+    """One page of an ORM query, newest first, and the cursor of the next page (None on the last)
+    
+    Rows are ordered by (timestamp, id) descending and a page starts strictly
+    after the cursor row, so reading page 1000 costs the same index range
+    scan as page 1 and rows inserted meanwhile never shift or repeat a page.
+    """
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        # (timestamp, id) < cursor, with a plain upper bound on timestamp so the index range scan starts there
+        query = query.filter(and_(timestamp_column <= timestamp,
+                                  or_(timestamp_column < timestamp, id_column < row_id)))
+    
+    rows = query.order_by(timestamp_column.desc(), id_column.desc()).limit(per_page + 1).all()
+    if len(rows) <= per_page:
+        return rows, None
+    
+    rows = rows[:per_page]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, timestamp_column.key), getattr(last, id_column.key))
+
+
+def _planner_estimate(session, statement) -> Optional[int]:
+    """Row estimate of a select from the PostgreSQL planner"""
+    compiled = statement.compile(dialect=session.get_bind().dialect, compile_kwargs={'literal_binds': True})
+    plan = session.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def approximate_total(query, cap: int = COUNT_CAP) -> Dict:
+    """Row count of an ORM query without paying for a full COUNT(*) on large tables
+    
+    Counts exactly up to `cap` rows (a LIMITed subquery, so the scan stops
+    there). Past the cap PostgreSQL reports the planner's estimate; other
+    databases report the cap as a lower bound.
+    """
+    statement = query.order_by(None).statement
+    session = query.session
+    counted = session.execute(
+        select(func.count()).select_from(statement.limit(cap + 1).subquery())
+    ).scalar()
+    if counted <= cap:
+        return {'value': counted, 'exact': True}
+    
+    estimate = None
+    if session.get_bind().dialect.name == 'postgresql':
+        try:
+            estimate = _planner_estimate(session, statement)
+        except Exception as e:
+            logger.error(f"Error estimating row count: {str(e)}")
+    return {'value': max(estimate or 0, cap + 1), 'exact': False}
+
+
+def pagination_info(per_page: int, next_cursor: Optional[str], total: Optional[Dict] = None) -> Dict:
+    info = {
+        'per_page': per_page,
+        'next_cursor': next_cursor,
+        'has_next': next_cursor is not None
+    }
+    if total is not None:
+        info['total'] = total['value']
+        info['total_exact'] = total['exact']
+    return info
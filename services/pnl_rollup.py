@@ -0,0 +1,250 @@
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, List, Optional
+from sqlalchemy import event, update, insert, delete, func, case
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import NO_VALUE
+from models import db, DailyPnl, Position
+
+logger = logging.getLogger(__name__)
+
+# Position columns that decide what a position contributes to the rollup
+TRACKED_COLUMNS = ('status', 'exit_date', 'coin_id', 'realized_pnl', 'fees_paid')
+
+# Additive daily_pnl columns
+TOTAL_COLUMNS = ('realized_pnl', 'fees', 'trade_count', 'wins', 'losses')
+
+# Dialects with INSERT .. ON CONFLICT DO UPDATE
+UPSERT_DIALECTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def _contribution(values: Dict) -> Optional[tuple]:
+    """((day, coin_id), totals) a position adds to the rollup, or None while it is not closed"""
+    if values['status'] != 'closed' or values['exit_date'] is None:
+        return None
+    pnl = values['realized_pnl'] or 0.0
+    return (values['exit_date'].date(), values['coin_id']), {
+        'realized_pnl': pnl,
+        'fees': values['fees_paid'] or 0.0,
+        'trade_count': 1,
+        'wins': 1 if pnl > 0 else 0,
+        'losses': 1 if pnl < 0 else 0
+    }
+
+
+def _values(position, previous: bool) -> Dict:
+    """Tracked columns of a position, as they are now or as they were loaded"""
+    state = db.inspect(position)
+    values = {}
+    for column in TRACKED_COLUMNS:
+        value = getattr(position, column)
+        if previous:
+            history = state.attrs[column].history
+            if history.deleted:
+                value = history.deleted[0]
+            elif history.added:
+                value = history.unchanged[0] if history.unchanged else None
+        values[column] = None if value is NO_VALUE else value
+    return values
+
+
+def position_deltas(session) -> Dict[tuple, Dict]:
+    """Change of each (day, coin) row caused by the positions of the current flush"""
+    deltas = defaultdict(lambda: defaultdict(float))
+    
+    def apply(contribution, sign):
+        if contribution is not None:
+            key, totals = contribution
+            for column, value in totals.items():
+                deltas[key][column] += sign * value
+    
+    for position in session.new:
+        if isinstance(position, Position):
+            apply(_contribution(_values(position, previous=False)), 1)
+    for position in session.dirty:
+        if isinstance(position, Position) and any(
+                db.inspect(position).attrs[column].history.has_changes() for column in TRACKED_COLUMNS):
+            apply(_contribution(_values(position, previous=True)), -1)
+            apply(_contribution(_values(position, previous=False)), 1)
+    for position in session.deleted:
+        if isinstance(position, Position):
+            apply(_contribution(_values(position, previous=True)), -1)
+    
+    return {key: dict(totals) for key, totals in deltas.items() if any(totals.values())}
+
+
+class PnlRollup:
+    """Maintains the daily_pnl table as positions close
+    
+    A session hook turns every flushed change to a closed position (closing,
+    a corrected realized P&L, reopening, deleting) into deltas on its
+    (day, coin) row, written in the same transaction as one upsert per row.
+    Only per-day totals are stored; `daily()` derives the equity curve as a
+    running sum, so a change never rewrites later days. Bulk updates that
+    bypass the ORM are not seen; `rebuild()` recomputes the table from the
+    positions.
+    """
+    
+    def __init__(self, starting_capital: float = 1000.0):
+        self.starting_capital = starting_capital
+        
+        # Counters
+        self.rows_written = 0
+        self.rows_removed = 0
+    
+    def init_app(self, app):
+        self.starting_capital = app.config.get('ANALYTICS_STARTING_CAPITAL', self.starting_capital)
+        install_session_hooks()
+    
+    def apply(self, connection, deltas: Dict[tuple, Dict]):
+        """Add (day, coin) deltas to the table, in key order"""
+        table = DailyPnl.__table__
+        now = datetime.utcnow()
+        upsert = UPSERT_DIALECTS.get(connection.dialect.name)
+        for (day, coin_id), totals in sorted(deltas.items(), key=lambda item: (item[0][0], item[0][1])):
+            values = {column: totals.get(column, 0) for column in TOTAL_COLUMNS}
+            
+            if upsert is not None:
+                # One atomic statement: concurrent flushes for the same row add up instead of racing
+                statement = upsert(table).values(day=day, coin_id=coin_id, updated_at=now, **values)
+                statement = statement.on_conflict_do_update(
+                    index_elements=[table.c.day, table.c.coin_id],
+                    set_={'updated_at': now, **{column: table.c[column] + statement.excluded[column]
+                                                for column in TOTAL_COLUMNS}}
+                )
+                connection.execute(statement)
+            else:
+                result = connection.execute(
+                    update(table).where(table.c.day == day, table.c.coin_id == coin_id)
+                    .values(updated_at=now, **{column: table.c[column] + values[column] for column in TOTAL_COLUMNS})
+                )
+                if not result.rowcount:
+                    connection.execute(insert(table).values(day=day, coin_id=coin_id, updated_at=now, **values))
+            self.rows_written += 1
+            
+            # A reopened, moved or deleted position can leave a row without trades
+            result = connection.execute(delete(table).where(table.c.day == day, table.c.coin_id == coin_id,
+                                                            table.c.trade_count <= 0))
+            self.rows_removed += result.rowcount or 0
+    
+    def rebuild(self) -> int:
+        """Recompute the whole table from the closed positions; returns rows written"""
+        pnl = func.coalesce(Position.realized_pnl, 0.0)
+        day = func.date(Position.exit_date)
+        rows = db.session.query(
+            day, Position.coin_id, func.sum(pnl), func.sum(func.coalesce(Position.fees_paid, 0.0)),
+            func.count(Position.id), func.count(case((pnl > 0, 1))), func.count(case((pnl < 0, 1)))
+        ).filter(Position.status == 'closed', Position.exit_date.isnot(None))\
+            .group_by(day, Position.coin_id).order_by(day, Position.coin_id).all()
+        
+        records = []
+        now = datetime.utcnow()
+        for day_value, coin_id, total_pnl, fees, trades, wins, losses in rows:
+            records.append({
+                'day': date.fromisoformat(str(day_value)),  # SQLite returns date() as a string
+                'coin_id': coin_id,
+                'realized_pnl': total_pnl or 0.0,
+                'fees': fees or 0.0,
+                'trade_count': trades,
+                'wins': wins,
+                'losses': losses,
+                'updated_at': now
+            })
+        
+        db.session.execute(delete(DailyPnl))
+        if records:
+            db.session.execute(insert(DailyPnl), records)
+        db.session.commit()
+        logger.info(f"Rebuilt daily P&L rollup: {len(records)} rows")
+        return len(records)
+    
+    def backfill(self) -> int:
+        """Build the table from history if it is empty; returns rows written"""
+        if db.session.query(DailyPnl.id).first() is not None:
+            return 0
+        if db.session.query(Position.id).filter(Position.status == 'closed').first() is None:
+            return 0
+        return self.rebuild()
+    
+    def daily(self, start: date, end: date = None) -> List[Dict]:
+        """Per-day totals over all coins between two dates (inclusive), oldest first
+        
+        `equity` is the starting capital plus all realized P&L up to the end of
+        the day: one sum over the days before `start`, then a running sum.
+        """
+        query = db.session.query(
+            DailyPnl.day, func.sum(DailyPnl.realized_pnl), func.sum(DailyPnl.fees),
+            func.sum(DailyPnl.trade_count), func.sum(DailyPnl.wins), func.sum(DailyPnl.losses)
+        ).filter(DailyPnl.day >= start)
+        if end is not None:
+            query = query.filter(DailyPnl.day <= end)
+        rows = query.group_by(DailyPnl.day).order_by(DailyPnl.day).all()
+        
+        equity = self.starting_capital + float(
+            db.session.query(func.coalesce(func.sum(DailyPnl.realized_pnl), 0.0))
+            .filter(DailyPnl.day < start).scalar() or 0
+        )
+        
+        days = []
+        for day, pnl, fees, trades, wins, losses in rows:
+            equity += float(pnl or 0)
+            days.append({
+                'date': day.isoformat(),
+                'pnl': float(pnl or 0),
+                'fees': float(fees or 0),
+                'trades': int(trades or 0),
+                'wins': int(wins or 0),
+                'losses': int(losses or 0),
+                'equity': equity
+            })
+        return days
+    
+    def stats(self) -> Dict:
+        return {
+            'starting_capital': self.starting_capital,
+            'rows_written': self.rows_written,
+            'rows_removed': self.rows_removed
+        }
+
+
+# Shared rollup, bound to the app in app.py
+pnl_rollup = PnlRollup()
+
+
+def _after_flush(session, flush_context):
+    deltas = position_deltas(session)
+    if deltas:
+        pnl_rollup.apply(session.connection(), deltas)
+
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+def install_session_hooks():
+    """Keep daily_pnl in step with flushed position changes; safe to call repeatedly"""
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+    
+    # Load the old value when a tracked column is set on an expired position, so its history has it
+    for column in TRACKED_COLUMNS:
+        attribute = getattr(Position, column)
+        if not event.contains(attribute, 'set', _load_previous_value):
+            event.listen(attribute, 'set', _load_previous_value, active_history=True, retval=True)
+
+
+def main():
+    from app import app
+    
+    with app.app_context():
+        db.create_all()
+        pnl_rollup.init_app(app)
+        rows = pnl_rollup.rebuild()
+    
+    print(f"daily_pnl rebuilt: {rows} rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""EXPLAIN-based audit of the hot queries
+
+Usage:
+    python -m services.query_audit [--verbose]
+
+Runs EXPLAIN (EXPLAIN QUERY PLAN on SQLite) for every registered hot query
+against the configured database and exits with status 1 if any of them
+falls back to a full table scan.
+"""
+import re
+import sys
+import argparse
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+from sqlalchemy import select, func, desc
+from models import db, Coin, TechnicalAnalysis, Order, Position, SystemLog, Trade
+
+logger = logging.getLogger(__name__)
+
+# name -> factory returning a Select; parameter values only need to be representative
+HOT_QUERIES: Dict[str, Callable] = {}
+
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')  # "SCAN t USING INDEX ..." is fine
+POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def hot_query(name: str):
+    """Register a query factory with the audit"""
+    def register(factory):
+        HOT_QUERIES[name] = factory
+        return factory
+    return register
+
+
+@hot_query('latest_analysis_for_coin')
+def _latest_analysis_for_coin():
+    return select(TechnicalAnalysis).where(TechnicalAnalysis.coin_id == 1)\
+        .order_by(TechnicalAnalysis.timestamp.desc()).limit(1)
+
+
+@hot_query('latest_analysis_per_coin')
+def _latest_analysis_per_coin():
+    return select(TechnicalAnalysis.coin_id, func.max(TechnicalAnalysis.timestamp))\
+        .group_by(TechnicalAnalysis.coin_id)
+
+
+@hot_query('recent_buy_signals')
+def _recent_buy_signals():
+    return select(TechnicalAnalysis).where(TechnicalAnalysis.action == 'BUY')\
+        .order_by(TechnicalAnalysis.timestamp.desc()).limit(10)
+
+
+@hot_query('open_positions')
+def _open_positions():
+    return select(Position).where(Position.status == 'open')
+
+
+@hot_query('open_positions_for_coin')
+def _open_positions_for_coin():
+    return select(Position).where(Position.coin_id == 1, Position.status == 'open')
+
+
+@hot_query('closed_positions_in_window')
+def _closed_positions_in_window():
+    return select(Position).where(Position.status == 'closed',
+                                  Position.exit_date >= datetime.utcnow() - timedelta(days=30))
+
+
+@hot_query('pending_orders')
+def _pending_orders():
+    return select(Order).where(Order.status.in_(['PENDING', 'PARTIALLY_FILLED']))
+
+
+@hot_query('pending_buy_orders_for_coin')
+def _pending_buy_orders_for_coin():
+    return select(Order).where(Order.coin_id == 1, Order.side == 'BUY', Order.status == 'PENDING')
+
+
+@hot_query('recent_trades')
+def _recent_trades():
+    return select(Trade).where(Trade.executed_at >= datetime.utcnow() - timedelta(days=7))
+
+
+@hot_query('recent_system_logs')
+def _recent_system_logs():
+    return select(SystemLog).order_by(desc(SystemLog.timestamp)).limit(20)
+
+
+@hot_query('system_logs_by_level_category')
+def _system_logs_by_level_category():
+    return select(SystemLog).where(SystemLog.level == 'ERROR', SystemLog.category == 'API')\
+        .order_by(desc(SystemLog.timestamp)).limit(20)
+
+
+@hot_query('system_logs_by_category')
+def _system_logs_by_category():
+    return select(SystemLog).where(SystemLog.category == 'USER')\
+        .order_by(desc(SystemLog.timestamp)).limit(50)
+
+
+@hot_query('coin_by_symbol')
+def _coin_by_symbol():
+    return select(Coin).where(Coin.symbol == 'BTC_USDT')
+
+
+def explain(query, connection=None) -> List[str]:
+    """Plan lines for a query on the current database"""
+    connection = connection or db.session.connection()
+    dialect = connection.dialect
+    compiled = query.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(compiled.params[key] for key in compiled.positiontup)
+    
+    if dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+        return [row[-1] for row in rows]
+    
+    if dialect.name == 'postgresql':
+        # Small tables make the planner prefer sequential scans; ask whether an index could be used
+        connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    rows = connection.exec_driver_sql(f"EXPLAIN {compiled}", params).fetchall()
+    return [str(row[0]) for row in rows]
+
+
+def full_scans(plan: List[str]) -> List[str]:
+    """Tables a plan reads with a full table scan"""
+    tables = []
+    for line in plan:
+        line = line.strip()
+        match = SQLITE_FULL_SCAN.match(line) or POSTGRES_FULL_SCAN.search(line)
+        if match:
+            tables.append(match.group(1))
+    return tables
+
+
+def audit(names: List[str] = None) -> Dict[str, Dict]:
+    """Explain the registered hot queries; returns plan and full-scanned tables per query"""
+    results = {}
+    for name in names or sorted(HOT_QUERIES):
+        try:
+            plan = explain(HOT_QUERIES[name]())
+            results[name] = {'plan': plan, 'full_scans': full_scans(plan)}
+        except Exception as e:
+            logger.error(f"Error explaining hot query {name}: {str(e)}")
+            results[name] = {'plan': [], 'full_scans': [], 'error': str(e)}
+        finally:
+            db.session.rollback()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--verbose', action='store_true', help='print every query plan')
+    parser.add_argument('--no-migrate', action='store_true', help='do not create missing indexes first')
+    args = parser.parse_args()
+    
+    from app import app
+    from services.schema import ensure_indexes
+    
+    with app.app_context():
+        db.create_all()
+        if not args.no_migrate:
+            ensure_indexes()
+        results = audit()
+    
+    failed = 0
+    for name, result in results.items():
+        problem = result.get('error') or (f"full scan of {', '.join(result['full_scans'])}"
+                                           if result['full_scans'] else None)
+        print(f"{'FAIL' if problem else 'ok  '} {name}{': ' + problem if problem else ''}")
+        if args.verbose or problem:
+            for line in result['plan']:
+                print(f"       {line}")
+        failed += bool(problem)
+    
+    print(f"\n{len(results) - failed}/{len(results)} hot queries use an index")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, List
+from flask import g, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class QueryCount:
+    """SQL statements executed on this thread while the counter was active"""
+    
+    def __init__(self):
+        self.count = 0
+        self.statements: List[str] = []
+        self.keep_statements = False
+    
+    def __int__(self):
+        return self.count
+    
+    def __repr__(self):
+        return f'<QueryCount {self.count}>'
+
+
+def _active_counters() -> List[QueryCount]:
+    counters = getattr(_local, 'counters', None)
+    if counters is None:
+        counters = _local.counters = []
+    return counters
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    for counter in _active_counters():
+        counter.count += 1
+        if counter.keep_statements:
+            counter.statements.append(statement)
+
+
+def install(engine):
+    """Count the statements an engine executes for the active counters"""
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+
+
+@contextmanager
+def count_queries(keep_statements: bool = False):
+    """Count SQL statements run on this thread inside the block
+    
+        with count_queries() as queries:
+            client.get('/dashboard/api/positions')
+        assert queries.count == 1
+    """
+    counter = QueryCount()
+    counter.keep_statements = keep_statements
+    counters = _active_counters()
+    counters.append(counter)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+
+
+class RequestQueryCounter:
+    """Per-request SQL statement counter
+    
+    Every request gets a QueryCount on `g.query_count`; the total is sent in
+    the X-Query-Count response header and requests above `warn_threshold`
+    statements are logged.
+    """
+    
+    def __init__(self, app=None, db=None):
+        self.warn_threshold = 50
+        self.totals: Dict[str, int] = {}  # endpoint -> statements in its last request
+        if app is not None and db is not None:
+            self.init_app(app, db)
+    
+    def init_app(self, app, db):
+        self.warn_threshold = app.config.get('SQL_QUERY_WARN_THRESHOLD', self.warn_threshold)
+        with app.app_context():
+            install(db.engine)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+    
+    def _start(self):
+        counter = QueryCount()
+        _active_counters().append(counter)
+        g.query_count = counter
+    
+    def _finish(self, response):
+        counter = g.get('query_count')
+        if counter is not None:
+            response.headers['X-Query-Count'] = str(counter.count)
+            self.totals[request.endpoint or request.path] = counter.count
+            if counter.count > self.warn_threshold:
+                logger.warning(f"{request.method} {request.path} ran {counter.count} SQL statements")
+        return response
+    
+    def _teardown(self, exception=None):
+        counter = g.pop('query_count', None)
+        counters = _active_counters()
+        if counter in counters:
+            counters.remove(counter)
+    
+    def stats(self) -> Dict:
+        return {'warn_threshold': self.warn_threshold, 'last_request_counts': dict(self.totals)}
+
+
+# Shared counter, bound to the app in app.py
+request_query_counter = RequestQueryCounter()
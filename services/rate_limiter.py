@@ -0,0 +1,150 @@
+import os
+import time
+import threading
+import logging
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# Endpoints that count against the order-entry limit instead of the general private one
+ORDER_ENTRY_ENDPOINTS = (
+    '/private/create-order',
+    '/private/cancel-order',
+    '/private/cancel-all-orders',
+)
+
+# Default sizing per endpoint class: (requests per second, burst capacity)
+# Crypto.com allows 100 req/s for public market data, 15 req/100ms for order
+# entry and 3 req/100ms for the remaining private endpoints.
+DEFAULT_LIMITS = {
+    'public': (100.0, 100.0),
+    'private': (30.0, 3.0),
+    'order': (150.0, 15.0),
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket
+    
+    Callers reserve a token up front; when the bucket is empty the balance goes
+    negative and the caller is told how long to wait for its turn. Waiting
+    happens outside the lock, so concurrent callers are spaced out at the
+    configured rate without serialising on the sleep itself.
+    """
+    
+    def __init__(self, name: str, rate: float, capacity: float):
+        self.name = name
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+        
+        # Counters
+        self.requests = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.rejected = 0  # 429 responses reported by the caller
+    
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Take tokens and return how many seconds to wait before using them"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= tokens
+            
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            
+            self.requests += 1
+            if wait > 0:
+                self.throttled += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            
+            return wait
+    
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until tokens are available; returns the time waited"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+    
+    def record_rejection(self):
+        with self.lock:
+            self.rejected += 1
+    
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                'rate': self.rate,
+                'capacity': self.capacity,
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'total_wait': round(self.total_wait, 4),
+                'max_wait': round(self.max_wait, 4),
+                'rejected': self.rejected
+            }
+
+
+class RateLimiter:
+    """Per-endpoint-class token buckets for the exchange API"""
+    
+    def __init__(self, limits: Dict[str, tuple] = None):
+        limits = limits or DEFAULT_LIMITS
+        self.buckets = {
+            name: TokenBucket(name, rate, capacity)
+            for name, (rate, capacity) in limits.items()
+        }
+    
+    @staticmethod
+    def classify(endpoint: str) -> str:
+        """Endpoint class (public, private or order) for an API path"""
+        if endpoint.startswith('/public/'):
+            return 'public'
+        if endpoint in ORDER_ENTRY_ENDPOINTS:
+            return 'order'
+        return 'private'
+    
+    def bucket_for(self, endpoint: str) -> TokenBucket:
+        return self.buckets[self.classify(endpoint)]
+    
+    def reserve(self, endpoint: str) -> float:
+        return self.bucket_for(endpoint).reserve()
+    
+    def acquire(self, endpoint: str) -> float:
+        return self.bucket_for(endpoint).acquire()
+    
+    def record_rejection(self, endpoint: str):
+        self.bucket_for(endpoint).record_rejection()
+    
+    def stats(self) -> Dict[str, Dict]:
+        return {name: bucket.stats() for name, bucket in self.buckets.items()}
+
+
+def limits_from_env() -> Dict[str, tuple]:
+    """Bucket sizing from RATE_LIMIT_<CLASS>_PER_SECOND / RATE_LIMIT_<CLASS>_BURST"""
+    limits = {}
+    for name, (rate, capacity) in DEFAULT_LIMITS.items():
+        limits[name] = (
+            float(os.getenv(f'RATE_LIMIT_{name.upper()}_PER_SECOND', rate)),
+            float(os.getenv(f'RATE_LIMIT_{name.upper()}_BURST', capacity))
+        )
+    return limits
+
+
+_shared_limiter = None
+_shared_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Process-wide rate limiter shared by every CryptoExchangeAPI instance"""
+    global _shared_limiter
+    with _shared_limiter_lock:
+        if _shared_limiter is None:
+            limits = limits_from_env()
+            _shared_limiter = RateLimiter(limits)
+            logger.info(f"Exchange rate limiter initialized: {limits}")
+        return _shared_limiter
@@ -0,0 +1,198 @@
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from functools import wraps
+from typing import Dict, Optional, Tuple
+from flask import request, make_response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Writes to these tables do not change any cached response
+IGNORED_TABLES = {'system_logs', 'sync_cursors'}
+
+
+class DataVersion:
+    """Process-wide counter bumped whenever a transaction that changed data commits
+    
+    Cached responses are tagged with the version they were built at and are
+    stale as soon as it moves. Monitors and routes share the process (and
+    this counter); the session hooks below bump it on every commit that
+    flushed ORM changes or ran ORM bulk writes, so callers do not have to.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+    
+    @property
+    def value(self) -> int:
+        return self._version
+    
+    def bump(self) -> int:
+        with self._lock:
+            self._version += 1
+            return self._version
+
+
+_data_version = DataVersion()
+
+
+def get_data_version() -> int:
+    return _data_version.value
+
+
+def bump_data_version() -> int:
+    """Mark cached responses stale, e.g. after writes made outside the ORM session"""
+    return _data_version.bump()
+
+
+def _touches_cached_tables(mappers) -> bool:
+    return any(mapper.local_table.name not in IGNORED_TABLES for mapper in mappers)
+
+
+def _after_flush(session, flush_context):
+    objects = list(session.new) + list(session.dirty) + list(session.deleted)
+    if _touches_cached_tables(type(obj).__mapper__ for obj in objects):
+        session.info['data_changed'] = True
+
+
+def _do_orm_execute(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        if _touches_cached_tables(orm_execute_state.all_mappers):
+            orm_execute_state.session.info['data_changed'] = True
+
+
+def _after_commit(session):
+    if session.info.pop('data_changed', False):
+        _data_version.bump()
+
+
+def _after_rollback(session, previous_transaction):
+    session.info.pop('data_changed', None)
+
+
+def install_session_hooks():
+    """Bump the data version on every commit that changed data; safe to call repeatedly"""
+    for name, listener in (('after_flush', _after_flush), ('do_orm_execute', _do_orm_execute),
+                           ('after_commit', _after_commit), ('after_soft_rollback', _after_rollback)):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
+
+
+class CacheEntry:
+    __slots__ = ('version', 'created', 'body', 'etag', 'mimetype')
+    
+    def __init__(self, version: int, body: bytes, mimetype: str):
+        self.version = version
+        self.created = time.monotonic()
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.mimetype = mimetype
+
+
+class ResponseCache:
+    """LRU cache of successful GET responses keyed by endpoint and query string
+    
+    An entry is served while the data version it was built at is current and
+    it is younger than its max age (for payloads that also depend on the
+    clock). Responses carry an ETag; a matching If-None-Match gets 304.
+    """
+    
+    def __init__(self, max_entries: int = 256, default_max_age: float = 300):
+        self.max_entries = max_entries
+        self.default_max_age = default_max_age
+        self._entries: 'OrderedDict[Tuple, CacheEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+        
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+    
+    def init_app(self, app):
+        self.max_entries = app.config.get('RESPONSE_CACHE_MAX_ENTRIES', self.max_entries)
+        self.default_max_age = app.config.get('RESPONSE_CACHE_MAX_AGE', self.default_max_age)
+        install_session_hooks()
+    
+    def _get(self, key, version: int, max_age: float) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.version != version or time.monotonic() - entry.created > max_age:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+    
+    def _put(self, key, entry: CacheEntry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    @staticmethod
+    def _respond(entry: CacheEntry):
+        if request.if_none_match.contains(entry.etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(entry.body)
+            response.mimetype = entry.mimetype
+        response.set_etag(entry.etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    def cached(self, max_age: float = None):
+        """Decorator for GET views whose output only changes with the data version"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET':
+                    return view(*args, **kwargs)
+                
+                key = (request.endpoint, tuple(sorted(request.args.items(multi=True))))
+                version = get_data_version()  # Read before building so a concurrent write makes the entry stale
+                entry = self._get(key, version, max_age if max_age is not None else self.default_max_age)
+                
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.direct_passthrough:
+                        return response
+                    entry = CacheEntry(version, response.get_data(), response.mimetype)
+                    self._put(key, entry)
+                    with self._lock:
+                        self.misses += 1
+                else:
+                    with self._lock:
+                        self.hits += 1
+                
+                response = self._respond(entry)
+                if response.status_code == 304:
+                    with self._lock:
+                        self.not_modified += 1
+                return response
+            return wrapper
+        return decorator
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'data_version': get_data_version()
+            }
+
+
+# Shared cache, bound to the app in app.py
+response_cache = ResponseCache()
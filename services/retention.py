@@ -0,0 +1,324 @@
+"""Retention and downsampling of the growing history tables
+
+Usage:
+    python -m services.retention
+
+Runs one retention pass (until nothing is left to do) against the
+configured database and prints what was rolled up and deleted.
+"""
+import time
+import atexit
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+from sqlalchemy import select
+from models import db, TechnicalAnalysis, LatestAnalysis, AnalysisRollup, SystemLog
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = ('hour', 'day')
+
+
+def bucket_start(timestamp: datetime, resolution: str) -> datetime:
+    """Start of the hourly or daily bucket a timestamp falls into"""
+    if resolution == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def analysis_values(timestamp: datetime, last_price: float, rsi: float, action: str) -> Dict:
+    """Rollup columns for a single technical analysis row"""
+    return {
+        'first_timestamp': timestamp,
+        'last_timestamp': timestamp,
+        'open_price': last_price,
+        'high_price': last_price,
+        'low_price': last_price,
+        'close_price': last_price,
+        'rsi_sum': rsi if rsi is not None else 0.0,
+        'rsi_count': 1 if rsi is not None else 0,
+        'rsi_min': rsi,
+        'rsi_max': rsi,
+        'samples': 1,
+        'buy_signals': 1 if action == 'BUY' else 0,
+        'sell_signals': 1 if action == 'SELL' else 0
+    }
+
+
+class RetentionEngine:
+    """Background retention for technical_analyses and system_logs
+    
+    technical_analyses keeps full resolution for `analysis_raw_days`. Older
+    rows are folded into hourly AnalysisRollup buckets, and hourly buckets
+    older than `analysis_hourly_days` into daily buckets, which are kept.
+    system_logs rows older than `system_log_days` are deleted. A window of 0
+    disables that step.
+    
+    Every step works oldest-first in batches of `batch_size` rows, one short
+    transaction per batch with `batch_pause` seconds between batches, so
+    other writers are never locked out for long. A pass stops after
+    `max_batches` batches per step and continues on the next run.
+    """
+    
+    def __init__(self, app=None, analysis_raw_days: int = 7, analysis_hourly_days: int = 90,
+                 system_log_days: int = 30, batch_size: int = 1000, batch_pause: float = 0.2,
+                 max_batches: int = 100, interval: float = 3600):
+        self.app = None
+        self.windows = {
+            'technical_analyses': analysis_raw_days,
+            'analysis_rollups': analysis_hourly_days,  # Hourly buckets; daily buckets are kept
+            'system_logs': system_log_days
+        }
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause  # seconds
+        self.max_batches = max_batches
+        self.interval = interval  # seconds between passes
+        
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        
+        # Counters
+        self.runs = 0
+        self.rolled_up = {table: 0 for table in self.windows}
+        self.deleted = {table: 0 for table in self.windows}
+        self.last_run = None
+        self.last_error = None
+        
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """Read retention settings from the app config"""
+        self.app = app
+        self.windows['technical_analyses'] = app.config.get('ANALYSIS_RAW_RETENTION_DAYS',
+                                                            self.windows['technical_analyses'])
+        self.windows['analysis_rollups'] = app.config.get('ANALYSIS_HOURLY_RETENTION_DAYS',
+                                                          self.windows['analysis_rollups'])
+        self.windows['system_logs'] = app.config.get('SYSTEM_LOG_RETENTION_DAYS', self.windows['system_logs'])
+        self.batch_size = app.config.get('RETENTION_BATCH_SIZE', self.batch_size)
+        self.batch_pause = app.config.get('RETENTION_BATCH_PAUSE_MS', self.batch_pause * 1000) / 1000
+        self.max_batches = app.config.get('RETENTION_MAX_BATCHES', self.max_batches)
+        self.interval = app.config.get('RETENTION_INTERVAL_MINUTES', self.interval / 60) * 60
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        """Start the background retention thread"""
+        if self.app is None:
+            raise RuntimeError("RetentionEngine.init_app() must be called before start()")
+        if self.running:
+            return
+        
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        logger.info(f"Retention engine started (windows {self.windows}, batch {self.batch_size}, "
+                    f"every {self.interval / 60:.0f}min)")
+    
+    def stop(self, timeout: float = 5.0):
+        """Stop after the current batch"""
+        self._stop_event.set()
+        if self.running:
+            self._thread.join(timeout)
+            logger.info("Retention engine stopped")
+    
+    def _run(self):
+        with self.app.app_context():
+            while not self._stop_event.is_set():
+                self.run_once()
+                db.session.remove()
+                self._stop_event.wait(self.interval)
+    
+    def _cutoff(self, table: str) -> datetime:
+        days = self.windows.get(table) or 0
+        return datetime.utcnow() - timedelta(days=days) if days > 0 else None
+    
+    def run_once(self) -> Dict[str, Dict[str, int]]:
+        """One retention pass over all tables; returns rows rolled up/deleted per table"""
+        result = {}
+        steps = (
+            ('technical_analyses', self.rollup_analyses_batch),
+            ('analysis_rollups', self.rollup_hours_batch),
+            ('system_logs', self.prune_system_logs_batch),
+        )
+        
+        for table, step in steps:
+            cutoff = self._cutoff(table)
+            if cutoff is None:
+                continue
+            
+            totals = {'rolled_up': 0, 'deleted': 0}
+            try:
+                for _ in range(self.max_batches):
+                    if self._stop_event.is_set():
+                        break
+                    rolled_up, deleted = step(cutoff)
+                    totals['rolled_up'] += rolled_up
+                    totals['deleted'] += deleted
+                    if deleted < self.batch_size:
+                        break
+                    time.sleep(self.batch_pause)
+            except Exception as e:
+                db.session.rollback()
+                self.last_error = f"{table}: {str(e)}"
+                logger.error(f"Error applying retention to {table}: {str(e)}")
+            
+            with self._lock:
+                self.rolled_up[table] += totals['rolled_up']
+                self.deleted[table] += totals['deleted']
+            result[table] = totals
+        
+        with self._lock:
+            self.runs += 1
+            self.last_run = datetime.utcnow()
+        
+        if any(totals['deleted'] for totals in result.values()):
+            logger.info(f"Retention pass: {result}")
+        return result
+    
+    def _merge_buckets(self, resolution: str, buckets: Dict[Tuple[int, datetime], Dict]):
+        """Absorb bucket values into the stored rollups (not committed)"""
+        coin_ids = {coin_id for coin_id, _ in buckets}
+        starts = {start for _, start in buckets}
+        existing = {
+            (rollup.coin_id, rollup.bucket_start): rollup
+            for rollup in AnalysisRollup.query.filter(
+                AnalysisRollup.resolution == resolution,
+                AnalysisRollup.coin_id.in_(coin_ids),
+                AnalysisRollup.bucket_start.in_(starts)
+            ).all()
+        }
+        
+        for (coin_id, start), values in buckets.items():
+            rollup = existing.get((coin_id, start))
+            if rollup is None:
+                rollup = AnalysisRollup(coin_id=coin_id, resolution=resolution, bucket_start=start)
+                db.session.add(rollup)
+            rollup.absorb(values)
+    
+    @staticmethod
+    def _fold(buckets: Dict, key: Tuple[int, datetime], values: Dict):
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = AnalysisRollup(**values)
+        else:
+            bucket.absorb(values)
+    
+    def rollup_analyses_batch(self, cutoff: datetime) -> Tuple[int, int]:
+        """Fold the oldest raw analyses before `cutoff` into hourly buckets and delete them"""
+        rows = db.session.query(
+            TechnicalAnalysis.id, TechnicalAnalysis.coin_id, TechnicalAnalysis.timestamp,
+            TechnicalAnalysis.last_price, TechnicalAnalysis.rsi, TechnicalAnalysis.action
+        ).filter(
+            TechnicalAnalysis.timestamp < cutoff,
+            TechnicalAnalysis.id.notin_(select(LatestAnalysis.analysis_id))  # Still current for its coin
+        ).order_by(TechnicalAnalysis.timestamp, TechnicalAnalysis.id).limit(self.batch_size).all()
+        if not rows:
+            return 0, 0
+        
+        buckets = {}
+        for analysis_id, coin_id, timestamp, last_price, rsi, action in rows:
+            self._fold(buckets, (coin_id, bucket_start(timestamp, 'hour')),
+                       analysis_values(timestamp, last_price, rsi, action))
+        
+        try:
+            self._merge_buckets('hour', {key: bucket.to_values() for key, bucket in buckets.items()})
+            TechnicalAnalysis.query.filter(TechnicalAnalysis.id.in_([row[0] for row in rows]))\
+                .delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return len(buckets), len(rows)
+    
+    def rollup_hours_batch(self, cutoff: datetime) -> Tuple[int, int]:
+        """Fold the oldest hourly buckets before `cutoff` into daily buckets and delete them"""
+        hours = AnalysisRollup.query.filter(
+            AnalysisRollup.resolution == 'hour',
+            AnalysisRollup.bucket_start < bucket_start(cutoff, 'day')  # Whole days only
+        ).order_by(AnalysisRollup.bucket_start, AnalysisRollup.id).limit(self.batch_size).all()
+        if not hours:
+            return 0, 0
+        
+        buckets = {}
+        for hour in hours:
+            self._fold(buckets, (hour.coin_id, bucket_start(hour.bucket_start, 'day')), hour.to_values())
+        
+        try:
+            self._merge_buckets('day', {key: bucket.to_values() for key, bucket in buckets.items()})
+            AnalysisRollup.query.filter(AnalysisRollup.id.in_([hour.id for hour in hours]))\
+                .delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return len(buckets), len(hours)
+    
+    def prune_system_logs_batch(self, cutoff: datetime) -> Tuple[int, int]:
+        """Delete the oldest system logs before `cutoff`"""
+        ids = [row[0] for row in db.session.query(SystemLog.id)
+               .filter(SystemLog.timestamp < cutoff)
+               .order_by(SystemLog.timestamp).limit(self.batch_size).all()]
+        if not ids:
+            return 0, 0
+        
+        try:
+            SystemLog.query.filter(SystemLog.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return 0, len(ids)
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'running': self.running,
+                'windows_days': dict(self.windows),
+                'batch_size': self.batch_size,
+                'runs': self.runs,
+                'rolled_up': dict(self.rolled_up),
+                'deleted': dict(self.deleted),
+                'last_run': self.last_run.isoformat() if self.last_run else None,
+                'last_error': self.last_error
+            }
+
+
+def get_rollups(coin_id: int, resolution: str, start: datetime = None, end: datetime = None) -> List[AnalysisRollup]:
+    """Downsampled analysis history for a coin, oldest first"""
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown rollup resolution: {resolution}")
+    
+    query = AnalysisRollup.query.filter_by(coin_id=coin_id, resolution=resolution)
+    if start is not None:
+        query = query.filter(AnalysisRollup.bucket_start >= start)
+    if end is not None:
+        query = query.filter(AnalysisRollup.bucket_start < end)
+    return query.order_by(AnalysisRollup.bucket_start).all()
+
+
+# Shared engine, bound to the app in app.py
+retention_engine = RetentionEngine()
+
+
+def main():
+    from app import app
+    
+    with app.app_context():
+        db.create_all()
+        retention_engine.init_app(app)
+        retention_engine.max_batches = 1000000  # Until done
+        retention_engine.batch_pause = 0
+        result = retention_engine.run_once()
+    
+    for table, totals in result.items():
+        print(f"{table}: {totals['deleted']} rows removed, {totals['rolled_up']} buckets updated")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import logging
+from datetime import datetime
+from typing import Dict, List
+from sqlalchemy import inspect, update, func, text
+from models import db
+
+logger = logging.getLogger(__name__)
+
+# Keyset-paginated sort columns declared NOT NULL after tables were created with them nullable:
+# (table, column) -> columns a missing value is copied from, in order; the epoch if they are NULL too
+NOT_NULL_BACKFILLS = {
+    ('orders', 'created_at'): ('updated_at', 'filled_at'),
+    ('positions', 'created_at'): ('entry_date', 'updated_at'),
+    ('system_logs', 'timestamp'): (),
+}
+EPOCH = datetime(1970, 1, 1)
+
+
+def missing_indexes(engine=None) -> List:
+    """Indexes declared on the models that do not exist in the database yet"""
+    engine = engine or db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    
+    missing = []
+    for table in db.metadata.tables.values():
+        if table.name not in existing_tables:
+            continue  # create_all() builds new tables with their indexes
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing.extend(index for index in table.indexes if index.name not in existing)
+    return missing
+
+
+def ensure_indexes(engine=None) -> List[str]:
+    """Create declared indexes missing from existing tables
+    
+    db.create_all() only creates indexes together with their table, so
+    databases created before an index was added to models.py are migrated
+    here. Safe to run on every start-up.
+    """
+    engine = engine or db.engine
+    created = []
+    for index in missing_indexes(engine):
+        try:
+            index.create(bind=engine, checkfirst=True)
+            created.append(index.name)
+            logger.info(f"Created index {index.name} on {index.table.name}")
+        except Exception as e:
+            logger.error(f"Error creating index {index.name}: {str(e)}")
+    return created
+
+
+def ensure_not_null(engine=None) -> Dict[str, int]:
+    """Backfill NULLs in the NOT_NULL_BACKFILLS columns; returns rows filled per column
+    
+    Keyset pages sort and seek on (timestamp, id), so a NULL timestamp would
+    break both the ordering and the cursor. PostgreSQL also gets the NOT NULL
+    constraint; SQLite cannot change an existing column, and the model
+    defaults keep new rows filled. Safe to run on every start-up.
+    """
+    engine = engine or db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    
+    filled = {}
+    for (table_name, column_name), sources in NOT_NULL_BACKFILLS.items():
+        if table_name not in existing_tables:
+            continue
+        table = db.metadata.tables[table_name]
+        column = table.c[column_name]
+        value = func.coalesce(*(table.c[name] for name in sources), EPOCH) if sources else EPOCH
+        nullable = next((info['nullable'] for info in inspector.get_columns(table_name)
+                         if info['name'] == column_name), False)
+        
+        try:
+            with engine.begin() as connection:
+                result = connection.execute(update(table).where(column.is_(None)).values({column_name: value}))
+                if nullable and engine.dialect.name == 'postgresql':
+                    connection.execute(text(f"ALTER TABLE {table_name} ALTER COLUMN {column_name} SET NOT NULL"))
+            if result.rowcount:
+                filled[f"{table_name}.{column_name}"] = result.rowcount
+                logger.info(f"Backfilled {result.rowcount} NULL {table_name}.{column_name} values")
+        except Exception as e:
+            logger.error(f"Error backfilling {table_name}.{column_name}: {str(e)}")
+    return filled
@@ -4,15 +4,19 @@ import logging
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from services.crypto_exchange import CryptoExchangeAPI
-from models import db, Coin, TechnicalAnalysis, SystemLog
+from services.candle_store import CandleStore
+from services import indicators
+from models import db, Coin, TechnicalAnalysis, LatestAnalysis, SystemLog
 
 logger = logging.getLogger(__name__)
 
 class TechnicalAnalysisService:
     """Technical Analysis Service for generating trading signals"""
     
-    def __init__(self, exchange_api: CryptoExchangeAPI = None):
+    def __init__(self, exchange_api: CryptoExchangeAPI = None, incremental: bool = False,
+                 candle_store: CandleStore = None):
         self.exchange_api = exchange_api or CryptoExchangeAPI()
+        self.candle_store = candle_store  # Optional local store with delta fetching
         self.timeframe = '15m'  # Default timeframe
         self.data_points = 200  # Number of candles to fetch for analysis
         
@@ -29,101 +33,30 @@ class TechnicalAnalysisService:
         self.rsi_overbought = 70
         self.volume_threshold = 1.5
         
+        # Incremental analysis: per-instrument indicator state seeded once from
+        # history, then updated from the last few candles on every call
+        self.incremental = incremental
+        self.update_points = 5  # Number of candles to fetch once state exists
+        self.indicator_states: Dict[str, indicators.IndicatorState] = {}
+        
         logger.info("Technical Analysis Service initialized")
     
     def _calculate_rsi(self, prices: np.ndarray, period: int = 14) -> np.ndarray:
         """Calculate RSI (Relative Strength Index)"""
-        if len(prices) < period + 1:
-            return np.full(len(prices), 50.0)
-        
-        deltas = np.diff(prices)
-        gains = np.where(deltas > 0, deltas, 0)
-        losses = np.where(deltas < 0, -deltas, 0)
-        
-        # Calculate initial averages
-        avg_gain = np.mean(gains[:period])
-        avg_loss = np.mean(losses[:period])
-        
-        rs_values = []
-        
-        # First RSI calculation
-        if avg_loss != 0:
-            rs = avg_gain / avg_loss
-            rsi = 100 - (100 / (1 + rs))
-        else:
-            rsi = 100
-        rs_values.append(rsi)
-        
-        # Calculate remaining RSI values using smoothed averages
-        for i in range(period, len(gains)):
-            avg_gain = (avg_gain * (period - 1) + gains[i]) / period
-            avg_loss = (avg_loss * (period - 1) + losses[i]) / period
-            
-            if avg_loss != 0:
-                rs = avg_gain / avg_loss
-                rsi = 100 - (100 / (1 + rs))
-            else:
-                rsi = 100
-            rs_values.append(rsi)
-        
-        # Pad the beginning with neutral values
-        result = np.full(len(prices), 50.0)
-        result[period:] = rs_values
-        
-        return result
+        return indicators.rsi(prices, period)
     
     def _calculate_sma(self, prices: np.ndarray, period: int) -> np.ndarray:
         """Calculate Simple Moving Average"""
-        if len(prices) < period:
-            return np.full(len(prices), np.mean(prices))
-        
-        sma = np.full(len(prices), np.nan)
-        for i in range(period - 1, len(prices)):
-            sma[i] = np.mean(prices[i - period + 1:i + 1])
-        
-        # Fill initial values with expanding mean
-        for i in range(period - 1):
-            sma[i] = np.mean(prices[:i + 1])
-        
-        return sma
+        return indicators.sma(prices, period)
     
     def _calculate_ema(self, prices: np.ndarray, period: int) -> np.ndarray:
         """Calculate Exponential Moving Average"""
-        if len(prices) == 0:
-            return np.array([])
-        
-        ema = np.zeros(len(prices))
-        multiplier = 2 / (period + 1)
-        
-        # First EMA value is just the first price
-        ema[0] = prices[0]
-        
-        # Calculate EMA for remaining values
-        for i in range(1, len(prices)):
-            ema[i] = (prices[i] - ema[i-1]) * multiplier + ema[i-1]
-        
-        return ema
+        return indicators.ema(prices, period)
     
     def _calculate_atr(self, highs: np.ndarray, lows: np.ndarray, 
                       closes: np.ndarray, period: int = 14) -> np.ndarray:
         """Calculate Average True Range"""
-        if len(highs) < period or len(lows) < period or len(closes) < period:
-            return np.full(len(highs), 0.0)
-        
-        # Calculate True Range
-        tr = np.zeros(len(highs))
-        tr[0] = highs[0] - lows[0]  # First TR is just high - low
-        
-        for i in range(1, len(highs)):
-            tr1 = highs[i] - lows[i]
-            tr2 = abs(highs[i] - closes[i-1])
-            tr3 = abs(lows[i] - closes[i-1])
-            tr[i] = max(tr1, tr2, tr3)
-        
-        # Calculate ATR using simple moving average of TR
-        atr = self._calculate_sma(tr, period)
-        
-        return atr
+        return indicators.atr(highs, lows, closes, period)
     
     def _calculate_volume_ratio(self, volumes: np.ndarray, period: int = 14) -> float:
         """Calculate current volume ratio to average volume"""
@@ -137,92 +70,186 @@ class TechnicalAnalysisService:
             return current_volume / avg_volume
         return 1.0
     
-    def get_candlestick_data(self, instrument_name: str) -> Optional[pd.DataFrame]:
+    def get_candlestick_data(self, instrument_name: str, count: int = None) -> Optional[pd.DataFrame]:
         """Get candlestick data for analysis"""
+        if self.candle_store is not None:
+            df = self.candle_store.get_frame(instrument_name, self.timeframe, count or self.data_points)
+            if df is None:
+                logger.warning(f"No candlestick data received for {instrument_name}")
+            return df
+        
         try:
             candles = self.exchange_api.get_candlestick_data(
                 instrument_name=instrument_name,
                 timeframe=self.timeframe,
-                count=self.data_points
+                count=count or self.data_points
             )
             
-            if not candles:
-                logger.warning(f"No candlestick data received for {instrument_name}")
-                return None
+            return self._candles_to_frame(instrument_name, candles)
+        
+        except Exception as e:
+            logger.error(f"Error getting candlestick data for {instrument_name}: {str(e)}")
+            return None
+    
+    def _candles_to_frame(self, instrument_name: str, candles: List[dict]) -> Optional[pd.DataFrame]:
+        """Convert exchange candles to an analysis DataFrame sorted by time"""
+        if not candles:
+            logger.warning(f"No candlestick data received for {instrument_name}")
+            return None
             
-            # Convert to DataFrame
-            df = pd.DataFrame(candles)
+        # Convert to DataFrame
+        df = pd.DataFrame(candles)
             
-            # Convert timestamp to datetime
-            df['timestamp'] = pd.to_datetime(df['t'], unit='ms')
+        # Convert timestamp to datetime
+        df['timestamp'] = pd.to_datetime(df['t'], unit='ms')
             
-            # Rename columns to standard format
-            df = df.rename(columns={
-                'o': 'open',
-                'h': 'high', 
-                'l': 'low',
-                'c': 'close',
-                'v': 'volume'
-            })
+        # Rename columns to standard format
+        df = df.rename(columns={
+            'o': 'open',
+            'h': 'high', 
+            'l': 'low',
+            'c': 'close',
+            'v': 'volume'
+        })
             
-            # Convert price columns to float
-            for col in ['open', 'high', 'low', 'close', 'volume']:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+        # Convert price columns to float
+        for col in ['open', 'high', 'low', 'close', 'volume']:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
             
-            # Sort by timestamp
-            df = df.sort_values('timestamp').reset_index(drop=True)
+        # Sort by timestamp
+        df = df.sort_values('timestamp').reset_index(drop=True)
             
-            logger.info(f"Retrieved {len(df)} candles for {instrument_name}")
+        logger.info(f"Retrieved {len(df)} candles for {instrument_name}")
+        return df
+    
+    def _create_indicator_state(self) -> indicators.IndicatorState:
+        """Create an empty indicator state with this service's periods"""
+        return indicators.IndicatorState(
+            rsi_period=self.rsi_period,
+            ma50_period=self.ma50_period,
+            ma200_period=self.ma200_period,
+            ema10_period=self.ema10_period,
+            atr_period=self.atr_period
+        )
+    
+    def _calculate_snapshot(self, df: pd.DataFrame) -> Dict:
+        """Calculate latest indicator values from a full candle history"""
+        closes = df['close'].values
+        highs = df['high'].values
+        lows = df['low'].values
+        volumes = df['volume'].values
+        
+        return {
+            'timestamp': int(df['t'].iloc[-1]),
+            'candle_count': len(df),
+            'close': closes[-1],
+            'high': highs[-1],
+            'low': lows[-1],
+            'volume': volumes[-1],
+            'rsi': self._calculate_rsi(closes, self.rsi_period)[-1],
+            'ma50': self._calculate_sma(closes, self.ma50_period)[-1],
+            'ma200': self._calculate_sma(closes, self.ma200_period)[-1],
+            'ema10': self._calculate_ema(closes, self.ema10_period)[-1],
+            'atr': self._calculate_atr(highs, lows, closes, self.atr_period)[-1],
+            'volume_ratio': self._calculate_volume_ratio(volumes),
+            'recent_high': np.max(highs[-20:]),
+            'recent_low': np.min(lows[-20:])
+        }
+    
+    def get_instrument_name(self, coin: Coin) -> str:
+        """Format a coin's symbol for the exchange API"""
+        return f"{coin.original_symbol}_{coin.base_currency}"
+    
+    def fetch_candles(self, instrument_name: str) -> Optional[pd.DataFrame]:
+        """Fetch the candles needed to analyze an instrument (I/O only, no DB access)"""
+        if instrument_name in self.indicator_states and self.candle_store is None:
+            # Incremental state only needs the latest candles
+            return self.get_candlestick_data(instrument_name, count=self.update_points)
+        return self.get_candlestick_data(instrument_name)
+    
+    async def fetch_candles_async(self, instrument_name: str, async_api) -> Optional[pd.DataFrame]:
+        """fetch_candles() for an event loop, using an AsyncCryptoExchangeAPI"""
+        if self.candle_store is not None:
+            df = await self.candle_store.get_frame_async(instrument_name, self.timeframe, self.data_points,
+                                                         async_api)
+            if df is None:
+                logger.warning(f"No candlestick data received for {instrument_name}")
             return df
-            
+        
+        count = self.update_points if instrument_name in self.indicator_states else self.data_points
+        try:
+            candles = await async_api.get_candlestick_data(
+                instrument_name=instrument_name,
+                timeframe=self.timeframe,
+                count=count
+            )
+            return self._candles_to_frame(instrument_name, candles)
         except Exception as e:
             logger.error(f"Error getting candlestick data for {instrument_name}: {str(e)}")
             return None
     
+    def prune_indicator_states(self, active_instruments) -> int:
+        """Drop the indicator state of instruments no longer analyzed; returns states dropped"""
+        active = set(active_instruments)
+        stale = [name for name in self.indicator_states if name not in active]
+        for name in stale:
+            del self.indicator_states[name]
+        if stale:
+            logger.info(f"Dropped indicator state for {len(stale)} inactive instruments")
+        return len(stale)
+    
+    def calculate_indicators(self, instrument_name: str, df: Optional[pd.DataFrame]) -> Optional[Dict]:
+        """Get latest indicator values, updating the instrument's incremental state if it exists"""
+        state = self.indicator_states.get(instrument_name)
+        if state is not None:
+            if state.update_from_frame(df):
+                return state.snapshot()
+            
+            # No overlap with the last known candle, rebuild from a full history
+            logger.info(f"Re-seeding indicator state for {instrument_name}")
+            del self.indicator_states[instrument_name]
+        
+        if df is None or len(df) < 20:
+            return None
+        
+        if not self.incremental:
+            return self._calculate_snapshot(df)
+        
+        state = self._create_indicator_state()
+        state.seed(df)
+        self.indicator_states[instrument_name] = state
+        return state.snapshot()
+    
     def analyze_coin(self, coin: Coin) -> Optional[Dict]:
         """Perform complete technical analysis for a coin"""
+        instrument_name = self.get_instrument_name(coin)
+        return self.analyze_candles(coin, self.fetch_candles(instrument_name))
+    
+    def analyze_candles(self, coin: Coin, df: Optional[pd.DataFrame]) -> Optional[Dict]:
+        """Perform technical analysis for a coin from already fetched candles"""
         try:
-            # Format symbol for exchange API
-            instrument_name = f"{coin.original_symbol}_{coin.base_currency}"
+            instrument_name = self.get_instrument_name(coin)
             
-            # Get candlestick data
-            df = self.get_candlestick_data(instrument_name)
-            if df is None or len(df) < 20:
+            # Get latest indicator values
+            snapshot = self.calculate_indicators(instrument_name, df)
+            if snapshot is None:
                 logger.warning(f"Insufficient data for analysis: {instrument_name}")
                 return None
             
-            # Extract price data
-            closes = df['close'].values
-            highs = df['high'].values
-            lows = df['low'].values
-            volumes = df['volume'].values
-            
-            # Calculate technical indicators
-            rsi = self._calculate_rsi(closes, self.rsi_period)
-            ma50 = self._calculate_sma(closes, self.ma50_period)
-            ma200 = self._calculate_sma(closes, self.ma200_period)
-            ema10 = self._calculate_ema(closes, self.ema10_period)
-            atr = self._calculate_atr(highs, lows, closes, self.atr_period)
-            
-            # Get latest values
-            current_price = closes[-1]
-            current_high = highs[-1]
-            current_low = lows[-1]
-            current_volume = volumes[-1]
-            current_rsi = rsi[-1]
-            current_ma50 = ma50[-1]
-            current_ma200 = ma200[-1]
-            current_ema10 = ema10[-1]
-            current_atr = atr[-1]
-            
-            # Calculate volume ratio
-            volume_ratio = self._calculate_volume_ratio(volumes)
-            
-            # Calculate support and resistance levels
-            recent_highs = highs[-20:]  # Last 20 periods
-            recent_lows = lows[-20:]
-            resistance_level = np.max(recent_highs) * 1.02  # 2% above recent high
-            support_level = np.min(recent_lows) * 0.98     # 2% below recent low
+            current_price = snapshot['close']
+            current_high = snapshot['high']
+            current_low = snapshot['low']
+            current_volume = snapshot['volume']
+            current_rsi = snapshot['rsi']
+            current_ma50 = snapshot['ma50']
+            current_ma200 = snapshot['ma200']
+            current_ema10 = snapshot['ema10']
+            current_atr = snapshot['atr']
+            volume_ratio = snapshot['volume_ratio']
+            
+            # Calculate support and resistance levels from the last 20 periods
+            resistance_level = snapshot['recent_high'] * 1.02  # 2% above recent high
+            support_level = snapshot['recent_low'] * 0.98     # 2% below recent low
             
             # Validate moving averages
             ma50_valid = current_price > current_ma50
@@ -355,6 +382,8 @@ class TechnicalAnalysisService:
             # Create new analysis record
             analysis = TechnicalAnalysis(**analysis_data)
             db.session.add(analysis)
+            db.session.flush()
+            LatestAnalysis.upsert([analysis])
             db.session.commit()
             
             logger.info(f"Saved analysis for coin_id {analysis_data['coin_id']}")
@@ -365,6 +394,26 @@ class TechnicalAnalysisService:
             db.session.rollback()
             return None
     
+    def save_analyses(self, analyses_data: List[Dict]) -> List[TechnicalAnalysis]:
+        """Save a batch of technical analyses in a single transaction"""
+        if not analyses_data:
+            return []
+        
+        try:
+            analyses = [TechnicalAnalysis(**analysis_data) for analysis_data in analyses_data]
+            db.session.add_all(analyses)
+            db.session.flush()
+            LatestAnalysis.upsert(analyses)
+            db.session.commit()
+            
+            logger.info(f"Saved {len(analyses)} analyses")
+            return analyses
+            
+        except Exception as e:
+            logger.error(f"Error saving analyses: {str(e)}")
+            db.session.rollback()
+            return []
+    
     def get_signal_strength(self, analysis: TechnicalAnalysis) -> int:
         """Calculate signal strength (1-5 scale)"""
         strength = 0
@@ -415,9 +464,8 @@ class TechnicalAnalysisService:
     
     def get_latest_analysis(self, coin_id: int) -> Optional[TechnicalAnalysis]:
         """Get the latest technical analysis for a coin"""
-        return TechnicalAnalysis.query.filter_by(coin_id=coin_id)\
-                                    .order_by(TechnicalAnalysis.timestamp.desc())\
-                                    .first()
+        snapshot = LatestAnalysis.query.get(coin_id)
+        return snapshot.analysis if snapshot else None
     
     def get_buy_signals(self, limit: int = 10) -> List[TechnicalAnalysis]:
         """Get latest buy signals"""
@@ -1,23 +1,63 @@
+import os
 import time
+import asyncio
 import logging
 import threading
+from contextlib import nullcontext
 from datetime import datetime
+from typing import Dict, Optional, Tuple
 from services.crypto_exchange import CryptoExchangeAPI
+from services.async_exchange import AsyncCryptoExchangeAPI, get_event_loop_thread
+from services.market_data import PriceTable
+from services.trigger_book import get_trigger_book
+from services.metrics import LatencyHistogram
+from sqlalchemy.orm import joinedload
 from models import db, Position, Order, SystemLog, get_open_positions
 
 logger = logging.getLogger(__name__)
 
 class TpSlMonitor:
-    """Take Profit / Stop Loss Monitor - Checks TP/SL levels every 10 seconds"""
+    """Take Profit / Stop Loss Monitor
     
-    def __init__(self, check_interval: int = 10):
+    In event-driven mode every price observation published to the shared
+    PriceTable (bulk ticker poll, streaming feed) queues a TP/SL evaluation
+    for that instrument, handled by a dedicated tick worker. The
+    fixed-interval loop keeps running as a fallback.
+    """
+    
+    def __init__(self, check_interval: int = 10, resync_interval: int = 300, event_driven: bool = None):
         self.check_interval = check_interval  # seconds
+        self.resync_interval = resync_interval  # seconds between full trigger book rebuilds
         self.running = False
         self.exchange_api = CryptoExchangeAPI()
+        self.async_api = None  # AsyncCryptoExchangeAPI when running on an event loop
+        self.trigger_book = get_trigger_book()
+        self._last_resync = 0.0
+        
+        # Event-driven evaluation
+        if event_driven is None:
+            event_driven = os.getenv('TPSL_EVENT_DRIVEN', 'true').lower() == 'true'
+        self.event_driven = event_driven
+        self._pending_ticks: Dict[str, Tuple[float, float]] = {}  # instrument -> (price, observed_at)
+        self._ticks_ready = threading.Condition()
+        self._check_lock = threading.Lock()  # Tick worker and fallback loop never evaluate at once
+        self.ticks_received = 0
+        self.ticks_evaluated = 0
+        
+        # Backoff after a failed exit order, so a crossed position is not retried on every tick
+        self.exit_retry_delay = float(os.getenv('TPSL_EXIT_RETRY_DELAY', '15'))  # seconds, doubled per failure
+        self.exit_retry_max_delay = float(os.getenv('TPSL_EXIT_RETRY_MAX_DELAY', '600'))
+        self._exit_retries: Dict[int, Tuple[int, float]] = {}  # position id -> (failures, retry_at monotonic)
+        self.exit_failures = 0
         
-        logger.info(f"TP/SL Monitor initialized with {check_interval}s interval")
+        # Reaction time from price observation to evaluation / order acknowledgement
+        self.tick_to_check = LatencyHistogram('tick_to_check')
+        self.tick_to_order = LatencyHistogram('tick_to_order')
+        
+        logger.info(f"TP/SL Monitor initialized with {check_interval}s interval"
+                    f"{' (event-driven)' if event_driven else ''}")
     
-    def start(self):
+    def start(self, app=None):
         """Start the TP/SL monitor"""
         if self.running:
             logger.warning("TP/SL monitor is already running")
@@ -26,15 +66,90 @@ class TpSlMonitor:
         self.running = True
         logger.info("Starting TP/SL Monitor")
         
-        # Start monitoring in a separate thread
-        monitor_thread = threading.Thread(target=self.run, daemon=True)
+        # Start monitoring in a separate thread, inside the app context if given
+        monitor_thread = threading.Thread(target=self._run_in_app_context, args=(app, self.run), daemon=True)
         monitor_thread.start()
+        
+        if self.event_driven:
+            tick_thread = threading.Thread(target=self._run_in_app_context, args=(app, self.run_tick_worker),
+                                           daemon=True)
+            tick_thread.start()
+            self.exchange_api.price_table.subscribe(self.on_prices)
+    
+    def start_async(self, app=None, loop_thread=None):
+        """Start the TP/SL monitor with its polling loop as a coroutine on the shared event loop"""
+        if self.running:
+            logger.warning("TP/SL monitor is already running")
+            return
+        
+        self.running = True
+        self.async_api = AsyncCryptoExchangeAPI(price_table=self.exchange_api.price_table)
+        logger.info("Starting TP/SL Monitor on the event loop")
+        
+        if self.event_driven:
+            tick_thread = threading.Thread(target=self._run_in_app_context, args=(app, self.run_tick_worker),
+                                           daemon=True)
+            tick_thread.start()
+            self.exchange_api.price_table.subscribe(self.on_prices)
+        
+        return (loop_thread or get_event_loop_thread()).submit(self.run_async(app))
+    
+    def _run_in_app_context(self, app=None, target=None):
+        target = target or self.run
+        if app is None:
+            return target()
+        with app.app_context():
+            return target()
     
     def stop(self):
         """Stop the TP/SL monitor"""
         self.running = False
+        self.exchange_api.price_table.unsubscribe(self.on_prices)
+        with self._ticks_ready:
+            self._ticks_ready.notify_all()
         logger.info("TP/SL Monitor stopped")
     
+    def on_prices(self, prices: Dict[str, float], observed_at: float):
+        """PriceTable listener: queue evaluations for instruments with TP/SL levels"""
+        watched = self.trigger_book.instruments
+        ticks = {name: price for name, price in prices.items() if name in watched}
+        if not ticks:
+            return
+        
+        with self._ticks_ready:
+            for instrument_name, price in ticks.items():
+                # Coalesce: only the latest price per instrument matters
+                self._pending_ticks[instrument_name] = (price, observed_at)
+            self.ticks_received += len(ticks)
+            self._ticks_ready.notify()
+    
+    def run_tick_worker(self):
+        """Evaluate queued price ticks as soon as they arrive"""
+        logger.info("TP/SL tick worker started")
+        
+        while self.running:
+            with self._ticks_ready:
+                while self.running and not self._pending_ticks:
+                    self._ticks_ready.wait()
+                ticks = self._pending_ticks
+                self._pending_ticks = {}
+            
+            if not ticks or not self.running:
+                continue
+            
+            try:
+                crossed = {}  # position id -> (price, observed_at)
+                for instrument_name, (price, observed_at) in ticks.items():
+                    for position_id in self.trigger_book.check(instrument_name, price).position_ids():
+                        crossed[position_id] = (price, observed_at)
+                
+                self.ticks_evaluated += len(ticks)
+                if crossed:
+                    self.check_crossed(crossed)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error in TP/SL tick worker: {str(e)}")
+    
     def run(self):
         """Main TP/SL monitoring loop"""
         logger.info("TP/SL Monitor started")
@@ -43,25 +158,17 @@ class TpSlMonitor:
             try:
                 start_time = time.time()
                 
-                # Get open positions
-                open_positions = get_open_positions()
-                if not open_positions:
+                # Rebuild the trigger book from the database now and then
+                if start_time - self._last_resync >= self.resync_interval:
+                    self.resync_trigger_book()
+                
+                if not len(self.trigger_book):
                     time.sleep(self.check_interval)
                     continue
                 
-                logger.debug(f"Checking TP/SL for {len(open_positions)} positions...")
-                
-                # Check each position
-                for position in open_positions:
-                    if not self.running:
-                        break
-                        
-                    try:
-                        self.check_position_tp_sl(position)
-                        time.sleep(0.1)  # Small delay between checks
-                    except Exception as e:
-                        logger.error(f"Error checking TP/SL for position {position.id}: {str(e)}")
-                        continue
+                # Only visit positions whose levels the latest prices crossed
+                checked = self.check_triggers(self.exchange_api.get_ticker_snapshot(), persist=True)
+                logger.debug(f"Checked {checked} of {len(self.trigger_book)} positions with TP/SL levels")
                 
                 # Log completion
                 elapsed = time.time() - start_time
@@ -76,7 +183,49 @@ class TpSlMonitor:
                 logger.error(f"Error in TP/SL monitor loop: {str(e)}")
                 time.sleep(5)  # Wait before retrying
     
-    def check_position_tp_sl(self, position: Position):
+    async def run_async(self, app=None):
+        """Main TP/SL monitoring loop as a coroutine
+        
+        Ticker snapshots are downloaded on the event loop. Database work
+        (trigger book rebuilds, evaluation, which can also place orders through
+        the blocking client) runs in a worker thread with its own app context.
+        """
+        logger.info("TP/SL Monitor started on the event loop")
+        
+        with app.app_context() if app is not None else nullcontext():
+            while self.running:
+                try:
+                    start_time = time.time()
+                    
+                    # Rebuild the trigger book from the database now and then
+                    if start_time - self._last_resync >= self.resync_interval:
+                        await asyncio.to_thread(self._run_in_app_context, app, self.resync_trigger_book)
+                    
+                    if not len(self.trigger_book):
+                        await asyncio.sleep(self.check_interval)
+                        continue
+                    
+                    # Only visit positions whose levels the latest prices crossed
+                    price_table = await self.async_api.get_ticker_snapshot()
+                    checked = await asyncio.to_thread(self._run_in_app_context, app, lambda: self.check_triggers(price_table, persist=True))
+                    logger.debug(f"Checked {checked} of {len(self.trigger_book)} positions with TP/SL levels")
+                    
+                    # Log completion
+                    elapsed = time.time() - start_time
+                    logger.debug(f"TP/SL check completed in {elapsed:.2f}s")
+                    
+                    # Sleep until next interval
+                    sleep_time = max(0, self.check_interval - elapsed)
+                    if sleep_time > 0:
+                        await asyncio.sleep(sleep_time)
+                
+                except Exception as e:
+                    logger.error(f"Error in TP/SL monitor loop: {str(e)}")
+                    await asyncio.sleep(5)  # Wait before retrying
+        
+        await self.async_api.close()
+    
+    def check_position_tp_sl(self, position: Position, observed_at: float = None):
         """Check if position has hit TP or SL levels"""
         try:
             if not position.current_price:
@@ -92,13 +241,13 @@ class TpSlMonitor:
             # Check stop loss
             if position.stop_loss and current_price <= position.stop_loss:
                 logger.info(f"Stop Loss triggered for {position.coin_ref.symbol}: {current_price} <= {position.stop_loss}")
-                self.trigger_stop_loss(position)
+                self.trigger_stop_loss(position, observed_at)
                 return
             
             # Check take profit
             if position.take_profit and current_price >= position.take_profit:
                 logger.info(f"Take Profit triggered for {position.coin_ref.symbol}: {current_price} >= {position.take_profit}")
-                self.trigger_take_profit(position)
+                self.trigger_take_profit(position, observed_at)
                 return
             
             # Optional: Check for trailing stop
@@ -108,30 +257,108 @@ class TpSlMonitor:
         except Exception as e:
             logger.error(f"Error checking TP/SL for position {position.id}: {str(e)}")
     
-    def update_position_price(self, position: Position):
-        """Update position's current price"""
+    def resync_trigger_book(self):
+        """Rebuild the trigger book from the open positions in the database"""
         try:
-            coin = position.coin_ref
+            self.trigger_book.load(get_open_positions())
+            self._last_resync = time.time()
+        except Exception as e:
+            logger.error(f"Error rebuilding TP/SL trigger book: {str(e)}")
+    
+    def check_triggers(self, price_table: PriceTable, persist: bool = False) -> int:
+        """Check the positions whose TP/SL or trailing levels were crossed; returns how many"""
+        crossed = {}  # position id -> (price, observed_at)
+        for instrument_name in self.trigger_book.instrument_names():
+            price = price_table.get_price(instrument_name)
+            if not price:
+                continue
+            for position_id in self.trigger_book.check(instrument_name, price).position_ids():
+                crossed[position_id] = (price, None)
+        
+        if not crossed:
+            return 0
+        return self.check_crossed(crossed, persist)
+    
+    def check_crossed(self, crossed: Dict[int, Tuple[float, Optional[float]]], persist: bool = False) -> int:
+        """Price and evaluate positions found in the trigger book; returns how many were checked
+        
+        Prices are applied in memory. They reach the database with the exit
+        order of a triggered position, or for every checked position when
+        `persist` is set (the fixed-interval loop); a plain tick writes nothing.
+        """
+        with self._check_lock:
+            positions = Position.query.options(joinedload(Position.coin_ref))\
+                .filter(Position.id.in_(crossed.keys())).populate_existing().all()
             
-            # Get current price from exchange
-            ticker = self.exchange_api.get_ticker(coin.symbol)
-            if not ticker:
-                return
+            for position in positions:
+                if not self.running:
+                    break
+                
+                if position.status != 'open':
+                    self.trigger_book.remove(position.id)
+                    self._exit_retries.pop(position.id, None)
+                    continue
+                if not self._exit_retry_due(position.id):
+                    continue
+                
+                price, observed_at = crossed[position.id]
+                if observed_at is not None:
+                    self.tick_to_check.observe(time.monotonic() - observed_at)
+                
+                position.current_price = price
+                position.update_unrealized_pnl()
+                try:
+                    self.check_position_tp_sl(position, observed_at)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error checking TP/SL for position {position.id}: {str(e)}")
+                    continue
+                
+                if not persist and db.session.is_modified(position):
+                    # Nothing was placed: keep the tick price out of the next commit
+                    db.session.expire(position)
             
-            current_price = float(ticker.get('a', 0))  # Ask price
-            if current_price <= 0:
-                return
+            if persist:
+                try:
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error pricing {len(positions)} positions: {str(e)}")
+            
+            return len(positions)
+    
+    def _exit_retry_due(self, position_id: int) -> bool:
+        """False while a position is backing off after a failed exit order"""
+        retry = self._exit_retries.get(position_id)
+        return retry is None or time.monotonic() >= retry[1]
+    
+    def _exit_failed(self, position_id: int):
+        """Hold off a position's next exit attempt, doubling the delay per consecutive failure"""
+        failures = self._exit_retries.get(position_id, (0, 0.0))[0] + 1
+        delay = min(self.exit_retry_delay * 2 ** (failures - 1), self.exit_retry_max_delay)
+        self._exit_retries[position_id] = (failures, time.monotonic() + delay)
+        self.exit_failures += 1
+        logger.warning(f"Exit order for position {position_id} failed {failures} time(s), retrying in {delay:.0f}s")
+    
+    def update_position_price(self, position: Position, price_table: PriceTable = None) -> bool:
+        """Update position's current price from the ticker snapshot (not committed)"""
+        try:
+            price_table = price_table or self.exchange_api.get_ticker_snapshot()
+            
+            current_price = price_table.get_price(position.coin_ref.symbol)  # Ask price
+            if not current_price:
+                return False
             
             # Update position
             position.current_price = current_price
             position.update_unrealized_pnl()
-            
-            db.session.commit()
+            return True
             
         except Exception as e:
             logger.error(f"Error updating price for position {position.id}: {str(e)}")
+            return False
     
-    def trigger_stop_loss(self, position: Position):
+    def trigger_stop_loss(self, position: Position, observed_at: float = None):
         """Trigger stop loss by placing a market sell order"""
         try:
             coin = position.coin_ref
@@ -144,9 +371,14 @@ class TpSlMonitor:
                 quantity=position.quantity
             )
             
+            if observed_at is not None:
+                self.tick_to_order.observe(time.monotonic() - observed_at)
+            
             if not order_result:
                 logger.error(f"Failed to place stop loss order for position {position.id}")
+                self._exit_failed(position.id)
                 return
+            self._exit_retries.pop(position.id, None)
             
             # Create order record
             sell_order = Order(
@@ -168,6 +400,7 @@ class TpSlMonitor:
             position.status = 'closing'  # Will be set to 'closed' when order fills
             
             db.session.commit()
+            self.trigger_book.remove(position.id)
             
             SystemLog.log(
                 level='WARNING',
@@ -189,7 +422,7 @@ class TpSlMonitor:
         except Exception as e:
             logger.error(f"Error triggering stop loss for position {position.id}: {str(e)}")
     
-    def trigger_take_profit(self, position: Position):
+    def trigger_take_profit(self, position: Position, observed_at: float = None):
         """Trigger take profit by placing a market sell order"""
         try:
             coin = position.coin_ref
@@ -202,9 +435,14 @@ class TpSlMonitor:
                 quantity=position.quantity
             )
             
+            if observed_at is not None:
+                self.tick_to_order.observe(time.monotonic() - observed_at)
+            
             if not order_result:
                 logger.error(f"Failed to place take profit order for position {position.id}")
+                self._exit_failed(position.id)
                 return
+            self._exit_retries.pop(position.id, None)
             
             # Create order record
             sell_order = Order(
@@ -226,6 +464,7 @@ class TpSlMonitor:
             position.status = 'closing'  # Will be set to 'closed' when order fills
             
             db.session.commit()
+            self.trigger_book.remove(position.id)
             
             SystemLog.log(
                 level='INFO',
@@ -270,6 +509,7 @@ class TpSlMonitor:
                     position.stop_loss = new_stop_loss
                     
                     db.session.commit()
+                    self.trigger_book.upsert_position(position)
                     
                     SystemLog.log(
                         level='INFO',
@@ -294,5 +534,15 @@ class TpSlMonitor:
             'running': self.running,
             'check_interval': self.check_interval,
             'open_positions_count': open_positions_count,
+            'trigger_book': self.trigger_book.stats(),
+            'event_driven': self.event_driven,
+            'ticks_received': self.ticks_received,
+            'ticks_evaluated': self.ticks_evaluated,
+            'exit_failures': self.exit_failures,
+            'exits_backing_off': len(self._exit_retries),
+            'latency': {
+                'tick_to_check': self.tick_to_check.stats(),
+                'tick_to_order': self.tick_to_order.stats()
+            },
             'last_check': datetime.utcnow().isoformat() if self.running else None
         } 
\ No newline at end of file
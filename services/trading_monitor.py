@@ -1,25 +1,53 @@
+import os
 import time
+import asyncio
 import logging
+import functools
 import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import pandas as pd
+from flask import current_app, has_app_context
 from services.technical_analysis import TechnicalAnalysisService
 from services.crypto_exchange import CryptoExchangeAPI
-from models import db, Coin, TechnicalAnalysis, Order, Position, SystemLog, get_active_coins
+from services.async_exchange import AsyncCryptoExchangeAPI, get_event_loop_thread
+from services.candle_store import CandleStore
+from services.market_data import PriceTable
+from services.trigger_book import get_trigger_book
+from services.order_reconciler import OrderReconciler
+from models import db, Coin, TechnicalAnalysis, Order, Position, SystemLog, get_active_coins, get_open_positions
 
 logger = logging.getLogger(__name__)
 
 class TradingMonitor:
     """Trading Monitor Service - Continuously analyzes coins and generates trading signals"""
     
-    def __init__(self, analysis_interval: int = 30):
+    def __init__(self, analysis_interval: int = 30, fetch_workers: int = None):
         self.analysis_interval = analysis_interval  # seconds
         self.running = False
-        self.analysis_service = TechnicalAnalysisService()
+        
+        # Bounded I/O pool for candle fetching; the exchange rate limit still applies
+        self.fetch_workers = fetch_workers or int(os.getenv('ANALYSIS_FETCH_WORKERS', 8))
+        self.last_cycle_stats = None
         self.exchange_api = CryptoExchangeAPI()
+        self.async_api = None  # AsyncCryptoExchangeAPI when running on an event loop
+        self._db_executor = None  # Single thread for the database stages of run_async()
+        self.order_reconciler = OrderReconciler(
+            self.exchange_api,
+            open_position=lambda order: self.create_position_from_order(order, commit=False),
+            position_opened=self._position_opened
+        )
+        self.analysis_service = TechnicalAnalysisService(
+            exchange_api=self.exchange_api,
+            incremental=True,
+            candle_store=CandleStore(self.exchange_api)
+        )
         
         logger.info(f"Trading Monitor initialized with {analysis_interval}s interval")
     
-    def start(self):
+    def start(self, app=None):
         """Start the trading monitor"""
         if self.running:
             logger.warning("Trading monitor is already running")
@@ -28,10 +56,29 @@ class TradingMonitor:
         self.running = True
         logger.info("Starting Trading Monitor")
         
-        # Start monitoring in a separate thread
-        monitor_thread = threading.Thread(target=self.run, daemon=True)
+        # Start monitoring in a separate thread, inside the app context if given
+        monitor_thread = threading.Thread(target=self._run_in_app_context, args=(app,), daemon=True)
         monitor_thread.start()
     
+    def start_async(self, app=None, loop_thread=None):
+        """Start the trading monitor as a coroutine on the shared event loop"""
+        if self.running:
+            logger.warning("Trading monitor is already running")
+            return
+        
+        self.running = True
+        self.async_api = AsyncCryptoExchangeAPI(price_table=self.exchange_api.price_table)
+        if app is None and has_app_context():
+            app = current_app._get_current_object()
+        logger.info("Starting Trading Monitor on the event loop")
+        return (loop_thread or get_event_loop_thread()).submit(self.run_async(app))
+    
+    def _run_in_app_context(self, app=None):
+        if app is None:
+            return self.run()
+        with app.app_context():
+            return self.run()
+    
     def stop(self):
         """Stop the trading monitor"""
         self.running = False
@@ -54,27 +101,20 @@ class TradingMonitor:
                 
                 logger.info(f"Analyzing {len(active_coins)} coins...")
                 
-                # Analyze each coin
-                for coin in active_coins:
-                    if not self.running:
-                        break
-                        
-                    try:
-                        self.analyze_coin(coin)
-                        time.sleep(1)  # Small delay between analyses
-                    except Exception as e:
-                        logger.error(f"Error analyzing {coin.symbol}: {str(e)}")
-                        continue
+                # Fetch, analyze and save all coins
+                stats = self.run_analysis_cycle(active_coins)
                 
                 # Check for completed orders and update positions
+                stage_start = time.time()
                 self.check_order_updates()
+                stats['timings']['orders'] = time.time() - stage_start
                 
                 # Update open position prices
+                stage_start = time.time()
                 self.update_position_prices()
+                stats['timings']['positions'] = time.time() - stage_start
                 
-                # Log completion
-                elapsed = time.time() - start_time
-                logger.info(f"Analysis cycle completed in {elapsed:.2f}s")
+                elapsed = self._finish_cycle(stats, start_time)
                 
                 # Sleep until next interval
                 sleep_time = max(0, self.analysis_interval - elapsed)
@@ -85,6 +125,193 @@ class TradingMonitor:
                 logger.error(f"Error in trading monitor loop: {str(e)}")
                 time.sleep(10)  # Wait before retrying
     
+    async def run_async(self, app=None):
+        """Main monitoring loop as a coroutine
+        
+        Same stages as run(), but exchange I/O goes through the async client:
+        candles and order statuses are fetched concurrently on the event loop
+        and waiting between cycles does not hold a thread. Database stages run
+        on a dedicated thread with its own app context (see _run_db), so the
+        loop never blocks on a query or a commit.
+        """
+        logger.info("Trading Monitor started on the event loop")
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='trading-monitor-db',
+                                               initializer=self._push_app_context, initargs=(app,))
+        
+        with app.app_context() if app is not None else nullcontext():
+            while self.running:
+                try:
+                    start_time = time.time()
+                    
+                    # Get active coins
+                    active_coins = await self._run_db(get_active_coins)
+                    if not active_coins:
+                        logger.info("No active coins to analyze")
+                        await asyncio.sleep(self.analysis_interval)
+                        continue
+                    
+                    logger.info(f"Analyzing {len(active_coins)} coins...")
+                    
+                    # Fetch, analyze and save all coins
+                    stats = await self.run_analysis_cycle_async(active_coins)
+                    
+                    # Check for completed orders and update positions
+                    stage_start = time.time()
+                    await self.check_order_updates_async()
+                    stats['timings']['orders'] = time.time() - stage_start
+                    
+                    # Update open position prices
+                    stage_start = time.time()
+                    await self._run_db(self.update_position_prices, await self.async_api.get_ticker_snapshot())
+                    stats['timings']['positions'] = time.time() - stage_start
+                    
+                    elapsed = self._finish_cycle(stats, start_time)
+                    
+                    # Sleep until next interval
+                    sleep_time = max(0, self.analysis_interval - elapsed)
+                    if sleep_time > 0:
+                        await asyncio.sleep(sleep_time)
+                
+                except Exception as e:
+                    await self._run_db(db.session.rollback)
+                    logger.error(f"Error in trading monitor loop: {str(e)}")
+                    await asyncio.sleep(10)  # Wait before retrying
+        
+        await self._run_db(db.session.remove)
+        self._db_executor.shutdown(wait=False)
+        await self.async_api.close()
+    
+    @staticmethod
+    def _push_app_context(app=None):
+        if app is not None:
+            app.app_context().push()
+    
+    async def _run_db(self, function, *args):
+        """Run a blocking database stage of run_async() on the monitor's database thread
+        
+        One thread and one app context for the whole loop, so ORM objects
+        loaded by one stage stay attached to the session the next stage uses.
+        """
+        if self._db_executor is None:
+            return function(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._db_executor, functools.partial(function, *args))
+    
+    def _finish_cycle(self, stats: Dict, start_time: float) -> float:
+        """Record and log a completed cycle; returns its duration"""
+        elapsed = time.time() - start_time
+        stats['timings']['total'] = elapsed
+        self.last_cycle_stats = stats
+        
+        stage_summary = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in stats['timings'].items())
+        logger.info(f"Analysis cycle completed in {elapsed:.2f}s "
+                    f"({stats['analyzed']}/{stats['coins']} coins; {stage_summary})")
+        return elapsed
+    
+    def fetch_all_candles(self, instruments: Dict[int, str]) -> Dict[int, Optional[pd.DataFrame]]:
+        """Fetch candles for many instruments concurrently, keyed by coin id"""
+        candles = {}
+        if not instruments:
+            return candles
+        
+        app = current_app._get_current_object() if has_app_context() else None
+        
+        def fetch(instrument_name):
+            if app is None:
+                return self.analysis_service.fetch_candles(instrument_name)
+            with app.app_context():
+                return self.analysis_service.fetch_candles(instrument_name)
+        
+        max_workers = max(1, min(self.fetch_workers, len(instruments)))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='candle-fetch') as executor:
+            futures = {executor.submit(fetch, instrument_name): coin_id
+                       for coin_id, instrument_name in instruments.items()}
+            
+            for future in as_completed(futures):
+                coin_id = futures[future]
+                try:
+                    candles[coin_id] = future.result()
+                except Exception as e:
+                    logger.error(f"Error fetching candles for {instruments[coin_id]}: {str(e)}")
+                    candles[coin_id] = None
+        
+        return candles
+    
+    async def fetch_all_candles_async(self, instruments: Dict[int, str]) -> Dict[int, Optional[pd.DataFrame]]:
+        """Fetch candles for many instruments concurrently on the event loop, keyed by coin id"""
+        coin_ids = list(instruments)
+        results = await asyncio.gather(
+            *(self.analysis_service.fetch_candles_async(instruments[coin_id], self.async_api)
+              for coin_id in coin_ids),
+            return_exceptions=True
+        )
+        
+        candles = {}
+        for coin_id, result in zip(coin_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error fetching candles for {instruments[coin_id]}: {str(result)}")
+                result = None
+            candles[coin_id] = result
+        return candles
+    
+    def run_analysis_cycle(self, coins: List[Coin]) -> Dict:
+        """Analyze coins in stages: concurrent candle fetch, indicator calculation, one batched save"""
+        timings = {}
+        
+        # Stage 1: fetch candles over the I/O worker pool
+        stage_start = time.time()
+        instruments = {coin.id: self.analysis_service.get_instrument_name(coin) for coin in coins}
+        self.analysis_service.prune_indicator_states(instruments.values())
+        candles = self.fetch_all_candles(instruments)
+        timings['fetch'] = time.time() - stage_start
+        
+        return self._analyze_fetched(coins, candles, timings)
+    
+    async def run_analysis_cycle_async(self, coins: List[Coin]) -> Dict:
+        """run_analysis_cycle() with the candle fetch stage on the event loop, the rest on the database thread"""
+        timings = {}
+        
+        stage_start = time.time()
+        instruments = {coin.id: self.analysis_service.get_instrument_name(coin) for coin in coins}
+        self.analysis_service.prune_indicator_states(instruments.values())
+        candles = await self.fetch_all_candles_async(instruments)
+        timings['fetch'] = time.time() - stage_start
+        
+        return await self._run_db(self._analyze_fetched, coins, candles, timings)
+    
+    def _analyze_fetched(self, coins: List[Coin], candles: Dict[int, Optional[pd.DataFrame]],
+                         timings: Dict) -> Dict:
+        """Indicator, save and signal stages of an analysis cycle"""
+        # Stage 2: indicators and signals (CPU only)
+        stage_start = time.time()
+        analyses_data = []
+        for coin in coins:
+            if not self.running:
+                break
+            
+            analysis_data = self.analysis_service.analyze_candles(coin, candles.get(coin.id))
+            if analysis_data:
+                analyses_data.append(analysis_data)
+        timings['analyze'] = time.time() - stage_start
+        
+        # Stage 3: single DB transaction for all analyses
+        stage_start = time.time()
+        analyses = self.analysis_service.save_analyses(analyses_data)
+        timings['save'] = time.time() - stage_start
+        
+        # Buy signals for the saved analyses
+        stage_start = time.time()
+        coins_by_id = {coin.id: coin for coin in coins}
+        for analysis in analyses:
+            if analysis.action == 'BUY':
+                self.handle_buy_signal(coins_by_id[analysis.coin_id], analysis)
+        timings['signals'] = time.time() - stage_start
+        
+        return {
+            'coins': len(coins),
+            'analyzed': len(analyses),
+            'timings': timings
+        }
+    
     def analyze_coin(self, coin: Coin):
         """Analyze a single coin and update database"""
         try:
@@ -151,37 +378,44 @@ class TradingMonitor:
             logger.error(f"Error handling buy signal for {coin.symbol}: {str(e)}")
     
     def check_order_updates(self):
-        """Check for order updates from the exchange"""
+        """Reconcile pending orders with the exchange in one bulk sync"""
         try:
-            # Get pending orders
-            pending_orders = Order.query.filter(
-                Order.status.in_(['PENDING', 'PARTIALLY_FILLED'])
-            ).all()
-            
-            if not pending_orders:
-                return
-            
-            logger.debug(f"Checking {len(pending_orders)} pending orders")
-            
-            for order in pending_orders:
-                try:
-                    self.update_order_status(order)
-                    time.sleep(0.1)  # Rate limiting
-                except Exception as e:
-                    logger.error(f"Error updating order {order.id}: {str(e)}")
-                    continue
-                    
+            stats = self.order_reconciler.reconcile()
+            if stats['pending']:
+                logger.debug(f"Reconciled {stats['pending']} pending orders with {stats['requests']} requests: "
+                             f"{stats['changes']}")
         except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error checking order updates: {str(e)}")
+    
+    async def check_order_updates_async(self):
+        """check_order_updates() with the exchange downloads on the event loop"""
+        try:
+            stats = await self.order_reconciler.reconcile_async(self.async_api, self._run_db)
+            if stats['pending']:
+                logger.debug(f"Reconciled {stats['pending']} pending orders with {stats['requests']} requests: "
+                             f"{stats['changes']}")
+        except Exception as e:
+            await self._run_db(db.session.rollback)
             logger.error(f"Error checking order updates: {str(e)}")
     
     def update_order_status(self, order: Order):
         """Update order status from exchange"""
+        if not order.exchange_order_id:
+            return
+        
         try:
-            if not order.exchange_order_id:
-                return
-            
             # Get order status from exchange
             order_status = self.exchange_api.get_order_status(order.exchange_order_id)
+        except Exception as e:
+            logger.error(f"Error updating order status for {order.id}: {str(e)}")
+            return
+        
+        self.apply_order_status(order, order_status)
+    
+    def apply_order_status(self, order: Order, order_status: Optional[dict]):
+        """Update an order from its exchange status"""
+        try:
             if not order_status:
                 return
             
@@ -234,8 +468,12 @@ class TradingMonitor:
         except Exception as e:
             logger.error(f"Error updating order status for {order.id}: {str(e)}")
     
-    def create_position_from_order(self, order: Order):
-        """Create position from filled buy order"""
+    def create_position_from_order(self, order: Order, commit: bool = True):
+        """Create position from filled buy order
+        
+        With commit=False the position is only flushed; the caller commits and
+        then calls _position_opened().
+        """
         try:
             # Check if position already exists
             existing_position = Position.query.filter_by(
@@ -247,9 +485,7 @@ class TradingMonitor:
                 return existing_position
             
             # Get latest analysis for TP/SL levels
-            latest_analysis = TechnicalAnalysis.query.filter_by(coin_id=order.coin_id)\
-                                                   .order_by(TechnicalAnalysis.timestamp.desc())\
-                                                   .first()
+            latest_analysis = self.analysis_service.get_latest_analysis(order.coin_id)
             
             # Create new position
             position = Position(
@@ -267,69 +503,77 @@ class TradingMonitor:
                 position.stop_loss = latest_analysis.stop_loss
             
             db.session.add(position)
-            db.session.commit()
+            if not commit:
+                db.session.flush()
+                return position
             
-            SystemLog.log(
-                level='INFO',
-                category='TRADING',
-                message=f"Position created: {position.quantity} {order.coin_ref.symbol} at {position.entry_price}",
-                position_id=position.id,
-                coin_id=order.coin_id
-            )
+            db.session.commit()
+            self._position_opened(position)
             
             return position
             
         except Exception as e:
             logger.error(f"Error creating position from order {order.id}: {str(e)}")
+            if not commit:
+                raise
             return None
     
-    def update_position_prices(self):
-        """Update current prices for open positions"""
+    def _position_opened(self, position: Position):
+        """Index a newly committed position's TP/SL levels and log it"""
+        # Start watching its TP/SL levels
+        get_trigger_book().upsert_position(position)
+            
+        SystemLog.log(
+            level='INFO',
+            category='TRADING',
+            message=f"Position created: {position.quantity} {position.coin_ref.symbol} at {position.entry_price}",
+            position_id=position.id,
+            coin_id=position.coin_id
+        )
+    
+    def update_position_prices(self, price_table: PriceTable = None):
+        """Update current prices for open positions from one bulk ticker snapshot"""
         try:
-            open_positions = Position.query.filter_by(status='open').all()
+            open_positions = get_open_positions()
             if not open_positions:
                 return
             
             logger.debug(f"Updating prices for {len(open_positions)} positions")
             
+            price_table = price_table or self.exchange_api.get_ticker_snapshot()
             for position in open_positions:
                 try:
-                    self.update_position_price(position)
-                    time.sleep(0.1)  # Rate limiting
+                    self.update_position_price(position, price_table)
                 except Exception as e:
                     logger.error(f"Error updating position {position.id}: {str(e)}")
                     continue
+            
+            db.session.commit()
                     
         except Exception as e:
+            db.session.rollback()
             logger.error(f"Error updating position prices: {str(e)}")
     
-    def update_position_price(self, position: Position):
-        """Update current price for a position"""
-        try:
-            coin = position.coin_ref
-            
-            # Get current price from exchange
-            ticker = self.exchange_api.get_ticker(coin.symbol)
-            if not ticker:
-                return
-            
-            current_price = float(ticker.get('a', 0))  # Ask price
-            if current_price <= 0:
-                return
-            
-            # Update position
-            position.current_price = current_price
-            position.update_unrealized_pnl()
-            
-            db.session.commit()
-            
-        except Exception as e:
-            logger.error(f"Error updating price for position {position.id}: {str(e)}")
+    def update_position_price(self, position: Position, price_table: PriceTable = None) -> bool:
+        """Update current price for a position from the ticker snapshot (not committed)"""
+        price_table = price_table or self.exchange_api.get_ticker_snapshot()
+        
+        current_price = price_table.get_price(position.coin_ref.symbol)  # Ask price
+        if not current_price:
+            return False
+        
+        # Update position
+        position.current_price = current_price
+        position.update_unrealized_pnl()
+        return True
     
     def get_status(self):
         """Get monitor status"""
         return {
             'running': self.running,
             'analysis_interval': self.analysis_interval,
+            'fetch_workers': self.fetch_workers,
+            'last_cycle': self.last_cycle_stats,
+            'order_sync': self.order_reconciler.last_sync_stats,
             'last_run': datetime.utcnow().isoformat() if self.running else None
         } 
\ No newline at end of file
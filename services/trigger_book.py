@@ -0,0 +1,208 @@
+import time
+import threading
+import logging
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+NEG_INF = float('-inf')
+POS_INF = float('inf')
+
+
+class TriggerHits:
+    """Positions whose levels were crossed by a price"""
+    
+    def __init__(self, stop_loss: List[int] = None, take_profit: List[int] = None,
+                 trailing: List[int] = None):
+        self.stop_loss = stop_loss or []
+        self.take_profit = take_profit or []
+        self.trailing = trailing or []
+    
+    def __bool__(self):
+        return bool(self.stop_loss or self.take_profit or self.trailing)
+    
+    def position_ids(self) -> List[int]:
+        return sorted(set(self.stop_loss) | set(self.take_profit) | set(self.trailing))
+
+
+class InstrumentTriggers:
+    """Sorted TP/SL levels for the open positions of one instrument
+    
+    Levels are kept as sorted (level, position_id) lists, so the positions
+    crossed by a price are found with one bisect per list:
+    
+    - stop loss fires when price <= level   -> tail of stop_levels
+    - take profit fires when price >= level -> head of profit_levels
+    - a trailing stop moves when price > level -> head of trail_levels, where
+      level is the price above which the trailing stop would be raised
+    """
+    
+    def __init__(self):
+        self.stop_levels: List[Tuple[float, int]] = []
+        self.profit_levels: List[Tuple[float, int]] = []
+        self.trail_levels: List[Tuple[float, int]] = []
+        self.entries: Dict[int, Tuple[Optional[float], Optional[float], Optional[float]]] = {}
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    @staticmethod
+    def _remove_level(levels: List[Tuple[float, int]], level: Optional[float], position_id: int):
+        if level is None:
+            return
+        index = bisect_left(levels, (level, position_id))
+        if index < len(levels) and levels[index] == (level, position_id):
+            del levels[index]
+    
+    def set(self, position_id: int, stop_loss: Optional[float], take_profit: Optional[float],
+            trail_level: Optional[float]):
+        """Insert or move a position's levels"""
+        self.remove(position_id)
+        
+        if stop_loss:
+            insort(self.stop_levels, (stop_loss, position_id))
+        if take_profit:
+            insort(self.profit_levels, (take_profit, position_id))
+        if trail_level:
+            insort(self.trail_levels, (trail_level, position_id))
+        self.entries[position_id] = (stop_loss or None, take_profit or None, trail_level or None)
+    
+    def remove(self, position_id: int):
+        entry = self.entries.pop(position_id, None)
+        if entry is None:
+            return
+        stop_loss, take_profit, trail_level = entry
+        self._remove_level(self.stop_levels, stop_loss, position_id)
+        self._remove_level(self.profit_levels, take_profit, position_id)
+        self._remove_level(self.trail_levels, trail_level, position_id)
+    
+    def crossed(self, price: float) -> TriggerHits:
+        """Positions whose levels are crossed at this price, O(log n + k)"""
+        stop_index = bisect_left(self.stop_levels, (price, NEG_INF))
+        profit_index = bisect_right(self.profit_levels, (price, POS_INF))
+        trail_index = bisect_left(self.trail_levels, (price, NEG_INF))
+        return TriggerHits(
+            stop_loss=[position_id for _, position_id in self.stop_levels[stop_index:]],
+            take_profit=[position_id for _, position_id in self.profit_levels[:profit_index]],
+            trailing=[position_id for _, position_id in self.trail_levels[:trail_index]]
+        )
+
+
+def trailing_level(entry_price: float, stop_loss: Optional[float], trailing_stop: Optional[float]) -> Optional[float]:
+    """Price above which TpSlMonitor.check_trailing_stop would raise the stop loss
+    
+    The stop is only raised while in profit (price > entry) and when
+    price * (1 - trailing_stop%) is above the current stop.
+    """
+    if not trailing_stop or not entry_price or trailing_stop >= 100:
+        return None
+    if not stop_loss:
+        return entry_price
+    return max(entry_price, stop_loss / (1 - trailing_stop / 100))
+
+
+class TriggerBook:
+    """In-memory TP/SL trigger book for every open position, by instrument
+    
+    Kept up to date incrementally: positions are upserted when they are
+    opened or their levels change, and removed once they stop being open.
+    TpSlMonitor rebuilds it from the database on start and periodically as
+    a safety net.
+    """
+    
+    def __init__(self):
+        self.instruments: Dict[str, InstrumentTriggers] = {}
+        self.positions: Dict[int, str] = {}  # position id -> instrument name
+        self.lock = threading.Lock()
+        self.loaded_at = None
+    
+    def __len__(self):
+        return len(self.positions)
+    
+    def _remove(self, position_id: int):
+        instrument_name = self.positions.pop(position_id, None)
+        if instrument_name is None:
+            return
+        triggers = self.instruments.get(instrument_name)
+        if triggers is not None:
+            triggers.remove(position_id)
+            if not len(triggers):
+                del self.instruments[instrument_name]
+    
+    def upsert(self, position_id: int, instrument_name: str, stop_loss: Optional[float],
+               take_profit: Optional[float], entry_price: float = None, trailing_stop: float = None):
+        """Add a position or move its levels"""
+        with self.lock:
+            self._remove(position_id)
+            trail_level = trailing_level(entry_price, stop_loss, trailing_stop)
+            if not (stop_loss or take_profit or trail_level):
+                return
+            
+            triggers = self.instruments.setdefault(instrument_name, InstrumentTriggers())
+            triggers.set(position_id, stop_loss, take_profit, trail_level)
+            self.positions[position_id] = instrument_name
+    
+    def upsert_position(self, position):
+        """Sync one Position row: open positions are (re)indexed, others removed"""
+        if position.status != 'open':
+            self.remove(position.id)
+            return
+        self.upsert(
+            position.id,
+            position.coin_ref.symbol,
+            position.stop_loss,
+            position.take_profit,
+            entry_price=position.entry_price,
+            trailing_stop=position.trailing_stop
+        )
+    
+    def remove(self, position_id: int):
+        with self.lock:
+            self._remove(position_id)
+    
+    def load(self, positions):
+        """Rebuild the book from a list of open Position rows"""
+        fresh = TriggerBook()
+        for position in positions:
+            fresh.upsert_position(position)
+        
+        # Swap in one step so checks never see a half-built book
+        with self.lock:
+            self.instruments = fresh.instruments
+            self.positions = fresh.positions
+        self.loaded_at = time.time()
+        logger.debug(f"Trigger book loaded with {len(self.positions)} positions")
+    
+    def instrument_names(self) -> List[str]:
+        with self.lock:
+            return list(self.instruments)
+    
+    def check(self, instrument_name: str, price: float) -> TriggerHits:
+        """Positions of an instrument whose levels are crossed at this price"""
+        with self.lock:
+            triggers = self.instruments.get(instrument_name)
+            if triggers is None:
+                return TriggerHits()
+            return triggers.crossed(price)
+    
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                'positions': len(self.positions),
+                'instruments': len(self.instruments),
+                'loaded_at': self.loaded_at
+            }
+
+
+_shared_book = None
+_shared_book_lock = threading.Lock()
+
+
+def get_trigger_book() -> TriggerBook:
+    """Process-wide trigger book shared by the monitors and routes"""
+    global _shared_book
+    with _shared_book_lock:
+        if _shared_book is None:
+            _shared_book = TriggerBook()
+        return _shared_book
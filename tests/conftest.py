@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway database before it is imported
+_db_dir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.setdefault('CANDLE_STORE_DIR', os.path.join(_db_dir, 'candles'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app, register_blueprints
+    from models import db
+    
+    flask_app.config['TESTING'] = True
+    flask_app.config['LOGIN_DISABLED'] = True
+    register_blueprints()
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
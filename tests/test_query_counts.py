@@ -0,0 +1,48 @@
+import pytest
+
+from models import db, Coin, Order, Position
+from services.query_counter import count_queries
+from services.response_cache import response_cache
+from services.technical_analysis import TechnicalAnalysisService
+
+ENDPOINTS = ('/dashboard/api/signals', '/dashboard/api/positions', '/dashboard/api/orders')
+
+
+def seed(count):
+    """Add `count` coins, each with a latest analysis, an open position and a pending order"""
+    first = Coin.query.count()
+    coins = [Coin(symbol=f'T{first + i}_USDT', original_symbol=f'T{first + i}') for i in range(count)]
+    db.session.add_all(coins)
+    db.session.commit()
+    
+    service = TechnicalAnalysisService()
+    for coin in coins:
+        service.save_analysis(dict(coin_id=coin.id, last_price=1.0, rsi=30.0, volume_ratio=1.0))
+        db.session.add(Position(coin_id=coin.id, quantity=1, entry_price=1.0, status='open'))
+        db.session.add(Order(coin_id=coin.id, order_type='LIMIT', side='BUY', quantity=1, price=1.0,
+                             status='PENDING'))
+    db.session.commit()
+    db.session.remove()
+
+
+def measure(client, url):
+    """(rows returned, X-Query-Count header, statements counted on this thread) for one uncached request"""
+    response_cache.clear()
+    with count_queries() as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(response.get_json()['data']), int(response.headers['X-Query-Count']), queries.count
+
+
+@pytest.mark.parametrize('url', ENDPOINTS)
+def test_query_count_does_not_grow_with_rows(app, client, url):
+    n = 5
+    seed(n)
+    rows_small, header_small, counted_small = measure(client, url)
+    
+    seed(9 * n)  # 10·N rows in total
+    rows_large, header_large, counted_large = measure(client, url)
+    
+    assert rows_large >= rows_small + 9 * n
+    assert header_large == header_small
+    assert counted_large == counted_small